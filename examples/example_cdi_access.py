@@ -29,7 +29,7 @@ from openlcb.datagramservice import (
     DatagramService,
 )
 from openlcb.memoryservice import (
-    MemoryReadMemo,
+    MemoryBulkReadMemo,
     MemoryService,
 )
 
@@ -95,52 +95,27 @@ datagramService.registerDatagramReceivedListener(printDatagram)
 memoryService = MemoryService(datagramService)
 
 
-# accumulate the CDI information
-resultingCDI = bytearray()
-
 # callbacks to get results of memory read
 
 
 def memoryReadSuccess(memo):
     """Handle a successful read
-    Invoked when the memory read successfully returns,
-    this queues a new read until the entire CDI has been
-    returned.  At that point, it invokes the XML processing below.
+    Invoked when the whole CDI, up to its terminating zero byte, has been
+    read. At that point, it invokes the XML processing below.
 
     Args:
-        memo (MemoryReadMemo): Successful MemoryReadMemo
+        memo (MemoryBulkReadMemo): Successful MemoryBulkReadMemo
     """
     # print("successful memory read: {}".format(memo.data))
 
-    global resultingCDI
-
-    # is this done?
-    if len(memo.data) == 64 and 0 not in memo.data:
-        # save content
-        resultingCDI += memo.data
-        # update the address
-        memo.address = memo.address+64
-        # and read again
-        memoryService.requestMemoryRead(memo)
-        # The last packet is not yet reached, so don't parse (However,
-        #   parser.feed could be called for realtime processing).
-    else :
-        # and we're done!
-        # save content
-        resultingCDI += memo.data
-        # concert resultingCDI to a string up to 1st zero
-        cdiString = ""
-        null_i = resultingCDI.find(b'\0')
-        terminate_i = len(resultingCDI)
-        if null_i > -1:
-            terminate_i = min(null_i, terminate_i)
-        cdiString = resultingCDI[:terminate_i].decode("utf-8")
-        # print (cdiString)
-
-        # and process that
-        processXML(cdiString)
-
-        # done
+    # convert the CDI to a string (data stops before the zero byte)
+    cdiString = memo.data.decode("utf-8")
+    # print (cdiString)
+
+    # and process that
+    processXML(cdiString)
+
+    # done
 
 
 def memoryReadFail(memo):
@@ -215,8 +190,7 @@ def processXML(content) :
         content (str): Raw XML data
     """
     # NOTE: The data is complete in this example since processXML is
-    #   only called when there is a null terminator, which indicates the
-    #   last packet was reached for the requested read.
+    #   only called when the bulk read has reached the null terminator.
     #   - See memoryReadSuccess comments for details.
     xml.sax.parseString(content, handler)
     print("\nParser done")
@@ -230,18 +204,19 @@ canPhysicalLayerGridConnect.physicalLayerUp()
 
 
 def memoryRead():
-    """Create and send a read datagram.
-    This is a read of 20 bytes from the start of CDI space.
+    """Start reading the CDI.
+    This reads the CDI space from address zero up to its terminating zero
+    byte, 64 bytes per datagram.
     We will fire it on a separate thread to give time for other nodes to reply
     to AME
     """
     import time
     time.sleep(1)
 
-    # read 64 bytes from the CDI space starting at address zero
-    memMemo = MemoryReadMemo(NodeID(settings['farNodeID']), 64, 0xFF, 0,
-                             memoryReadFail, memoryReadSuccess)
-    memoryService.requestMemoryRead(memMemo)
+    # read the CDI space starting at address zero, up to a zero byte
+    memMemo = MemoryBulkReadMemo(NodeID(settings['farNodeID']), 0xFF, 0, None,
+                                 memoryReadFail, memoryReadSuccess)
+    memoryService.requestMemoryBulkRead(memMemo)
 
 
 import threading  # noqa E402
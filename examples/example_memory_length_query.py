@@ -93,6 +93,8 @@ def printDatagram(memo):
 datagramService.registerDatagramReceivedListener(printDatagram)
 
 memoryService = MemoryService(datagramService)
+# lets it forget cached space information when a node restarts
+canLink.registerMessageReceivedListener(memoryService.process)
 
 # callbacks to get results of memory read
 
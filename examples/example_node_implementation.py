@@ -28,6 +28,10 @@ from openlcb.canbus.canlink import CanLink
 from openlcb.nodeid import NodeID
 from openlcb.datagramservice import DatagramService
 from openlcb.memoryservice import MemoryService
+from openlcb.memoryconfigserver import (
+    MemoryConfigServer,
+    MemorySpace,
+)
 from openlcb.message import Message
 from openlcb.mti import MTI
 
@@ -111,6 +115,15 @@ def memoryReadFail(memo):
     print("memory read failed: {}".format(memo.data))
 
 
+# serve this node's own CDI and configuration memory to other nodes
+memoryConfigServer = MemoryConfigServer(datagramService)
+memoryConfigServer.addSpace(0xFF, MemorySpace(
+    b'<?xml version="1.0"?><cdi><segment space="253">'
+    b'<string size="32"><name>Greeting</name></string>'
+    b'</segment></cdi>\0'))
+memoryConfigServer.addSpace(0xFD, MemorySpace(bytearray(32)))
+
+
 # create a node and connect it update
 # This is a very minimal node, which just takes part in the low-level common
 # protocols
@@ -118,7 +131,9 @@ localNode = Node(
     NodeID(settings['localNodeID']),
     SNIP("python-openlcb", "example_node_implementation",
          "0.1", "0.2", "User Name Here", "User Description Here"),
-    set([PIP.SIMPLE_NODE_IDENTIFICATION_PROTOCOL, PIP.DATAGRAM_PROTOCOL])
+    set([PIP.SIMPLE_NODE_IDENTIFICATION_PROTOCOL, PIP.DATAGRAM_PROTOCOL,
+         PIP.MEMORY_CONFIGURATION_PROTOCOL,
+         PIP.CONFIGURATION_DESCRIPTION_INFORMATION])
 )
 
 localNodeProcessor = LocalNodeProcessor(canLink, localNode)
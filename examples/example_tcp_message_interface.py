@@ -76,6 +76,6 @@ tcpLinkLayer.sendMessage(message)
 # process resulting activity
 while True:
     received = s.receive()
-    print("      RR: {}".format(received))
+    print("      RR: {}".format(list(received)))
     # pass to link processor
     tcpLinkLayer.receiveListener(received)
@@ -0,0 +1,232 @@
+'''
+Measure local throughput of the link-level parsers without a network.
+
+Feeds a synthetic burst of GridConnect frames, the size of a busy hub's
+socket read, through the parser and reports frames per second. Run it on
+two checkouts to compare implementations.
+
+The decoded frames are then dispatched through CanLink.receiveListener
+to measure the per-frame cost of turning them into messages.
+
+Also streams frames over a local socketpair to compare TcpSocket's bulk
+receiveBytes with a one-byte-per-recv reader, reporting reads per frame
+and CPU time.
+
+Finally replays a capture of native TCP (TcpLink) messages through
+TcpLink.receiveListener in socket-sized reads and reports messages per
+second.
+
+Usage:
+python3 example_throughput.py [burst_bytes]
+
+Options:
+burst_bytes               (optional) Size of each burst fed to the parser.
+                          Defaults to 4096.
+'''
+# region same code as other examples
+import examples_settings  # noqa: F401 do 1st to fix path if no pip install
+# endregion same code as other examples
+
+import socket
+import sys
+import threading
+import time
+
+from openlcb.canbus.canphysicallayergridconnect import (
+    CanPhysicalLayerGridConnect,
+)
+from openlcb.canbus.canlink import CanLink
+from openlcb.canbus.tcpsocket import TcpSocket
+from openlcb.nodeid import NodeID
+from openlcb.tcplink.tcplink import TcpLink
+
+# a datagram frame with data and a header-only frame, as seen on a layout
+SAMPLE_FRAMES = b":X1B7A4D6AN2040000000000040;\n:X19490365N;\n"
+
+
+def makeBurst(size):
+    """Build a burst of about `size` bytes of GridConnect frames.
+
+    Args:
+        size (int): Approximate size of the burst in bytes.
+
+    Returns:
+        tuple(bytes, int): The burst and the number of frames in it.
+    """
+    repeats = max(1, size // len(SAMPLE_FRAMES))
+    return SAMPLE_FRAMES * repeats, 2 * repeats
+
+
+def measureGridConnectReceive(burst, frameCount, seconds=1.0):
+    """Feed bursts to CanPhysicalLayerGridConnect.receiveChars.
+
+    Returns:
+        float: Frames decoded per second.
+    """
+    received = []
+    gc = CanPhysicalLayerGridConnect(lambda string: None)
+    gc.registerFrameReceivedListener(received.append)
+    bursts = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        gc.receiveChars(burst)
+        bursts += 1
+        received.clear()
+    elapsed = time.perf_counter() - start
+    return bursts * frameCount / elapsed
+
+
+def measureCanLinkReceive(burst, seconds=1.0):
+    """Dispatch the frames of a burst through CanLink.receiveListener.
+
+    Returns:
+        float: Frames handled per second.
+    """
+    frames = []
+    gc = CanPhysicalLayerGridConnect(lambda string: None)
+    gc.registerFrameReceivedListener(frames.append)
+    gc.receiveChars(burst)
+    link = CanLink(NodeID("05.01.01.01.03.01"))
+    link.registerMessageReceivedListener(lambda message: None)
+    link.state = CanLink.State.Permitted
+    # map the sample aliases, as a running monitor would have
+    link.aliasToNodeID[0x365] = NodeID(0x050101010365)
+    link.aliasToNodeID[0xD6A] = NodeID(0x050101010D6A)
+    link.aliasToNodeID[0x7A4] = NodeID(0x0501010107A4)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for frame in frames:
+            link.receiveListener(frame)
+        count += len(frames)
+    return count / (time.perf_counter() - start)
+
+
+def measureSocketReceive(burst, frameCount, bursts, bulk=True):
+    """Stream bursts over a socketpair into the GridConnect parser.
+
+    Args:
+        bulk (bool): Read with TcpSocket.receiveBytes if True, else one
+            byte per recv call as a simple reader would.
+
+    Returns:
+        tuple(float, float, float): Frames per second, reads per frame
+            and CPU seconds used by the whole process.
+    """
+    near, far = socket.socketpair()
+
+    def writer():
+        for _ in range(bursts):
+            far.sendall(burst)
+        far.close()
+
+    received = [0]
+
+    def countFrame(frame):
+        received[0] += 1
+
+    gc = CanPhysicalLayerGridConnect(lambda string: None)
+    gc.registerFrameReceivedListener(countFrame)
+    s = TcpSocket(near)
+    reads = 0
+    thread = threading.Thread(target=writer, daemon=True)
+    start = time.perf_counter()
+    cpuStart = time.process_time()
+    thread.start()
+    try:
+        while True:
+            if bulk:
+                gc.receiveChars(s.receiveBytes())
+            else:
+                chunk = near.recv(1)
+                if chunk == b'':
+                    break
+                gc.receiveChars(chunk)
+            reads += 1
+    except RuntimeError:
+        pass  # writer closed its end
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpuStart
+    thread.join()
+    near.close()
+    total = bursts * frameCount
+    if received[0] != total:
+        print("warning: expected {} frames, got {}".format(total,
+                                                           received[0]))
+    return total / elapsed, reads / total, cpu
+
+
+def makeTcpCapture(messageCount):
+    """Build a capture of TcpLink messages, as a hub would send them.
+
+    Produced and consumed event reports alternate with addressed
+    datagrams, each from the node that sent the previous one plus one.
+
+    Returns:
+        bytes: The capture.
+    """
+    capture = bytearray()
+    for n in range(messageCount):
+        source = (0x050101010000 + n).to_bytes(6, "big")
+        if n % 2:
+            body = (b"\x1C\x48" + source + bytes(6)  # Datagram to 0
+                    + bytes([0x20, 0x53, 0, 0, 0, 0]) + bytes(64))
+        else:
+            body = b"\x05\xB4" + source + n.to_bytes(8, "big")  # PCER
+        length = 12 + len(body)
+        capture += b"\x80\x00" + length.to_bytes(3, "big")
+        capture += bytes(6) + bytes(6) + body  # gateway node ID, time
+    return bytes(capture)
+
+
+def measureTcpLinkReceive(capture, messageCount, readSize, seconds=1.0):
+    """Replay a capture through TcpLink.receiveListener.
+
+    Args:
+        readSize (int): Bytes handed over per call, like one socket read.
+
+    Returns:
+        float: Messages decoded per second.
+    """
+    received = [0]
+
+    def countMessage(message):
+        received[0] += 1
+
+    link = TcpLink(NodeID(100))
+    link.registerMessageReceivedListener(countMessage)
+    view = memoryview(capture)
+    replays = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for offset in range(0, len(view), readSize):
+            link.receiveListener(view[offset:offset+readSize])
+        replays += 1
+    elapsed = time.perf_counter() - start
+    if received[0] != replays * messageCount:
+        print("warning: expected {} messages, got {}"
+              "".format(replays * messageCount, received[0]))
+    return replays * messageCount / elapsed
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    burst, frameCount = makeBurst(size)
+    print("GridConnect receive, {} byte bursts: {:,.0f} frames/s"
+          "".format(len(burst), measureGridConnectReceive(burst, frameCount)))
+    print("CanLink dispatch: {:,.0f} frames/s"
+          "".format(measureCanLinkReceive(burst)))
+    for bulk, name in ((False, "one byte per recv"),
+                       (True, "TcpSocket.receiveBytes")):
+        rate, readsPerFrame, cpu = measureSocketReceive(burst, frameCount,
+                                                        50, bulk)
+        print("socketpair, {}: {:,.0f} frames/s, {:.2f} reads/frame,"
+              " {:.2f} s CPU".format(name, rate, readsPerFrame, cpu))
+    capture = makeTcpCapture(2000)
+    for readSize in (size, len(capture)):
+        print("TcpLink replay, {} byte reads: {:,.0f} messages/s".format(
+            readSize, measureTcpLinkReceive(capture, 2000, readSize)))
+
+
+if __name__ == "__main__":
+    main()
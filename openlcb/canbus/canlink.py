@@ -15,12 +15,16 @@ Remote Nodes.
 
 - Aliases are tracked for the Remote Nodes, but not allocated here
 
-Multi-frame addressed messages are accumulated in parallel
+Multi-frame addressed messages are accumulated in parallel. The number
+accumulated at once is bounded, and a partial message is dropped if its
+next frame doesn't arrive in time.
 '''
 
+from collections import OrderedDict
 from enum import Enum
 
 import logging
+import time
 
 from openlcb.canbus.canframe import CanFrame
 from openlcb.canbus.controlframe import ControlFrame
@@ -31,6 +35,29 @@ from openlcb.mti import MTI
 from openlcb.nodeid import NodeID
 
 
+def makeCanMtiTable():
+    """Build the lookup from a 12-bit CAN MTI to its MTI.
+
+    Returns:
+        list[MTI]: 4096 entries indexed by CAN MTI, None where no MTI
+            has that value.
+    """
+    table = [None] * 0x1000
+    for mti in MTI:
+        if mti.value < 0x1000:
+            table[mti.value] = mti
+    return table
+
+
+CAN_MTI_TABLE = makeCanMtiTable()
+
+ACCUMULATION_TIMEOUT = 3.0  # seconds after the last frame to give up
+MAX_ACCUMULATIONS = 64  # multi-frame messages accumulated at once
+
+# control field value to ControlFrame, for decodeControlFrameFormat
+CONTROL_FRAMES = {frame.value: frame for frame in ControlFrame}
+
+
 class CanLink(LinkLayer):
 
     def __init__(self, localNodeID):  # a NodeID
@@ -41,8 +68,31 @@ class CanLink(LinkLayer):
         self.link = None
         self.aliasToNodeID = {}
         self.nodeIdToAlias = {}
-        self.accumulator = {}
+        # key (int) to [deadline, bytearray], least recently extended first
+        self.accumulator = OrderedDict()
+        self.accumulationTimeout = ACCUMULATION_TIMEOUT
+        self.maxAccumulations = MAX_ACCUMULATIONS
+        self.accumulationsCompleted = 0
+        self.accumulationsEvicted = 0
+        self.accumulationsTimedOut = 0
+        self.clock = time.monotonic  # replaceable for testing
         self.nextInternallyAssignedNodeID = 1
+        # control field value (see ControlFrame) to handler
+        self.controlFrameHandlers = {
+            ControlFrame.LinkUp.value: self.handleReceivedLinkUp,
+            ControlFrame.LinkRestarted.value: self.handleReceivedLinkRestarted,
+            ControlFrame.LinkCollision.value: self.handleReceivedLinkError,
+            ControlFrame.LinkError.value: self.handleReceivedLinkError,
+            ControlFrame.LinkDown.value: self.handleReceivedLinkDown,
+            ControlFrame.RID.value: self.handleReceivedRID,
+            ControlFrame.AMD.value: self.handleReceivedAMD,
+            ControlFrame.AME.value: self.handleReceivedAME,
+            ControlFrame.AMR.value: self.handleReceivedAMR,
+            ControlFrame.EIR0.value: self.handleReceivedEIR,
+            ControlFrame.EIR1.value: self.handleReceivedEIR,
+            ControlFrame.EIR2.value: self.handleReceivedEIR,
+            ControlFrame.EIR3.value: self.handleReceivedEIR,
+        }
         LinkLayer.__init__(self, localNodeID)
 
     def linkPhysicalLayer(self, cpl):  # CanPhysicalLayer
@@ -61,45 +111,21 @@ class CanLink(LinkLayer):
             frame (CanFrame): Any CanFrame, OpenLCB/LCC or not (if
                 not then ignored).
         """
-        control_frame = self.decodeControlFrameFormat(frame)
-        if control_frame == ControlFrame.LinkUp:
-            self.handleReceivedLinkUp(frame)
-        elif control_frame == ControlFrame.LinkRestarted:  # noqa: E501
-            self.handleReceivedLinkRestarted(frame)
-        elif control_frame in (ControlFrame.LinkCollision,  # noqa: E501
-                               ControlFrame.LinkError):
-            logging.warning("Unexpected error report {:08X}"
-                            "".format(frame.header))
-        elif control_frame == ControlFrame.LinkDown:
-            self.handleReceivedLinkDown(frame)
-        elif control_frame == ControlFrame.CID:
-            self.handleReceivedCID(frame)
-        elif control_frame == ControlFrame.RID:
-            self.handleReceivedRID(frame)
-        elif control_frame == ControlFrame.AMD:
-            self.handleReceivedAMD(frame)
-        elif control_frame == ControlFrame.AME:
-            self.handleReceivedAME(frame)
-        elif control_frame == ControlFrame.AMR:
-            self.handleReceivedAMR(frame)
-        elif control_frame in (ControlFrame.EIR0,
-                               ControlFrame.EIR1,
-                               ControlFrame.EIR2,
-                               ControlFrame.EIR3):
-            pass   # ignored upon receipt
-        elif control_frame == ControlFrame.Data:
+        header = frame.header
+        if (header & 0x0800_0000) == 0x0800_0000:
+            # data case, the most common; not checking leading 1 bit
             self.handleReceivedData(frame)
-        elif (control_frame
-              == ControlFrame.UnknownFormat):
+            return
+        if (header & 0x4_000_000) != 0:  # CID case
+            self.handleReceivedCID(frame)
+            return
+        # top 1 bit for out-of-band messages
+        handler = self.controlFrameHandlers.get((header >> 12) & 0x2FFFF)
+        if handler is None:
             logging.warning("Unexpected CAN header 0x{:08X}"
-                            "".format(frame.header))
-        else:
-            # This should never happen due to how
-            #   decodeControlFrameFormat works, but this is a "not
-            #   implemented" output for ensuring completeness (If this
-            #   case occurs, some code is missing above).
-            logging.warning("Invalid control frame format 0x{:08X}"
-                            "".format(control_frame))
+                            "".format(header))
+            return
+        handler(frame)
 
     def handleReceivedLinkUp(self, frame):
         """Link started, update state, start process to create alias.
@@ -114,6 +140,23 @@ class CanLink(LinkLayer):
         #    notify upper layers
         self.linkStateChange(self.state)
 
+    def handleReceivedLinkError(self, frame):
+        """Log a LinkCollision or LinkError report.
+
+        Args:
+            frame (CanFrame): A LinkCollision or LinkError frame.
+        """
+        logging.warning("Unexpected error report {:08X}"
+                        "".format(frame.header))
+
+    def handleReceivedEIR(self, frame):
+        """Error information reports are ignored upon receipt.
+
+        Args:
+            frame (CanFrame): An EIR0 through EIR3 frame.
+        """
+        pass
+
     def handleReceivedLinkRestarted(self, frame):
         """Send a LinkRestarted message upstream.
 
@@ -219,26 +262,16 @@ class CanLink(LinkLayer):
         #    Alias Map Reset - drop from maps
         nodeID = NodeID(frame.data)
         alias = frame.header & 0xFFF
-        try:
-            del self.aliasToNodeID[alias]
-            del self.nodeIdToAlias[nodeID]
-        except KeyboardInterrupt:
-            raise
-        except:
-            pass
+        self.aliasToNodeID.pop(alias, None)
+        self.nodeIdToAlias.pop(nodeID, None)
 
     def handleReceivedData(self, frame):  # CanFrame
         if self.checkAndHandleAliasCollision(frame):
             return
         #    get proper MTI
         mti = self.canHeaderToFullFormat(frame)
-        sourceID = NodeID(0)
-        try:
-            mapped = self.aliasToNodeID[frame.header & 0xFFF]
-            sourceID = mapped
-        except KeyboardInterrupt:
-            raise
-        except:
+        sourceID = self.aliasToNodeID.get(frame.header & 0xFFF)
+        if sourceID is None:
             #    special case for JMRI before 5.1.5 which sends
             #    VerifiedNodeID but not AMD
             if mti == MTI.Verified_NodeID:
@@ -269,9 +302,8 @@ class CanLink(LinkLayer):
 
                 destAlias = (frame.header & 0x00_FFF_000) >> 12
 
-                if destAlias in self.aliasToNodeID  :
-                    destID = self.aliasToNodeID[destAlias]
-                else:
+                destID = self.aliasToNodeID.get(destAlias)
+                if destID is None:
                     destID = NodeID(self.nextInternallyAssignedNodeID)
                     logging.warning("message from unknown dest alias: {},"
                                     " continue with {}"
@@ -281,37 +313,45 @@ class CanLink(LinkLayer):
                     self.aliasToNodeID[destAlias] = destID
                     self.nodeIdToAlias[destID] = destAlias
 
+                if dgCode == 0x00F_000_000:
+                    #    stream data: each frame carries the destination
+                    #    stream ID and up to 7 bytes, and is passed on alone
+                    self.fireListeners(Message(mti, sourceID, destID,
+                                               bytearray(frame.data)))
+                    return
+
                 #    check for start and end bits
-                key = CanLink.AccumKey(mti, sourceID, destID)
-                if dgCode == 0x00A_000_000 or dgCode == 0x00B_000_000:
-                    #    start of message, create the entry in the accumulator
-                    self.accumulator[key] = bytearray()
+                if dgCode == 0x00A_000_000:
+                    #    single frame, nothing to accumulate
+                    data = bytearray(frame.data)
                 else:
-                    # not start frame
-                    # check for never properly started, this is an error
-                    if key not in self.accumulator:
-                        #    have not-start frame, but never started
-                        logging.warning(
-                            "Dropping non-start datagram frame"
-                            " without accumulation started:"
-                            " {}".format(frame)
-                            # TODO: ^ more necessary to show same output
-                            #   as Swift? Formerly:
-                            #   " \(frame, privacy: .public)"
-                        )
-                        return  # early return to stop processing of this frame
-
-                # add this data
-                if len(frame.data) > 0:
-                    self.accumulator[key].extend(frame.data)
-
-                if dgCode == 0x00A_000_000 or dgCode == 0x00D_000_000:
-                    #    is end, ship and remove accumulation
-                    msg = Message(mti, sourceID, destID, self.accumulator[key])
-                    self.fireListeners(msg)
-
-                    #    remove accumulation
-                    self.accumulator[key] = None
+                    #    dest and source aliases identify the datagram
+                    key = frame.header & 0x00_FFF_FFF
+                    if dgCode == 0x00B_000_000:
+                        #    start of message, create the accumulation
+                        data = self.startAccumulation(key)
+                    else:
+                        # not start frame
+                        data = self.continueAccumulation(key)
+                        # check for never properly started, or timed out
+                        if data is None:
+                            #    have not-start frame, but never started
+                            logging.warning(
+                                "Dropping non-start datagram frame"
+                                " without accumulation started:"
+                                " {}".format(frame)
+                            )
+                            return  # early return to stop processing
+                    # add this data
+                    data.extend(frame.data)
+                    if dgCode != 0x00D_000_000:
+                        return  # wait for the end frame
+                    #    is end, remove accumulation
+                    self.finishAccumulation(key)
+
+                #    ship the message
+                msg = Message(mti, sourceID, destID, data)
+                self.fireListeners(msg)
             else:
                 #    addressed message case
                 destAlias = 0
@@ -320,12 +360,8 @@ class CanLink(LinkLayer):
                     # TODO: Is this ok when len(frame.data) <= 1? Still << 8?
                 if (len(frame.data) > 1):
                     destAlias |= (frame.data[1] & 0xFF)
-                try:
-                    mapped = self.aliasToNodeID[destAlias]
-                    destID = mapped
-                except KeyboardInterrupt:
-                    raise
-                except:
+                destID = self.aliasToNodeID.get(destAlias)
+                if destID is None:
                     destID = NodeID(self.nextInternallyAssignedNodeID)
                     logging.warning("message from unknown dest alias:"
                                     " 0x{:04X}, continue with 0x{}"
@@ -336,36 +372,40 @@ class CanLink(LinkLayer):
                     self.nodeIdToAlias[destID] = destAlias
 
                 # check for start and end bits
-                key = CanLink.AccumKey(mti, sourceID, destID)
-                if (frame.data[0] & 0x20 == 0):
-                    #    is start, create the entry in the accumulator
-                    self.accumulator[key] = bytearray()
+                if frame.data[0] & 0x30 == 0:
+                    #    single frame, nothing to accumulate
+                    data = bytearray(frame.data[2:])
                 else:
-                    # not start frame
-                    # check for first bit set never seen
-                    if key not in self.accumulator:
-                        #    have not-start frame, but never started
-                        logging.warning("Dropping non-start frame without"
-                                        " accumulation started: {}"
-                                        "".format(frame))
-                        return  # early return to stop processing of this gram
-
-                #    add this data
-                if len(frame.data) > 2:
-                    for byte in frame.data[2:]:  # through end of array
-                        self.accumulator[key].append(byte)
-
-                if frame.data[0] & 0x10 == 0:
-                    # is end, ship and remove accumulation
-                    msg = Message(mti, sourceID, destID, self.accumulator[key])
-                    # This includes the special case of MTI.Unknown,
-                    #   which needs to carry its original MTI value
-                    if mti is MTI.Unknown :
-                        msg.originalMTI = ((frame.header >> 12) & 0xFFF)
-                    self.fireListeners(msg)
-
-                    # remove accumulation
-                    self.accumulator[key] = None
+                    #    MTI, source and dest aliases identify the message
+                    key = (((frame.header & 0x00_FFF_000) << 12)
+                           | (destAlias << 12) | (frame.header & 0xFFF))
+                    if (frame.data[0] & 0x20 == 0):
+                        #    is start, create the accumulation
+                        data = self.startAccumulation(key)
+                    else:
+                        # not start frame
+                        data = self.continueAccumulation(key)
+                        # check for first bit set never seen, or timed out
+                        if data is None:
+                            #    have not-start frame, but never started
+                            logging.warning("Dropping non-start frame"
+                                            " without accumulation"
+                                            " started: {}".format(frame))
+                            return  # early return to stop processing
+                    #    add this data
+                    data.extend(frame.data[2:])
+                    if frame.data[0] & 0x10 != 0:
+                        return  # wait for the end frame
+                    # is end, remove accumulation
+                    self.finishAccumulation(key)
+
+                # ship the message
+                msg = Message(mti, sourceID, destID, data)
+                # This includes the special case of MTI.Unknown,
+                #   which needs to carry its original MTI value
+                if mti is MTI.Unknown :
+                    msg.originalMTI = ((frame.header >> 12) & 0xFFF)
+                self.fireListeners(msg)
 
             # end addressed message case
 
@@ -378,6 +418,76 @@ class CanLink(LinkLayer):
                 msg.originalMTI = ((frame.header >> 12) & 0xFFF)
             self.fireListeners(msg)
 
+    def startAccumulation(self, key):
+        """Start accumulating a multi-frame message, replacing any
+        accumulation already under the same key.
+
+        Expired accumulations are dropped first. If maxAccumulations are
+        still in progress, the least recently extended one is evicted.
+
+        Args:
+            key (int): Identifies the stream of frames; see
+                handleReceivedData.
+
+        Returns:
+            bytearray: The (empty) data to extend.
+        """
+        now = self.clock()
+        self.expireAccumulations(now)
+        if key in self.accumulator:
+            del self.accumulator[key]  # restarted; count it as new
+        elif len(self.accumulator) >= self.maxAccumulations:
+            oldKey, _ = self.accumulator.popitem(last=False)
+            self.accumulationsEvicted += 1
+            logging.warning("Evicting partial message 0x{:X} to make room"
+                            "".format(oldKey))
+        data = bytearray()
+        self.accumulator[key] = [now + self.accumulationTimeout, data]
+        return data
+
+    def continueAccumulation(self, key):
+        """Find an accumulation in progress and extend its deadline.
+
+        Args:
+            key (int): Identifies the stream of frames.
+
+        Returns:
+            bytearray: The data accumulated so far, or None if there is
+                no accumulation (never started, timed out or evicted).
+        """
+        now = self.clock()
+        self.expireAccumulations(now)
+        entry = self.accumulator.get(key)
+        if entry is None:
+            return None
+        entry[0] = now + self.accumulationTimeout
+        self.accumulator.move_to_end(key)
+        return entry[1]
+
+    def finishAccumulation(self, key):
+        """Remove a completed accumulation."""
+        del self.accumulator[key]
+        self.accumulationsCompleted += 1
+
+    def expireAccumulations(self, now=None):
+        """Drop accumulations whose last frame is older than
+        accumulationTimeout. Called as frames arrive, but can also be
+        called periodically so a quiet link releases memory.
+
+        Args:
+            now (float, optional): The current clock() value.
+        """
+        if now is None:
+            now = self.clock()
+        # ordered by last frame, so deadlines are in increasing order
+        while self.accumulator:
+            key, entry = next(iter(self.accumulator.items()))
+            if entry[0] > now:
+                return
+            del self.accumulator[key]
+            self.accumulationsTimedOut += 1
+            logging.warning("Timed out partial message 0x{:X}".format(key))
+
     def sendMessage(self, msg):
         #    special case for datagram
         if msg.mti == MTI.Datagram:
@@ -387,23 +497,19 @@ class CanLink(LinkLayer):
             #             1Bdddsss - first frame
             #             1Cdddsss - middle frame
             #             1Ddddsss - last frame
-            try:
-                sssAlias = self.nodeIdToAlias[msg.source]
+            sssAlias = self.nodeIdToAlias.get(msg.source)
+            if sssAlias is not None:
                 header |= ((sssAlias) & 0xFFF)
-            except KeyboardInterrupt:
-                raise
-            except:
+            else:
                 logging.warning(
                     "Did not know source = {} on datagram send"
                     "".format(msg.source)
                 )
 
-            try:
-                dddAlias = self.nodeIdToAlias[msg.destination]
+            dddAlias = self.nodeIdToAlias.get(msg.destination)
+            if dddAlias is not None:
                 header |= ((dddAlias) & 0xFFF) << 12
-            except KeyboardInterrupt:
-                raise
-            except:
+            else:
                 logging.warning(
                     "Did not know destination = {} on datagram send"
                     "".format(msg.source)
@@ -415,25 +521,25 @@ class CanLink(LinkLayer):
                 frame = CanFrame(header, msg.data)
                 self.link.sendCanFrame(frame)
             else:
-                #    multi-frame datagram
+                #    multi-frame datagram, handed down as one batch
                 dataSegments = self.segmentDatagramDataArray(msg.data)
-                #    send the first one
-                frame = CanFrame(header | 0x0B_000_000, dataSegments[0])
-                self.link.sendCanFrame(frame)
-                #    send middles
+                #    the first one
+                frames = [CanFrame(header | 0x0B_000_000, dataSegments[0])]
+                #    middles
                 if len(dataSegments) >= 3:
                     for index in range(1, len(dataSegments) - 2 + 1):
                         # upper limit leaves one
-                        frame = CanFrame(header | 0x0C_000_000,
-                                         dataSegments[index])
-                        self.link.sendCanFrame(frame)
+                        frames.append(CanFrame(header | 0x0C_000_000,
+                                               dataSegments[index]))
 
-                # send last one
-                frame = CanFrame(
+                # last one
+                frames.append(CanFrame(
                     header | 0x0D_000_000,
                     dataSegments[len(dataSegments) - 1]
-                )
-                self.link.sendCanFrame(frame)
+                ))
+                self.link.sendCanFrames(frames)
+        elif msg.mti == MTI.Stream_Data_Send:
+            self.sendStreamData(msg)
         else:
             #    all non-datagram cases
             #    Remap the mti
@@ -456,10 +562,9 @@ class CanLink(LinkLayer):
                     #    address and have alias, break up data
                     dataSegments = self.segmentAddressedDataArray(alias,
                                                                   msg.data)
-                    for content in dataSegments:
-                        #    send the resulting frame
-                        frame = CanFrame(header, content)
-                        self.link.sendCanFrame(frame)
+                    #    send the resulting frames as one batch
+                    self.link.sendCanFrames([CanFrame(header, content)
+                                             for content in dataSegments])
                 else:
                     logging.warning("Don't know alias for destination = {}"
                                     "".format(msg.destination or NodeID(0)))
@@ -469,6 +574,35 @@ class CanLink(LinkLayer):
                 frame = CanFrame(header, msg.data)
                 self.link.sendCanFrame(frame)
 
+    def sendStreamData(self, msg):
+        """Send Stream Data Send as stream frames (type 7), each with the
+        destination stream ID (the first data byte) and up to 7 more
+        bytes, handed down as one batch.
+
+        Args:
+            msg (Message): A Stream_Data_Send message.
+        """
+        header = 0x1F_000_000
+        sssAlias = self.nodeIdToAlias.get(msg.source)
+        if sssAlias is not None:
+            header |= sssAlias & 0xFFF
+        else:
+            logging.warning("Did not know source = {} on stream send"
+                            "".format(msg.source))
+        dddAlias = self.nodeIdToAlias.get(msg.destination)
+        if dddAlias is not None:
+            header |= (dddAlias & 0xFFF) << 12
+        else:
+            logging.warning("Did not know destination = {} on stream send"
+                            "".format(msg.destination))
+        data = msg.data
+        if len(data) < 1:
+            logging.warning("Stream data without a stream ID not sent")
+            return
+        streamID = data[0:1]
+        self.link.sendCanFrames([CanFrame(header, streamID + data[i:i + 7])
+                                 for i in range(1, max(len(data), 2), 7)])
+
     def segmentDatagramDataArray(self, data):
         """Segment data into zero or more arrays
         of no more than 8 bytes for datagram.
@@ -564,12 +698,13 @@ class CanLink(LinkLayer):
 
     def sendAliasAllocationSequence(self):
         '''Send the alias allocation sequence'''
-        self.link.sendCanFrame(CanFrame(7, self.localNodeID, self.localAlias))
-        self.link.sendCanFrame(CanFrame(6, self.localNodeID, self.localAlias))
-        self.link.sendCanFrame(CanFrame(5, self.localNodeID, self.localAlias))
-        self.link.sendCanFrame(CanFrame(4, self.localNodeID, self.localAlias))
-        self.link.sendCanFrame(CanFrame(ControlFrame.RID.value,
-                                        self.localAlias))
+        self.link.sendCanFrames([
+            CanFrame(7, self.localNodeID, self.localAlias),
+            CanFrame(6, self.localNodeID, self.localAlias),
+            CanFrame(5, self.localNodeID, self.localAlias),
+            CanFrame(4, self.localNodeID, self.localAlias),
+            CanFrame(ControlFrame.RID.value, self.localAlias),
+        ])
 
     def incrementAlias48(self, oldAlias):
         '''
@@ -606,25 +741,21 @@ class CanLink(LinkLayer):
         if (frame.header & 0x4_000_000) != 0:  # CID case
             return ControlFrame.CID
 
-        try:
-            retval = ControlFrame((frame.header >> 12) & 0x2FFFF)
-            return retval  # top 1 bit for out-of-band messages
-        except KeyboardInterrupt:
-            raise
-        except:
+        # top 1 bit for out-of-band messages
+        retval = CONTROL_FRAMES.get((frame.header >> 12) & 0x2FFFF)
+        if retval is None:
             logging.warning("Could not decode header 0x{:08X}"
                             "".format(frame.header))
             return ControlFrame.UnknownFormat
+        return retval
 
     def canHeaderToFullFormat(self, frame):
         '''Returns a full 16-bit MTI from the full 29 bits of a CAN header'''
         frameType = (frame.header >> 24) & 0x7
-        canMTI = ((frame.header >> 12) & 0xFFF)
 
         if frameType == 1:
-            try :
-                okMTI = MTI(canMTI)
-            except ValueError:
+            okMTI = CAN_MTI_TABLE[(frame.header >> 12) & 0xFFF]
+            if okMTI is None:
                 logging.warning("unhandled canMTI: {}, marked Unknown"
                                 "".format(frame))
                 return MTI.Unknown
@@ -634,36 +765,10 @@ class CanLink(LinkLayer):
             #    datagram type - we don't address the subtypes here
             return MTI.Datagram
 
-        #    not handling reserver and stream type except to log
+        if frameType == 7:
+            return MTI.Stream_Data_Send
+
+        #    not handling reserved type except to log
         logging.warning("unhandled canMTI: {}, marked Unknown"
                         "".format(frame))
         return MTI.Unknown
-
-    class AccumKey:
-        '''Class that holds the ID for accumulating a multi-part message:
-
-        - MTI
-
-        - Source
-
-        - Destination
-
-        Together these uniquely identify a stream of frames that need to
-        be assembled into a message
-        '''
-        def __init__(self, mti, source, dest):
-            self.mti = mti
-            self.source = source
-            self.dest = dest
-
-        def __hash__(self):
-            return hash(self.mti)+hash(self.source)+hash(self.dest)
-
-        def __eq__(self, other):
-            if self.mti != other.mti:
-                return False
-            if self.source != other.source:
-                return False
-            if self.dest != other.dest:
-                return False
-            return True
@@ -18,6 +18,16 @@ class CanPhysicalLayer(PhysicalLayer):
         '''basic abstract interface'''
         pass
 
+    def sendCanFrames(self, frames):
+        '''Send several frames, such as all the segments of one message, in
+        order. Subclasses that can write them in one operation override this.
+
+        Args:
+            frames (list[CanFrame]): Frames to send, in order.
+        '''
+        for frame in frames:
+            self.sendCanFrame(frame)
+
     def registerFrameReceivedListener(self, listener):
         self.listeners.append(listener)
 
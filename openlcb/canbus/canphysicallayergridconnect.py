@@ -10,26 +10,54 @@ Works with frames like
 - :X19170365N020112FE056C;
 '''
 
+import logging
+
 from openlcb.canbus.canphysicallayer import CanPhysicalLayer
 from openlcb.canbus.canframe import CanFrame
 
 
 class CanPhysicalLayerGridConnect(CanPhysicalLayer):
+    """CAN physical layer that exchanges GridConnect text with a callback.
+
+    Args:
+        callback (Callable): Called with the GridConnect text to send.
+        sendBytes (bool, optional): If True, the callback receives the
+            encoded bytearray (for example TcpSocket.send), avoiding a
+            str round trip. Defaults to False, which sends a str.
+    """
 
-    def __init__(self, callback):
+    def __init__(self, callback, sendBytes=False):
+        # See class docstring for args
         CanPhysicalLayer.__init__(self)
         self.canSendCallback = callback
+        self.sendBytes = sendBytes
         self.inboundBuffer = bytearray()
+        self.scanIndex = 0  # where to resume searching for ";"
 
-    def setCallBack(self, callback):
+    def setCallBack(self, callback, sendBytes=None):
         self.canSendCallback = callback
+        if sendBytes is not None:
+            self.sendBytes = sendBytes
 
     def sendCanFrame(self, frame):
-        output = ":X{:08X}N".format(frame.header)
-        for byte in frame.data:
-            output += "{:02X}".format(byte)
-        output += ";\n"
-        self.canSendCallback(output)
+        self.sendCanFrames((frame,))
+
+    def sendCanFrames(self, frames):
+        '''Encode all frames into one buffer and hand it to the callback
+        in a single call, so a multi-frame message is one write.
+
+        Args:
+            frames (list[CanFrame]): Frames to send, in order.
+        '''
+        output = bytearray()
+        for frame in frames:
+            output += b":X%08XN" % frame.header
+            output += frame.data.hex().upper().encode("ascii")
+            output += b";\n"
+        if self.sendBytes:
+            self.canSendCallback(output)
+        else:
+            self.canSendCallback(output.decode("ascii"))
 
     def receiveString(self, string):
         '''Receive a string from the outside link to be parsed
@@ -39,41 +67,55 @@ class CanPhysicalLayerGridConnect(CanPhysicalLayer):
         '''
         self.receiveChars(string.encode("utf-8"))
 
-    # Provide characters from the outside link to be parsed
     def receiveChars(self, data):
-        self.inboundBuffer += data
-        lastByte = 0
-        if 0x3B in self.inboundBuffer:
-            #  ^ ';' ends message so we have at least one (CR/LF not required)
-            # found end, now find start of that same message, earlier in buffer
-            for index in range(0, len(self.inboundBuffer)):
-                outData = bytearray()
-                if 0x3B not in self.inboundBuffer[index:]:
-                    break
-                if self.inboundBuffer[index] == 0x3A:  # ':' starts message
-                    # now start to accumulate data from entire message
-                    header = 0
-                    for offset in range(2, 9+1):
-                        nextChar = (self.inboundBuffer[index+offset])
-                        nextByte = (nextChar & 0xF)+9 if nextChar > 0x39 else nextChar & 0xF  # noqa: E501
-                        header = (header << 4)+nextByte
-                    # offset 10 is N
-                    # offset 11 might be data, might be ;
-                    lastByte = index+11
-                    for dataItem in range(0, 8):
-                        if self.inboundBuffer[index+11+2*dataItem] == 0x3B:
-                            break
-                        # two characters are data
-                        byte1 = self.inboundBuffer[index+11+2*dataItem]
-                        part1 = (byte1 & 0xF)+9 if byte1 > 0x39 else byte1 & 0xF  # noqa: E501
-                        byte2 = self.inboundBuffer[index+11+2*dataItem+1]
-                        part2 = (byte2 & 0xF)+9 if byte2 > 0x39 else byte2 & 0xF  # noqa: E501
-                        outData += bytearray([part1 << 4 | part2])
-                        lastByte += 2
-                    # lastByte is index of ; in this message
-
-                    cf = CanFrame(header, outData)
-                    self.fireListeners(cf)
-
-            # shorten buffer by removing the processed message
-            self.inboundBuffer = self.inboundBuffer[lastByte:]
+        '''Provide characters from the outside link to be parsed.
+
+        Each frame is decoded exactly once: the search for the next ";"
+        resumes where the previous call left off, and the buffer is only
+        compacted after the complete frames in it have been consumed, so
+        a large read costs time proportional to its length.
+
+        Args:
+            data (Union[bytes,bytearray,memoryview]): Raw GridConnect
+                characters, which may end with a partial frame.
+        '''
+        buffer = self.inboundBuffer
+        buffer += data
+        consumed = 0  # index of the first byte not yet handled
+        end = buffer.find(0x3B, self.scanIndex)  # ';' ends message
+        while end >= 0:
+            # find start of that same message, earlier in buffer; anything
+            # before it is noise between frames
+            start = buffer.rfind(0x3A, consumed, end)  # ':' starts message
+            if start >= 0:
+                self.decodeFrame(buffer, start, end)
+            consumed = end + 1
+            end = buffer.find(0x3B, consumed)
+        # shorten buffer by removing the processed messages
+        if consumed > 0:
+            del buffer[:consumed]
+        # no ';' in what remains, so next search can start after it
+        self.scanIndex = len(buffer)
+
+    def decodeFrame(self, buffer, start, end):
+        '''Decode one ":X<header>N<data>;" frame and forward it.
+
+        Args:
+            buffer (bytearray): Buffer holding the frame.
+            start (int): Index of the ":" that starts the frame.
+            end (int): Index of the ";" that ends the frame.
+        '''
+        # header runs from after ":X" up to the "N"; the hex conversions
+        # are table driven inside int() and bytearray.fromhex()
+        separator = buffer.find(0x4E, start, end)
+        try:
+            if separator < 0:
+                raise ValueError("no N separator")
+            header = int(buffer[start+2:separator], 16)
+            outData = bytearray.fromhex(
+                buffer[separator+1:end].decode("ascii"))
+        except ValueError:
+            logging.warning("Dropping malformed GridConnect frame {}"
+                            "".format(bytes(buffer[start:end+1])))
+            return
+        self.fireListeners(CanFrame(header, outData))
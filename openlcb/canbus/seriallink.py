@@ -1,16 +1,50 @@
 '''
 simple serial input for string send and receive
 expects prior setting of device name
+
+For busy buses, startReader() drains the port in bulk on a background
+thread into a bounded queue of complete GridConnect frames, and
+startWriter() coalesces sends into fewer port writes.
 '''
-import serial
+import logging
+import queue
+import threading
+import time
+
+try:
+    import serial
+except ImportError:
+    serial = None  # only connect() needs pyserial; see SerialLink(port)
 
-MSGLEN = 35
+FRAME_QUEUE_SIZE = 1024  # default bound on frames waiting for the reader
+FLUSH_INTERVAL = 0.002  # default seconds a write waits for more to coalesce
 
 
 class SerialLink:
-    """simple serial input for string send and receive"""
-    def __init__(self):
-        pass
+    """simple serial input for string send and receive
+
+    Args:
+        port (serial.Serial, optional): An already-open port, or any object
+            with the same read, write and in_waiting members (such as one
+            end of a pty pair for testing). Defaults to None, in which case
+            call connect().
+
+    Attributes:
+        frames (queue.Queue): Complete frames (bytes ending with ";") read
+            by the background reader, once started.
+        failure (Exception): The error that stopped the reader or writer
+            thread, or None.
+    """
+    def __init__(self, port=None):
+        self.port = port
+        self.frames = queue.Queue(FRAME_QUEUE_SIZE)
+        self.failure = None
+        self.running = False
+        self.readerThread = None
+        self.writerThread = None
+        self.outbound = bytearray()  # coalesced by the writer thread
+        self.outboundCondition = threading.Condition()
+        self.flushInterval = FLUSH_INTERVAL
 
     def connect(self, device, baudrate=230400):
         """Connect to a serial port.
@@ -21,21 +55,44 @@ class SerialLink:
             baudrate (int, optional): Desired serial speed. Defaults to
                 230400 bits per second.
         """
+        if serial is None:
+            raise ImportError("connect requires pyserial"
+                              " (python3 -m pip install pyserial)")
         self.port = serial.Serial(device, baudrate)
         self.port.reset_input_buffer()  # drop anything that's just sitting there already  # noqa: E501
 
     def send(self, string):
-        """send a single string
+        """send a single string, or already-encoded bytes
+
+        If startWriter has been called, the data is queued for the writer
+        thread, which combines it with other sends into one port write.
 
         Args:
-            string (str): Any string.
+            string (Union[str,bytes,bytearray]): Any string; a bytes-like
+                value is written as-is.
 
         Raises:
-            RuntimeError: If the string couldn't be written to the port.
+            RuntimeError: If the string couldn't be written to the port, or
+                the reader or writer thread has stopped on an error.
         """
-        msg = string.encode('utf-8')
+        if isinstance(string, str):
+            msg = string.encode('utf-8')
+        else:
+            msg = string
+        with self.outboundCondition:
+            if self.failure is not None:
+                raise RuntimeError("serial link stopped: {}"
+                                   "".format(self.failure))
+            if self.writerThread is not None:
+                self.outbound += msg
+                self.outboundCondition.notify()
+                return
+        self.write(msg)
+
+    def write(self, msg):
+        """Write all of msg to the port."""
         total_sent = 0
-        while total_sent < len(msg[total_sent:]):
+        while total_sent < len(msg):
             sent = self.port.write(msg[total_sent:])
             if sent == 0:
                 raise RuntimeError("socket connection broken")
@@ -54,18 +111,158 @@ class SerialLink:
         Returns:
             str: A GridConnect frame as a string.
         '''
+        return self.receiveBytes().decode("utf-8")
+
+    def receiveBytes(self):
+        '''Receive at least one GridConnect frame, draining whatever the
+        port already holds in one read instead of one byte at a time.
+
+        Returns:
+            bytearray: Received data; it may end with a partial frame.
+        '''
         data = bytearray()
-        bytes_recd = 0
-        while bytes_recd < MSGLEN:
-            chunk = self.port.read(1)
+        while 0x3B not in data:
+            chunk = self.port.read(max(1, self.port.in_waiting))
             if chunk == b'':
                 raise RuntimeError("serial connection broken")
-            data.extend(chunk)
-            bytes_recd = bytes_recd + len(chunk)
-            if 0x3B in chunk:
+            data += chunk
+        return data
+
+    def startReader(self, queueSize=FRAME_QUEUE_SIZE):
+        '''Start a background thread that drains the port in bulk and puts
+        each complete GridConnect frame into the bounded `frames` queue.
+
+        When the queue is full the reader waits, leaving further input in
+        the port's buffer, rather than growing without limit.
+
+        Args:
+            queueSize (int, optional): Most frames held for the consumer.
+        '''
+        self.frames = queue.Queue(queueSize)
+        self.failure = None
+        self.running = True
+        self.readerThread = threading.Thread(target=self.readLoop,
+                                             daemon=True)
+        self.readerThread.start()
+
+    def readLoop(self):
+        '''Body of the reader thread.'''
+        buffer = bytearray()
+        while self.running:
+            try:
+                chunk = self.port.read(max(1, self.port.in_waiting))
+            except Exception as ex:
+                if self.running:
+                    self.threadFailed("reader", ex)
                 break
-        return data.decode("utf-8")
+            if not chunk:
+                continue  # read timed out or was cancelled
+            buffer += chunk
+            end = buffer.rfind(0x3B)  # ';' ends the last complete frame
+            if end < 0:
+                continue
+            for frame in bytes(buffer[:end+1]).split(b";")[:-1]:
+                start = frame.rfind(b":")
+                if start >= 0:
+                    self.putFrame(frame[start:] + b";")
+            del buffer[:end+1]
+
+    def threadFailed(self, name, ex):
+        '''Stop both threads after an error in one, so that send raises
+        instead of queueing data nothing will write.'''
+        logging.error("serial {} stopped: {}".format(name, ex))
+        with self.outboundCondition:
+            self.failure = ex
+            self.running = False
+            self.outboundCondition.notify_all()
+
+    def putFrame(self, frame):
+        while self.running:
+            try:
+                self.frames.put(frame, timeout=0.1)
+                return
+            except queue.Full:
+                continue  # wait for the consumer
+
+    def receiveFrames(self, timeout=None):
+        '''Get the frames collected by the reader thread.
+
+        Blocks for the first frame, then takes any others already queued,
+        so the result can be passed to
+        CanPhysicalLayerGridConnect.receiveChars in one call.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the first frame.
+                Defaults to None, which waits indefinitely.
+
+        Returns:
+            bytes: One or more complete frames, or b'' on timeout.
+        '''
+        try:
+            frames = [self.frames.get(timeout=timeout)]
+        except queue.Empty:
+            return b''
+        while True:
+            try:
+                frames.append(self.frames.get_nowait())
+            except queue.Empty:
+                return b''.join(frames)
+
+    def startWriter(self, flushInterval=FLUSH_INTERVAL):
+        '''Start a background thread that coalesces sends.
+
+        After the first send, the writer waits flushInterval seconds for
+        more data, then writes everything queued in one port write.
+
+        Args:
+            flushInterval (float, optional): Seconds to wait for more data
+                before writing.
+        '''
+        self.flushInterval = flushInterval
+        self.failure = None
+        self.running = True
+        self.writerThread = threading.Thread(target=self.writeLoop,
+                                             daemon=True)
+        self.writerThread.start()
+
+    def writeLoop(self):
+        '''Body of the writer thread.'''
+        while True:
+            with self.outboundCondition:
+                while self.running and not self.outbound:
+                    self.outboundCondition.wait()
+                if not self.outbound:
+                    return  # stopped with nothing left to write
+            if self.running and self.flushInterval > 0:
+                time.sleep(self.flushInterval)  # let more sends arrive
+            with self.outboundCondition:
+                msg = bytes(self.outbound)
+                self.outbound.clear()
+            try:
+                self.write(msg)
+            except (OSError, RuntimeError) as ex:
+                self.threadFailed("writer", ex)
+                with self.outboundCondition:
+                    self.writerThread = None
+                    self.outbound.clear()
+                return
+
+    def stop(self):
+        '''Stop the reader and writer threads, writing any queued data.'''
+        self.running = False
+        with self.outboundCondition:
+            self.outboundCondition.notify_all()
+            writerThread = self.writerThread  # may clear it on an error
+            self.writerThread = None
+        if writerThread is not None:
+            writerThread.join()
+        if self.readerThread is not None:
+            if hasattr(self.port, "cancel_read"):
+                self.port.cancel_read()
+            self.readerThread.join()
+            self.readerThread = None
 
     def close(self):
+        self.stop()
         self.port.close()
         return
@@ -4,7 +4,7 @@ expects prior setting of host and port variables
 '''
 # https://docs.python.org/3/howto/sockets.html
 import socket
-MSGLEN = 35  # longest GC frame is 31 letters; forward if getting non-GC input
+RECEIVE_BUFFER_SIZE = 4096  # about 130 of the longest (31 letter) GC frames
 
 
 class TcpSocket:
@@ -13,6 +13,11 @@ class TcpSocket:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         else:
             self.sock = sock
+        # reused for every read; holds a partial frame between calls
+        self.receiveBuffer = bytearray(RECEIVE_BUFFER_SIZE)
+        self.receiveView = memoryview(self.receiveBuffer)
+        self.receiveCount = 0  # bytes held in receiveBuffer
+        self.returnedCount = 0  # leading bytes handed out by last call
 
     def settimeout(self, seconds):
         """Set the timeout for connect and transfer.
@@ -27,11 +32,19 @@ class TcpSocket:
         self.sock.connect((host, port))
 
     def send(self, string):
-        """Send a single string.
+        """Send a single string, or already-encoded bytes.
+
+        Args:
+            string (Union[str,bytes,bytearray]): GridConnect text; a
+                bytes-like value is sent as-is, such as a batch of frames
+                from CanPhysicalLayerGridConnect in sendBytes mode.
         """
-        msg = string.encode('utf-8')
+        if isinstance(string, str):
+            msg = string.encode('utf-8')
+        else:
+            msg = string
         total_sent = 0
-        while total_sent < len(msg[total_sent:]):
+        while total_sent < len(msg):
             sent = self.sock.send(msg[total_sent:])
             if sent == 0:
                 raise RuntimeError("socket connection broken")
@@ -45,22 +58,52 @@ class TcpSocket:
 
         - This makes it nicer to display the raw data.
 
-        - Note that the response may end with a partial frame.
+        - See receiveBytes, which avoids the str conversion.
 
         Returns:
             str: The received bytes decoded into a UTF-8 string.
         '''
-        data = bytearray()
-        bytes_recd = 0
-        while bytes_recd < MSGLEN:
-            chunk = self.sock.recv(min(MSGLEN - bytes_recd, 1))
-            if chunk == b'':
-                raise RuntimeError("socket connection broken")
-            data.extend(chunk)
-            bytes_recd = bytes_recd + len(chunk)
-            if 0x3B in chunk:
+        return bytes(self.receiveBytes()).decode("utf-8")
+
+    def receiveBytes(self):
+        '''Receive every complete GridConnect frame that is available.
+
+        Reads in bulk with recv_into on a reusable buffer, so there is one
+        system call per burst rather than one per byte. A trailing partial
+        frame is kept for the next call. The result can be passed straight
+        to CanPhysicalLayerGridConnect.receiveChars.
+
+        - Guarantee: If input is valid, the result ends with ";".
+
+        - If a full buffer holds no ";" (not GridConnect input), it is
+          returned as-is rather than waiting forever.
+
+        Returns:
+            memoryview: The complete frames. It refers to the internal
+                buffer, so it is only valid until the next call.
+        '''
+        # drop what the previous call returned, keeping any partial frame
+        if self.returnedCount > 0:
+            remaining = self.receiveCount - self.returnedCount
+            self.receiveBuffer[:remaining] = \
+                self.receiveBuffer[self.returnedCount:self.receiveCount]
+            self.receiveCount = remaining
+            self.returnedCount = 0
+        searched = 0  # no ";" before this index
+        while True:
+            end = self.receiveBuffer.rfind(0x3B, searched, self.receiveCount)
+            if end >= 0:
+                self.returnedCount = end + 1
+                break
+            if self.receiveCount == len(self.receiveBuffer):
+                self.returnedCount = self.receiveCount
                 break
-        return data.decode("utf-8")
+            searched = self.receiveCount
+            count = self.sock.recv_into(self.receiveView[self.receiveCount:])
+            if count == 0:
+                raise RuntimeError("socket connection broken")
+            self.receiveCount += count
+        return self.receiveView[:self.returnedCount]
 
     def close(self):
         self.sock.close()
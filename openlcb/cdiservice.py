@@ -0,0 +1,509 @@
+'''
+Read a node's Configuration Description Information (CDI) into a model
+of its segments, groups and fields, shared between identical nodes.
+
+The CDI is parsed as it arrives from memory space 0xFF, and the model is
+kept by the node's SNIP manufacturer, model, hardware and software
+version. Another node with the same four values gets the same model
+without reading its CDI. With a cache directory, models are also saved
+there so later sessions skip the read too.
+
+- Create with the ``MemoryService`` to read through, and optionally a
+  directory for the disk cache
+- Call ``requestCdi(_:_:_:)`` with the node and its SNIP; the callback
+  gets a ``CdiModel``, or None if the CDI couldn't be read or parsed
+- Call ``requestConfigurationRead(_:)`` with a
+  ``ConfigurationReadMemo`` to read every value the model describes in
+  as few bulk reads as its layout allows
+'''
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import xml.sax
+
+from openlcb.eventid import EventID
+from openlcb.memoryservice import (
+    MemoryBulkReadMemo,
+    MemoryService,
+)
+
+CDI_SPACE = 0xFF
+CACHE_FORMAT = 1  # version of the saved model layout
+
+# default sizes of the field elements that may omit the size attribute
+FIELD_SIZES = {
+    "int": 1,
+    "eventid": 8,
+    "float": 4,
+    "action": 1,
+}
+FIELD_ELEMENTS = ("int", "string", "eventid", "float", "blob", "action")
+FLOAT_FORMATS = {2: ">e", 4: ">f", 8: ">d"}
+RANGE_GAP = 16  # unused bytes read rather than starting another range
+
+
+class CdiField:
+    """A single configuration value.
+
+    Args:
+        kind (str): The CDI element, such as "int", "string" or "eventid".
+        name (str): Name, or "" if the CDI gives none.
+        description (str): Description, or "" if the CDI gives none.
+        address (int): Address of the value in its segment's space, in the
+            first replica of any enclosing groups.
+        size (int): Size in bytes.
+    """
+    def __init__(self, kind, name, description, address, size):
+        # For args see class docstring.
+        self.kind = kind
+        self.name = name
+        self.description = description
+        self.address = address
+        self.size = size
+
+
+class CdiGroup:
+    """A group of fields and groups, possibly repeated.
+
+    Args:
+        name (str): Name, or "" if the CDI gives none.
+        description (str): Description, or "" if the CDI gives none.
+        address (int): Start of the first replica, within the first
+            replica of any enclosing groups.
+        size (int): Bytes in one replica; replica n starts at
+            address + n * size.
+        replication (int): Number of replicas.
+        children (list[Union[CdiField,CdiGroup]]): Contents, in order.
+    """
+    def __init__(self, name, description, address, size=0, replication=1,
+                 children=None):
+        # For args see class docstring.
+        self.name = name
+        self.description = description
+        self.address = address
+        self.size = size
+        self.replication = replication
+        self.children = [] if children is None else children
+
+
+class CdiSegment:
+    """The part of the CDI describing one memory space.
+
+    Args:
+        name (str): Name, or "" if the CDI gives none.
+        description (str): Description, or "" if the CDI gives none.
+        space (int): Memory space holding the values.
+        origin (int): Address of the first value.
+        children (list[Union[CdiField,CdiGroup]]): Contents, in order.
+    """
+    def __init__(self, name, description, space, origin, children=None):
+        # For args see class docstring.
+        self.name = name
+        self.description = description
+        self.space = space
+        self.origin = origin
+        self.children = [] if children is None else children
+
+
+class CdiModel:
+    """The segments of a CDI.
+
+    Args:
+        segments (list[CdiSegment]): In CDI order.
+    """
+    def __init__(self, segments):
+        self.segments = segments
+
+    def fields(self):
+        """Iterate over every field of every replica.
+
+        Yields:
+            tuple(CdiSegment, CdiField, int): The field's segment, the
+                field and its address in this replica.
+        """
+        def walk(children, shift):
+            # shift: distance from the first replicas to the current ones
+            for child in children:
+                if isinstance(child, CdiGroup):
+                    for n in range(child.replication):
+                        yield from walk(child.children,
+                                        shift + n * child.size)
+                else:
+                    yield child, shift + child.address
+
+        for segment in self.segments:
+            for field, address in walk(segment.children, 0):
+                yield segment, field, address
+
+    def toDict(self):
+        """Return the model as JSON-compatible values."""
+        def convert(child):
+            if isinstance(child, CdiGroup):
+                return {"group": [child.name, child.description,
+                                  child.address, child.size,
+                                  child.replication,
+                                  [convert(c) for c in child.children]]}
+            return {child.kind: [child.name, child.description,
+                                 child.address, child.size]}
+
+        return {"segments": [[s.name, s.description, s.space, s.origin,
+                              [convert(c) for c in s.children]]
+                             for s in self.segments]}
+
+    @staticmethod
+    def fromDict(values):
+        """Rebuild a model from the result of toDict()."""
+        def convert(value):
+            (kind, fields), = value.items()
+            if kind == "group":
+                name, description, address, size, replication, children = \
+                    fields
+                return CdiGroup(name, description, address, size,
+                                replication, [convert(c) for c in children])
+            return CdiField(kind, *fields)
+
+        return CdiModel([CdiSegment(name, description, space, origin,
+                                    [convert(c) for c in children])
+                         for name, description, space, origin, children
+                         in values["segments"]])
+
+
+class CdiValue:
+    """The value of one field in one replica.
+
+    Args:
+        space (int): Memory space.
+        address (int): Address of the value.
+        field (CdiField): What the CDI says about it.
+        value (Union[int,str,EventID,float,bytearray,None]): Decoded by
+            field kind; bytes for "blob" and "action"; None if it couldn't
+            be read or decoded.
+    """
+    def __init__(self, space, address, field, value=None):
+        # For args see class docstring.
+        self.space = space
+        self.address = address
+        self.field = field
+        self.value = value
+
+
+class ConfigurationReadMemo:
+    """A read of every value a CDI model describes, and its result.
+
+    Args:
+        nodeID (NodeID): Node to read.
+        model (CdiModel): The node's CDI.
+        rejectedReply (Callable[ConfigurationReadMemo]): Called if any
+            range can't be read. Values elsewhere are still decoded.
+        dataReply (Callable[ConfigurationReadMemo]): Called once every
+            value has been read and decoded.
+
+    Attributes:
+        values (list[CdiValue]): One per field per replica, in CDI order.
+        ranges (list[tuple(int, int, int)]): The (space, address, length)
+            ranges read.
+        failedRanges (int): Ranges that couldn't be read.
+    """
+    def __init__(self, nodeID, model, rejectedReply, dataReply):
+        # For args see class docstring.
+        self.nodeID = nodeID
+        self.model = model
+        self.rejectedReply = rejectedReply
+        self.dataReply = dataReply
+        self.values = []
+        self.ranges = []
+        self.failedRanges = 0
+
+
+def planRanges(values, gap=RANGE_GAP):
+    """Cover values with the fewest ranges per space, merging ranges that
+    touch, overlap or are at most gap bytes apart.
+
+    Args:
+        values (list[CdiValue]): What to read.
+        gap (int, optional): Most unused bytes between merged values.
+
+    Returns:
+        list[list]: [space, address, length, values] per range, values
+            sorted by address.
+    """
+    ranges = []
+    for value in sorted(values, key=lambda v: (v.space, v.address)):
+        end = value.address + value.field.size
+        if ranges:
+            last = ranges[-1]
+            if (last[0] == value.space
+                    and value.address <= last[1] + last[2] + gap):
+                last[2] = max(last[2], end - last[1])
+                last[3].append(value)
+                continue
+        ranges.append([value.space, value.address, value.field.size,
+                       [value]])
+    return ranges
+
+
+class CdiHandler(xml.sax.handler.ContentHandler):
+    """SAX handler that builds a CdiModel, tracking addresses as it goes.
+
+    Attributes:
+        segments (list[CdiSegment]): The segments parsed so far.
+    """
+    def __init__(self):
+        super().__init__()
+        self.segments = []
+        self.stack = []  # model object for each open element, else None
+        self.addresses = []  # next address in each open segment or group
+        self.text = []
+
+    def startElement(self, name, attrs):
+        self.text = []
+        item = None
+        if name == "segment":
+            if "space" not in attrs:
+                raise xml.sax.SAXException("<segment> without a space")
+            origin = int(attrs.get("origin", 0))
+            item = CdiSegment("", "", int(attrs["space"]), origin)
+            self.segments.append(item)
+            self.addresses.append(origin)
+        elif self.addresses and (name == "group" or name in FIELD_ELEMENTS):
+            address = self.addresses[-1] + int(attrs.get("offset", 0))
+            if name == "group":
+                item = CdiGroup("", "", address, 0,
+                                int(attrs.get("replication", 1)))
+                self.addresses.append(address)
+            else:
+                size = int(attrs.get("size", FIELD_SIZES.get(name, 0)))
+                item = CdiField(name, "", "", address, size)
+                self.addresses[-1] = address + size
+            if self.stack[-1] is None:
+                raise xml.sax.SAXException(
+                    "<{}> not directly in a segment or group".format(name))
+            self.stack[-1].children.append(item)
+        self.stack.append(item)
+
+    def endElement(self, name):
+        item = self.stack.pop()
+        if name == "segment":
+            self.addresses.pop()
+        elif isinstance(item, CdiGroup):
+            item.size = self.addresses.pop() - item.address
+            self.addresses[-1] = item.address + item.size * item.replication
+        elif name in ("name", "description") and self.stack:
+            parent = self.stack[-1]
+            if parent is not None and not getattr(parent, name):
+                setattr(parent, name, "".join(self.text).strip())
+        self.text = []
+
+    def characters(self, content):
+        self.text.append(content)
+
+    def model(self):
+        """Return the model parsed."""
+        return CdiModel(self.segments)
+
+
+class CdiService:
+    """Read CDI models, sharing them between nodes with the same SNIP
+    identification.
+
+    Args:
+        memoryService (MemoryService): Where CDI reads are sent.
+        cacheDirectory (str, optional): Directory in which models are
+            saved and looked up. None keeps them in memory only.
+
+    Attributes:
+        models (dict): Cache key (manufacturer, model, hardware version,
+            software version) to CdiModel.
+        downloads (int): CDIs read from nodes.
+    """
+
+    def __init__(self, memoryService, cacheDirectory=None):
+        self.memoryService = memoryService
+        self.cacheDirectory = cacheDirectory
+        self.models = {}
+        self.waiting = {}  # key (or NodeID if uncacheable) to callbacks
+        self.downloads = 0
+
+    @staticmethod
+    def cacheKey(snip):
+        """Key under which a node's CDI is shared, or None if its SNIP
+        doesn't identify the product well enough to share it."""
+        if snip is None or not (snip.manufacturerName and snip.modelName):
+            return None
+        return (snip.manufacturerName, snip.modelName, snip.hardwareVersion,
+                snip.softwareVersion)
+
+    def requestCdi(self, nodeID, snip, callback):
+        """Get the CDI model of a node, from the cache if possible.
+
+        Args:
+            nodeID (NodeID): The node.
+            snip (SNIP): The node's SNIP, or None if not known.
+            callback (Callable[Optional[CdiModel]]): Gets the model, or
+                None if it couldn't be read or parsed. Called before
+                returning if the model is cached.
+        """
+        key = self.cacheKey(snip)
+        if key is not None:
+            model = self.models.get(key)
+            if model is None:
+                model = self.loadModel(key)
+                if model is not None:
+                    self.models[key] = model
+            if model is not None:
+                callback(model)
+                return
+        waitKey = nodeID if key is None else key
+        callbacks = self.waiting.get(waitKey)
+        if callbacks is not None:
+            callbacks.append(callback)  # already reading it
+            return
+        self.waiting[waitKey] = [callback]
+        self.download(nodeID, key, waitKey)
+
+    def download(self, nodeID, key, waitKey):
+        """Read and parse the CDI of a node, feeding the parser each chunk
+        as it arrives."""
+        self.downloads += 1
+        handler = CdiHandler()
+        parser = xml.sax.make_parser()
+        parser.setFeature(xml.sax.handler.feature_external_ges, False)
+        parser.setContentHandler(handler)
+        fed = [0]  # bytes of memo.data given to the parser
+        failed = [False]
+
+        def feed(memo):
+            if failed[0]:
+                return
+            try:
+                parser.feed(bytes(memo.data[fed[0]:]))
+            except (xml.sax.SAXException, ValueError) as ex:
+                logging.error("CDI from {} doesn't parse: {}"
+                              "".format(nodeID, ex))
+                failed[0] = True
+            fed[0] = len(memo.data)
+
+        def finished(memo):
+            model = None
+            if not failed[0]:
+                try:
+                    parser.close()
+                    model = handler.model()
+                except (xml.sax.SAXException, ValueError) as ex:
+                    logging.error("CDI from {} doesn't parse: {}"
+                                  "".format(nodeID, ex))
+            if model is not None and key is not None:
+                self.models[key] = model
+                self.saveModel(key, model)
+            self.finish(waitKey, model)
+
+        def rejected(memo):
+            logging.error("CDI read from {} failed".format(nodeID))
+            self.finish(waitKey, None)
+
+        self.memoryService.requestMemoryBulkRead(MemoryBulkReadMemo(
+            nodeID, CDI_SPACE, 0, None, rejected, finished, feed))
+
+    def requestConfigurationRead(self, memo):
+        """Read every value in a model, as a few bulk reads covering
+        neighboring values together, then decode them all.
+
+        Args:
+            memo (ConfigurationReadMemo): The node and model; gets the
+                values.
+        """
+        memo.values = [CdiValue(segment.space, address, field)
+                       for segment, field, address in memo.model.fields()
+                       if field.size > 0]
+        ranges = planRanges(memo.values)
+        memo.ranges = [(space, address, length)
+                       for space, address, length, _ in ranges]
+        remaining = [len(ranges)]
+
+        def rangeDone(bulk, values, failed):
+            memo.failedRanges += failed
+            for value in values:
+                offset = value.address - bulk.address
+                value.value = self.decodeValue(
+                    value.field,
+                    bulk.data[offset:offset + value.field.size])
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                if memo.failedRanges:
+                    memo.rejectedReply(memo)
+                else:
+                    memo.dataReply(memo)
+
+        if not ranges:
+            memo.dataReply(memo)
+            return
+        for space, address, length, values in ranges:
+            self.memoryService.requestMemoryBulkRead(MemoryBulkReadMemo(
+                memo.nodeID, space, address, length,
+                lambda bulk, values=values: rangeDone(bulk, values, 1),
+                lambda bulk, values=values: rangeDone(bulk, values, 0)))
+
+    def decodeValue(self, field, data):
+        """Decode one field's bytes by its kind, or return None if there are
+        too few of them or they don't decode."""
+        if len(data) < field.size:
+            return None
+        if field.kind == "int":
+            return self.memoryService.arrayToInt(data)
+        if field.kind == "string":
+            try:
+                return MemoryService.arrayToString(data, field.size)
+            except UnicodeDecodeError:
+                return None
+        if field.kind == "eventid" and field.size == 8:
+            return EventID(data)
+        if field.kind == "float" and field.size in FLOAT_FORMATS:
+            return struct.unpack(FLOAT_FORMATS[field.size], data)[0]
+        return data
+
+    def finish(self, waitKey, model):
+        for callback in self.waiting.pop(waitKey, ()):
+            callback(model)
+
+    def cachePath(self, key):
+        name = hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cacheDirectory, name + ".json")
+
+    def loadModel(self, key):
+        """Return the model saved for a key, or None."""
+        if self.cacheDirectory is None:
+            return None
+        path = self.cachePath(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as stream:
+                values = json.load(stream)
+            if (values.get("format") != CACHE_FORMAT
+                    or tuple(values.get("key", ())) != key):
+                return None
+            return CdiModel.fromDict(values)
+        except (OSError, ValueError, KeyError, TypeError) as ex:
+            logging.warning("Ignoring CDI cache file {}: {}"
+                            "".format(path, ex))
+            return None
+
+    def saveModel(self, key, model):
+        """Save a model for a key, replacing the file in one step."""
+        if self.cacheDirectory is None:
+            return
+        path = self.cachePath(key)
+        values = model.toDict()
+        values["format"] = CACHE_FORMAT
+        values["key"] = list(key)
+        try:
+            os.makedirs(self.cacheDirectory, exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as stream:
+                json.dump(values, stream)
+            os.replace(path + ".tmp", path)
+        except OSError as ex:
+            logging.warning("Couldn't save CDI cache file {}: {}"
+                            "".format(path, ex))
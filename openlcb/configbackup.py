@@ -0,0 +1,266 @@
+'''
+Back up and restore the configuration memory of many nodes at once.
+
+- Create with the ``MemoryService`` to read and write through
+- ``backup(_:_:_:)`` reads space 0xFD of each node, several nodes at a
+  time, and saves one snapshot file per node in a directory
+- ``restore(_:_:)`` reads each snapshot's node again and writes back
+  only the ranges that differ from the snapshot
+- Both call their ``done`` callback with a ``ConfigJob`` per node once
+  all have finished; a job's ``error`` is None if it succeeded
+
+``nodesWithConfiguration(_:)`` lists the nodes of a ``RemoteNodeStore``
+that advertise the Memory Configuration protocol, for backing up a whole
+layout.
+
+A snapshot file is a 19-byte header (the SNAPSHOT_MAGIC marker, the node
+ID, the space and the start address) followed by the memory contents.
+'''
+
+import logging
+import os
+
+from openlcb.jobrunner import JobRunner
+from openlcb.memoryservice import (
+    MemoryBulkReadMemo,
+    MemoryWriteMemo,
+)
+from openlcb.memorywritebuffer import MemoryWriteBuffer
+from openlcb.nodeid import NodeID
+from openlcb.pip import PIP
+
+CONFIG_SPACE = 0xFD
+MAX_NODES_IN_FLIGHT = 8  # default nodes being read or written at once
+RESTORE_GAP = 4  # unchanged bytes rewritten rather than split a write
+SNAPSHOT_MAGIC = b"OLCBCFG1"
+SNAPSHOT_SUFFIX = ".cfg"
+
+
+class ConfigSnapshot:
+    """The contents of one node's memory space.
+
+    Args:
+        nodeID (NodeID): The node.
+        space (int): The memory space.
+        address (int): Address of the first byte.
+        data (bytearray): The contents.
+    """
+    def __init__(self, nodeID, space, address, data):
+        # For args see class docstring.
+        self.nodeID = nodeID
+        self.space = space
+        self.address = address
+        self.data = data
+
+    def save(self, path):
+        """Write the snapshot to a file, replacing it in one step."""
+        with open(path + ".tmp", "wb") as stream:
+            stream.write(SNAPSHOT_MAGIC + self.nodeID.toArray()
+                         + bytes([self.space])
+                         + self.address.to_bytes(4, "big") + self.data)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load(path):
+        """Read a snapshot file.
+
+        Raises:
+            ValueError: If the file isn't a snapshot.
+        """
+        with open(path, "rb") as stream:
+            content = stream.read()
+        if len(content) < 19 or not content.startswith(SNAPSHOT_MAGIC):
+            raise ValueError("{} is not a configuration snapshot"
+                             "".format(path))
+        return ConfigSnapshot(NodeID(bytearray(content[8:14])), content[14],
+                              int.from_bytes(content[15:19], "big"),
+                              bytearray(content[19:]))
+
+
+class ConfigJob:
+    """The backup or restore of one node.
+
+    Args:
+        nodeID (NodeID): The node.
+        path (str): Its snapshot file.
+
+    Attributes:
+        snapshot (ConfigSnapshot): What was read (backup) or written
+            (restore).
+        error (str): Why the job failed, or None.
+        rangesWritten (int): Changed ranges written by a restore.
+        bytesWritten (int): Bytes written by a restore.
+    """
+    def __init__(self, nodeID, path):
+        # For args see class docstring.
+        self.nodeID = nodeID
+        self.path = path
+        self.snapshot = None
+        self.error = None
+        self.rangesWritten = 0
+        self.bytesWritten = 0
+
+
+def diffRanges(old, new, gap=RESTORE_GAP):
+    """Find where new differs from old.
+
+    Args:
+        old (bytearray): Current contents; may be shorter than new.
+        new (bytearray): Wanted contents.
+        gap (int, optional): Most equal bytes between two differences
+            that are still covered by one range.
+
+    Returns:
+        list[tuple(int, int)]: (start, end) offsets of the ranges to write.
+    """
+    ranges = []
+    for index in range(len(new)):
+        if index < len(old) and old[index] == new[index]:
+            continue
+        if ranges and index - ranges[-1][1] <= gap:
+            ranges[-1][1] = index + 1
+        else:
+            ranges.append([index, index + 1])
+    return [tuple(r) for r in ranges]
+
+
+class ConfigBackup:
+    """Back up and restore configuration memory, a limited number of
+    nodes at a time.
+
+    Args:
+        memoryService (MemoryService): Where reads and writes are sent.
+        maxInFlight (int, optional): Most nodes being handled at once.
+
+    Attributes:
+        jobs (JobRunner): Runs the jobs of a backup or restore.
+    """
+
+    def __init__(self, memoryService, maxInFlight=MAX_NODES_IN_FLIGHT):
+        self.memoryService = memoryService
+        self.jobs = JobRunner(maxInFlight)
+
+    @staticmethod
+    def nodesWithConfiguration(store):
+        """Return the IDs of the nodes in a NodeStore that advertise the
+        Memory Configuration protocol."""
+        return [node.id for node in
+                store.query(pip=PIP.MEMORY_CONFIGURATION_PROTOCOL)]
+
+    @staticmethod
+    def snapshotPath(directory, nodeID):
+        return os.path.join(directory, str(nodeID) + SNAPSHOT_SUFFIX)
+
+    def backup(self, nodeIDs, directory, done):
+        """Save the configuration memory of each node to directory.
+
+        Args:
+            nodeIDs (list[NodeID]): Nodes to back up.
+            directory (str): Where to put the snapshot files.
+            done (Callable[list[ConfigJob]]): Called once every node has
+                been backed up or has failed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        jobs = [ConfigJob(nodeID, self.snapshotPath(directory, nodeID))
+                for nodeID in nodeIDs]
+        self.runJobs(jobs, self.startBackup, done, "backup")
+
+    def restore(self, paths, done):
+        """Write back snapshots, changing only the bytes that differ from
+        each node's current memory.
+
+        Args:
+            paths (list[str]): Snapshot files.
+            done (Callable[list[ConfigJob]]): Called once every snapshot
+                has been restored or has failed.
+        """
+        jobs = []
+        for path in paths:
+            try:
+                snapshot = ConfigSnapshot.load(path)
+            except (OSError, ValueError) as ex:
+                job = ConfigJob(None, path)
+                job.error = str(ex)
+            else:
+                job = ConfigJob(snapshot.nodeID, path)
+                job.snapshot = snapshot
+            jobs.append(job)
+        self.runJobs(jobs, self.startRestore, done, "restore")
+
+    def runJobs(self, jobs, start, done, kind):
+        """Queue jobs, calling done once all have finished."""
+        def finishing(job):
+            if job.error is not None:
+                logging.warning("Configuration {} of {} failed: {}"
+                                "".format(kind, job.nodeID, job.error))
+
+        self.jobs.run(jobs, start, done, finishing)
+
+    def startBackup(self, job, finished):
+        """Find the extent of the node's configuration space, then read it
+        all and save it."""
+        def spaceInfoReply(info):
+            if info is None or not info.present:
+                job.error = "no configuration space"
+                finished(job)
+                return
+            length = info.highestAddress - info.lowAddress + 1
+            self.memoryService.requestMemoryBulkRead(MemoryBulkReadMemo(
+                job.nodeID, CONFIG_SPACE, info.lowAddress, length,
+                readFailed, readDone))
+
+        def readFailed(memo):
+            job.error = "read failed at 0x{:X}".format(
+                memo.address + len(memo.data))
+            finished(job)
+
+        def readDone(memo):
+            job.snapshot = ConfigSnapshot(job.nodeID, CONFIG_SPACE,
+                                          memo.address, memo.data)
+            try:
+                job.snapshot.save(job.path)
+            except OSError as ex:
+                job.error = str(ex)
+            finished(job)
+
+        self.memoryService.requestSpaceInfo(CONFIG_SPACE, job.nodeID,
+                                            spaceInfoReply)
+
+    def startRestore(self, job, finished):
+        """Read the node's current contents, then write the ranges that
+        differ from the snapshot."""
+        snapshot = job.snapshot
+
+        def readFailed(memo):
+            job.error = "read failed at 0x{:X}".format(
+                memo.address + len(memo.data))
+            finished(job)
+
+        def readDone(memo):
+            ranges = diffRanges(memo.data, snapshot.data)
+            if not ranges:
+                finished(job)
+                return
+            remaining = [len(ranges)]
+
+            def written(memo, failed):
+                if failed and job.error is None:
+                    job.error = "write failed at 0x{:X}".format(memo.address)
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    finished(job)
+
+            buffer = MemoryWriteBuffer(self.memoryService, None)
+            for start, end in ranges:
+                job.rangesWritten += 1
+                job.bytesWritten += end - start
+                buffer.requestMemoryWrite(MemoryWriteMemo(
+                    job.nodeID, lambda memo: written(memo, False),
+                    lambda memo: written(memo, True), end - start,
+                    snapshot.space, snapshot.address + start,
+                    snapshot.data[start:end]))
+            buffer.commit()
+
+        self.memoryService.requestMemoryBulkRead(MemoryBulkReadMemo(
+            job.nodeID, snapshot.space, snapshot.address,
+            len(snapshot.data), readFailed, readDone))
@@ -8,6 +8,17 @@ Provide a service interface for reading and writing Datagrams.
 Writes to remote node:
 - Create a ``DatagramWriteMemo`` and submit via ``sendDatagram(_:)``
 - Get an OK or NotOK callback
+- One datagram is outstanding per destination node at a time; others to
+  the same node wait in order. Up to ``maxInFlight`` destinations are
+  written in parallel.
+- A datagram rejected with a temporary error is resent after a delay
+  that doubles each time, up to ``maxRetries`` times.
+- If no reply arrives within ``replyTimeout`` the NotOK callback is made,
+  so a silent node doesn't stall others. ``checkTimeouts()`` is called
+  as messages are processed; call it periodically too if the link can
+  go quiet.
+- The memo passed to the NotOK callback carries ``errorCode`` and
+  ``reason``.
 
 Reads from remote node:
 - One or more listeners register via ``registerDatagramReceivedListener(_:)``
@@ -22,12 +33,21 @@ Handles link quiesce/restart so that higher level services don't have to.
 2) Once the link has been quiesced, datagrams are held until it's restarted
 '''
 
+from collections import deque
 from enum import Enum
 import logging
+import time
 
 from openlcb.message import Message
 from openlcb.mti import MTI
 
+MAX_IN_FLIGHT = 16  # default limit on datagrams awaiting a reply at once
+REPLY_TIMEOUT = 3.0  # default seconds to wait for OK or Rejected
+MAX_RETRIES = 3  # default resends after temporary errors
+RETRY_DELAY = 0.25  # default seconds before the first resend; then doubles
+REPLY_PENDING = 0x80  # Datagram_Received_OK flag: a reply datagram follows
+TIMEOUT_EXPONENT = 0x0F  # Datagram_Received_OK: reply due within 2^N s
+
 
 def defaultIgnoreReply(memo):
     '''default handling of reply does nothing'''
@@ -35,8 +55,17 @@ def defaultIgnoreReply(memo):
 
 
 class DatagramWriteMemo:
-    '''Immutable memo carrying write request and two reply callbacks.
+    '''Memo carrying write request and two reply callbacks.
     Source is automatically this node.
+
+    Attributes:
+        errorCode (int): The error code from a Datagram_Rejected reply, or
+            None if there was none (such as a timeout).
+        reason (str): Why rejectedReply was called, for logging.
+        retries (int): Times resent after temporary errors.
+        flags (int): The flags byte of the Datagram_Received_OK reply,
+            such as REPLY_PENDING, set before okReply is called; None if
+            the reply had none.
     '''
     def __init__(self, destID, data, okReply=defaultIgnoreReply,
                  rejectedReply=defaultIgnoreReply):
@@ -47,6 +76,12 @@ class DatagramWriteMemo:
         self.data = data
         self.okReply = okReply
         self.rejectedReply = rejectedReply
+        self.errorCode = None
+        self.reason = None
+        self.retries = 0
+        self.flags = None
+        self.replyDeadline = None  # clock time to give up waiting
+        self.resendTime = None  # clock time to resend, if waiting to
 
     def __eq__(lhs, rhs):
         if lhs.destID != rhs.destID:
@@ -78,6 +113,23 @@ class DatagramService:
     Args:
         linkLayer (CanLink): Could actually be any link layer such as
             LinkMockLayer (for testing) or CanLink.
+
+    Attributes:
+        outstandingMemos (dict): destination NodeID to the DatagramWriteMemo
+            sent to it and awaiting a reply.
+        pendingWriteMemos (dict): destination NodeID to a deque of the
+            DatagramWriteMemos waiting to be sent to it.
+        waitingDestinations (deque): destinations with pending memos and
+            none outstanding, in the order they became ready to send.
+        maxInFlight (int): Most datagrams outstanding at once, across
+            all destinations.
+        replyTimeout (float): Seconds to wait for a reply.
+        maxRetries (int): Most resends of a datagram after temporary
+            errors.
+        retryDelay (float): Seconds before the first resend; doubles with
+            each further resend.
+        clock (Callable): Returns the current time in seconds;
+            time.monotonic unless replaced for testing.
     """
 
     class ProtocolID(Enum):
@@ -95,8 +147,14 @@ class DatagramService:
     def __init__(self, linkLayer):
         self.linkLayer = linkLayer
         self.quiesced = False
-        self.currentOutstandingMemo = None
-        self.pendingWriteMemos = []
+        self.outstandingMemos = {}
+        self.pendingWriteMemos = {}
+        self.waitingDestinations = deque()
+        self.maxInFlight = MAX_IN_FLIGHT
+        self.replyTimeout = REPLY_TIMEOUT
+        self.maxRetries = MAX_RETRIES
+        self.retryDelay = RETRY_DELAY
+        self.clock = time.monotonic
         self.listeners = []
 
     def datagramType(self, data):
@@ -134,21 +192,32 @@ class DatagramService:
     def sendDatagram(self, memo):
         '''Queue a ``DatagramWriteMemo`` to send a datagram to another node
         on the network.
+
+        It is sent right away unless a datagram to the same node is
+        awaiting its reply, maxInFlight datagrams are, or the link is
+        quiesced.
         '''
         # Make a record of memo for reply
-        self.pendingWriteMemos.append(memo)
+        memo.retries = 0
+        destID = memo.destID
+        queue = self.pendingWriteMemos.get(destID)
+        if queue is None:
+            queue = deque()
+            self.pendingWriteMemos[destID] = queue
+            if destID not in self.outstandingMemos:
+                self.waitingDestinations.append(destID)
+        queue.append(memo)
 
-        # can only have one outstanding at a time, so check it there was
-        # already one there.
-        if len(self.pendingWriteMemos) == 1:
-            self.sendDatagramMessage(memo)
+        self.sendNextDatagramFromQueue()
 
     def sendDatagramMessage(self, memo):
         '''Send datagram message'''
         message = Message(MTI.Datagram, self.linkLayer.localNodeID,
                           memo.destID, memo.data)
+        memo.replyDeadline = self.clock() + self.replyTimeout
+        memo.resendTime = None
+        self.outstandingMemos[memo.destID] = memo
         self.linkLayer.sendMessage(message)
-        self.currentOutstandingMemo = memo
 
     def registerDatagramReceivedListener(self, listener):
         '''Register a listener to be notified when each datagram arrives.
@@ -180,6 +249,9 @@ class DatagramService:
                 actions brought by that datagram that does.
         '''
         # Check that it's to us or a global (for link layer up)
+        if self.outstandingMemos:
+            self.checkTimeouts()
+
         if not (message.isGlobal()
                 or self.checkDestID(message, self.linkLayer.localNodeID)):
             return False
@@ -207,32 +279,38 @@ class DatagramService:
         '''OK reply to write'''
         # match to the memo and remove from queue
         memo = self.matchToWriteMemo(message)
+        if memo is None:
+            return
 
-        # check of tracking logic
-        if self.currentOutstandingMemo != memo:
-            logging.error(
-                "Outstanding and replied-to memos don't match on OK reply"
-            )
-
-        self.currentOutstandingMemo = None
-
-        # fire the callback
+        # fire the callback, with the flags for the reply to come
+        memo.flags = message.data[0] if len(message.data) > 0 else None
         memo.okReply(memo)
 
         self.sendNextDatagramFromQueue()
 
     def handleDatagramRejected(self, message):
-        '''Not OK reply to write'''
+        '''Not OK reply to write; resend later if the error is temporary'''
+        errorCode = 0
+        if len(message.data) >= 2:
+            errorCode = (message.data[0] << 8) | message.data[1]
+        memo = self.outstandingMemos.get(message.source)
+        if (memo is not None and errorCode & 0x2000 != 0
+                and memo.retries < self.maxRetries):
+            # temporary error, resend OK: try again after a delay
+            delay = self.retryDelay * (2 ** memo.retries)
+            memo.retries += 1
+            memo.resendTime = self.clock() + delay
+            logging.info("Datagram to {} rejected with temporary error"
+                         " 0x{:04X}, resending in {} s"
+                         "".format(memo.destID, errorCode, delay))
+            return
+
         # match to the memo and remove from queue
         memo = self.matchToWriteMemo(message)
-
-        # check of tracking logic
-        if self.currentOutstandingMemo != memo:
-            logging.error(
-                "Outstanding and replied-to memos don't match on rejected"
-            )
-
-        self.currentOutstandingMemo = None
+        if memo is None:
+            return
+        memo.errorCode = errorCode
+        memo.reason = "rejected with error 0x{:04X}".format(errorCode)
 
         # fire the callback
         memo.rejectedReply(memo)
@@ -248,36 +326,74 @@ class DatagramService:
         if write datagram(s) pending reply, resend them
         '''
         self.quiesced = False
-        if self.currentOutstandingMemo is not None:
-            # there's a current outstanding memo to repeat
-            logging.info("Retrying datagram after restart")
-            self.sendDatagramMessage(self.currentOutstandingMemo)
-            return
-        else:
-            # are there any queued datagrams? If so, send first
-            if len(self.pendingWriteMemos) > 0:
-                self.sendNextDatagramFromQueue()
+        if self.outstandingMemos:
+            # there are outstanding memos to repeat
+            logging.info("Retrying {} datagram(s) after restart"
+                         "".format(len(self.outstandingMemos)))
+            for memo in list(self.outstandingMemos.values()):
+                self.sendDatagramMessage(memo)
+        # are there any queued datagrams? If so, send them
+        self.sendNextDatagramFromQueue()
 
     def matchToWriteMemo(self, message):
-        for memo in self.pendingWriteMemos:
-            if memo.destID != message.source:
-                continue  # keep looking
-            # remove the found element - might need a try/except on this
-            index = self.pendingWriteMemos.index(memo)
-            del self.pendingWriteMemos[index]
+        '''Find and remove the memo a reply message is for.
 
-            return memo
+        Returns:
+            DatagramWriteMemo: The memo outstanding to the reply's source,
+                or None if there is none.
+        '''
+        memo = self.outstandingMemos.pop(message.source, None)
+        if memo is None:
+            # did not find one
+            logging.error("Did not match memo to message {}"
+                          "".format(message))
+            return None  # this will prevent further processing
+        # the next datagram to that node can go now
+        if message.source in self.pendingWriteMemos:
+            self.waitingDestinations.append(message.source)
+        return memo
+
+    def checkTimeouts(self, now=None):
+        '''Resend datagrams whose retry delay has passed, and fail those
+        that have waited replyTimeout for a reply.
+
+        Called from process(); call it periodically as well so timeouts
+        are noticed when no messages arrive. Does nothing while the link
+        is quiesced.
 
-        # did not find one
-        logging.error("Did not match memo to message {}"
-                      "".format(message))
-        return None  # this will prevent further processing
+        Args:
+            now (float, optional): The current clock() value.
+        '''
+        if self.quiesced:
+            return
+        if now is None:
+            now = self.clock()
+        for destID, memo in list(self.outstandingMemos.items()):
+            if memo.resendTime is not None:
+                if now >= memo.resendTime:
+                    self.sendDatagramMessage(memo)
+            elif now >= memo.replyDeadline:
+                del self.outstandingMemos[destID]
+                if destID in self.pendingWriteMemos:
+                    self.waitingDestinations.append(destID)
+                memo.errorCode = None
+                memo.reason = "no reply within {} s".format(self.replyTimeout)
+                logging.warning("Datagram to {} failed: {}"
+                                "".format(destID, memo.reason))
+                memo.rejectedReply(memo)
+        self.sendNextDatagramFromQueue()
 
     def sendNextDatagramFromQueue(self):
-        # is there a next datagram request?
-        if len(self.pendingWriteMemos) > 0:
-            # yes, get it, process it
-            memo = self.pendingWriteMemos[0]
+        '''Send queued datagrams to waiting destinations, oldest first,
+        while fewer than maxInFlight are outstanding.
+        '''
+        while (self.waitingDestinations and not self.quiesced
+               and len(self.outstandingMemos) < self.maxInFlight):
+            destID = self.waitingDestinations.popleft()
+            queue = self.pendingWriteMemos[destID]
+            memo = queue.popleft()
+            if not queue:
+                del self.pendingWriteMemos[destID]
             self.sendDatagramMessage(memo)
 
     def positiveReplyToDatagram(self, dg, flags=0):
@@ -0,0 +1,236 @@
+'''
+Pace the requests that learn about newly seen remote nodes.
+
+Asking every node for its PIP, SNIP and events as soon as it is seen
+floods a large layout after a global Verify Node ID: the replies arrive
+at once, overflowing reassembly, and slow nodes drop requests. Instead:
+
+- Create with the link layer, and give it to ``RemoteNodeProcessor``,
+  whose ``newNodeSeen`` then calls ``discover(_:)``
+- Feed messages to ``process(_:)`` so replies are seen, and call
+  ``checkTimeouts()`` periodically, to send paced requests and retry
+  those that got no reply
+- At most ``maxInFlight`` requests await replies at once, sent at least
+  ``interval`` seconds apart. PIP and SNIP requests of every waiting
+  node go before any event enumeration, so node names appear first.
+- ``progress`` is called each time a node has finished; ``nodesDone``,
+  ``nodesSeen`` and ``discoveryTime()`` report how far discovery has got.
+
+A node answers Identify Events with one Identified message per event,
+so that request holds its slot until the replies have stopped for
+``eventsQuiet``, keeping the event floods of several nodes apart. A node
+with no events doesn't answer at all, so the request also ends, without
+retrying, if nothing comes within ``eventsTimeout``; and it isn't sent
+to a node whose PIP lacks the Event Exchange protocol.
+'''
+
+import heapq
+import logging
+import time
+
+from openlcb.message import Message
+from openlcb.mti import MTI
+from openlcb.pip import PIP
+
+MAX_IN_FLIGHT = 4  # default requests awaiting replies at once
+INTERVAL = 0.02  # default least seconds between requests
+REPLY_TIMEOUT = 2.0  # default seconds to wait for a reply
+RETRIES = 2  # default times a PIP or SNIP request is resent
+EVENTS_TIMEOUT = 0.5  # default seconds to wait for a first event reply
+EVENTS_QUIET = 0.1  # default seconds without event replies that end them
+
+# request kinds, in priority order
+PIP_REQUEST = 0
+SNIP_REQUEST = 1
+EVENTS_REQUEST = 2
+
+REQUEST_MTIS = {
+    PIP_REQUEST: MTI.Protocol_Support_Inquiry,
+    SNIP_REQUEST: MTI.Simple_Node_Ident_Info_Request,
+    EVENTS_REQUEST: MTI.Identify_Events_Addressed,
+}
+
+REPLY_KINDS = {
+    MTI.Protocol_Support_Reply: PIP_REQUEST,
+    MTI.Simple_Node_Ident_Info_Reply: SNIP_REQUEST,
+    MTI.Producer_Identified_Active: EVENTS_REQUEST,
+    MTI.Producer_Identified_Inactive: EVENTS_REQUEST,
+    MTI.Producer_Identified_Unknown: EVENTS_REQUEST,
+    MTI.Consumer_Identified_Active: EVENTS_REQUEST,
+    MTI.Consumer_Identified_Inactive: EVENTS_REQUEST,
+    MTI.Consumer_Identified_Unknown: EVENTS_REQUEST,
+}
+
+
+class DiscoveryScheduler:
+    """Send discovery requests to new nodes at a limited rate.
+
+    Args:
+        linkLayer (LinkLayer): Link to send requests through.
+        maxInFlight (int, optional): Most requests awaiting replies.
+        interval (float, optional): Least seconds between requests.
+
+    Attributes:
+        replyTimeout (float): Seconds to wait for a reply.
+        retries (int): Times a PIP or SNIP request without a reply is
+            resent before giving up on it.
+        eventsTimeout (float): Seconds to wait for the first reply to
+            Identify Events.
+        eventsQuiet (float): Seconds after an event reply without another
+            that end the Identify Events request.
+        clock (Callable): Returns the current time in seconds;
+            time.monotonic unless replaced for testing.
+        progress (Callable[DiscoveryScheduler]): Called each time a node
+            has finished, or None.
+        nodesSeen (int): Nodes given to discover.
+        nodesDone (int): Nodes whose requests have all finished.
+        failed (list[tuple(NodeID, int)]): Requests given up on, by node
+            and kind.
+        startTime (float): clock() value of the first discover call, or
+            None.
+        endTime (float): clock() value when the last node finished, or
+            None while discovery is going on.
+    """
+
+    def __init__(self, linkLayer, maxInFlight=MAX_IN_FLIGHT,
+                 interval=INTERVAL):
+        self.linkLayer = linkLayer
+        self.maxInFlight = maxInFlight
+        self.interval = interval
+        self.replyTimeout = REPLY_TIMEOUT
+        self.retries = RETRIES
+        self.eventsTimeout = EVENTS_TIMEOUT
+        self.eventsQuiet = EVENTS_QUIET
+        self.clock = time.monotonic
+        self.progress = None
+        self.queue = []  # heap of (kind, sequence, nodeID, tries)
+        self.sequence = 0  # keeps the heap first in, first out per kind
+        self.inFlight = {}  # (nodeID, kind) to (deadline, tries)
+        self.remaining = {}  # NodeID to its requests not yet finished
+        self.pips = {}  # NodeID to its PIP set, once replied
+        self.nextSendTime = 0.0
+        self.nodesSeen = 0
+        self.nodesDone = 0
+        self.failed = []
+        self.startTime = None
+        self.endTime = None
+
+    def discover(self, nodeID):
+        """Queue the PIP, SNIP and Identify Events requests for a node,
+        unless they are already queued or being sent.
+
+        Args:
+            nodeID (NodeID): The newly seen node.
+        """
+        if nodeID in self.remaining:
+            return
+        if self.startTime is None or self.endTime is not None:
+            self.startTime = self.clock()
+            self.endTime = None
+        self.nodesSeen += 1
+        self.remaining[nodeID] = len(REQUEST_MTIS)
+        for kind in REQUEST_MTIS:
+            self.enqueue(nodeID, kind, 0)
+        self.sendRequests()
+
+    def enqueue(self, nodeID, kind, tries):
+        heapq.heappush(self.queue, (kind, self.sequence, nodeID, tries))
+        self.sequence += 1
+
+    def sendRequests(self, now=None):
+        """Send queued requests while there is room and the interval since
+        the last one has passed."""
+        if now is None:
+            now = self.clock()
+        while (self.queue and len(self.inFlight) < self.maxInFlight
+                and now >= self.nextSendTime):
+            kind, _, nodeID, tries = heapq.heappop(self.queue)
+            timeout = self.replyTimeout
+            if kind == EVENTS_REQUEST:
+                pips = self.pips.get(nodeID)
+                if (pips is not None
+                        and PIP.EVENT_EXCHANGE_PROTOCOL not in pips):
+                    self.finish(nodeID, kind)  # it has no events to ask
+                    continue
+                timeout = self.eventsTimeout
+            self.inFlight[(nodeID, kind)] = (now + timeout, tries + 1)
+            self.nextSendTime = now + self.interval
+            self.linkLayer.sendMessage(Message(
+                REQUEST_MTIS[kind], self.linkLayer.localNodeID, nodeID,
+                bytearray()))
+
+    def finish(self, nodeID, kind):
+        """A request has been answered, given up on or skipped."""
+        self.inFlight.pop((nodeID, kind), None)
+        self.remaining[nodeID] -= 1
+        if self.remaining[nodeID] > 0:
+            return
+        del self.remaining[nodeID]
+        self.pips.pop(nodeID, None)
+        self.nodesDone += 1
+        if not self.remaining:
+            self.endTime = self.clock()
+        if self.progress is not None:
+            self.progress(self)
+
+    def process(self, message):
+        '''Processor entry point: note replies to requests in flight.
+
+        Returns:
+            bool: Always False; nodes are updated by RemoteNodeProcessor.
+        '''
+        kind = REPLY_KINDS.get(message.mti)
+        rejected = False
+        if (message.mti == MTI.Optional_Interaction_Rejected
+                and len(message.data) >= 4):
+            # the node doesn't support the request whose MTI is given
+            rejectedMTI = (message.data[2] << 8) | message.data[3]
+            for requestKind, mti in REQUEST_MTIS.items():
+                if mti.value == rejectedMTI:
+                    kind = requestKind
+                    rejected = True
+        key = (message.source, kind)
+        if kind is None or key not in self.inFlight:
+            return False
+        if (message.mti == MTI.Protocol_Support_Reply
+                and len(message.data) > 0):
+            self.pips[message.source] = PIP.setContentsFromList(message.data)
+        if kind == EVENTS_REQUEST and not rejected:
+            # more may follow; ended by checkTimeouts once they stop
+            tries = self.inFlight[key][1]
+            self.inFlight[key] = (self.clock() + self.eventsQuiet, tries)
+            return False
+        self.finish(message.source, kind)
+        self.sendRequests()
+        return False
+
+    def checkTimeouts(self, now=None):
+        """Retry or give up on requests without replies, then send what the
+        pacing allows. Call periodically.
+
+        Args:
+            now (float, optional): The current clock() value.
+        """
+        if now is None:
+            now = self.clock()
+        for (nodeID, kind), (deadline, tries) in list(self.inFlight.items()):
+            if now < deadline:
+                continue
+            if kind == EVENTS_REQUEST:
+                self.finish(nodeID, kind)  # replies stopped, or none came
+            elif tries <= self.retries:
+                del self.inFlight[(nodeID, kind)]
+                self.enqueue(nodeID, kind, tries)
+            else:
+                logging.warning("No reply from {} to {}".format(
+                    nodeID, REQUEST_MTIS[kind].name))
+                self.failed.append((nodeID, kind))
+                self.finish(nodeID, kind)
+        self.sendRequests(now)
+
+    def discoveryTime(self):
+        """Return seconds from the first node seen until the last finished,
+        or None while discovery is going on."""
+        if self.startTime is None or self.endTime is None:
+            return None
+        return self.endTime - self.startTime
@@ -0,0 +1,311 @@
+'''
+Upgrade the firmware of one or more nodes from an image file.
+
+For each node: Freeze its firmware space (0xEF), which restarts it into
+its bootloader; write the image into the space; then Unfreeze it to
+start the new firmware.
+
+- Create with the ``MemoryService`` to write through
+- Feed messages to ``process(_:)``, so a frozen node's restart is seen,
+  and call ``checkTimeouts()`` periodically, so a node that freezes
+  without restarting is written to after ``freezeWait``
+- A node may restart into its bootloader, or after Unfreeze into the new
+  firmware, without acknowledging the command. Its Initialization
+  Complete, or the command's datagram timing out, counts as the command
+  having worked; only a rejected command fails the node.
+- ``upgrade(_:_:_:_:)`` maps the image file once and upgrades the
+  nodes, several at a time. ``progress`` is called with a node's
+  ``FirmwareJob`` as its image is written, and ``done`` with every job
+  once all have finished; a job's ``error`` is None if it succeeded.
+
+The image is written with ``requestMemoryBulkWrite``, so a node whose
+bootloader supports streams gets the image in one stream, and others in
+64-byte datagrams, several queued at once. A node whose write fails is
+left frozen, in its bootloader, so the upgrade can be tried again.
+'''
+
+import logging
+import mmap
+import os
+import time
+
+from openlcb.datagramservice import (
+    DatagramService,
+    DatagramWriteMemo,
+)
+from openlcb.jobrunner import JobRunner
+from openlcb.memoryservice import (
+    BULK_WRITE_WINDOW,
+    MemoryBulkWriteMemo,
+)
+from openlcb.mti import MTI
+from openlcb.pip import PIP
+
+FIRMWARE_SPACE = 0xEF
+FREEZE = 0xA1
+UNFREEZE = 0xA0
+MAX_NODES_IN_FLIGHT = 8  # default nodes being upgraded at once
+FREEZE_WAIT = 3.0  # default seconds to wait for a frozen node to restart
+
+
+class FirmwareImage:
+    """A firmware image file, mapped into memory.
+
+    Args:
+        buffer (Union[bytes,bytearray,mmap.mmap]): The image.
+
+    Attributes:
+        view (memoryview): Over buffer, so it is written without copying
+            it all.
+    """
+    def __init__(self, buffer):
+        # For args see class docstring.
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+
+    @staticmethod
+    def fromFile(path):
+        """Map an image file read-only.
+
+        Raises:
+            OSError: If the file can't be opened.
+            ValueError: If it is empty.
+        """
+        with open(path, "rb") as stream:
+            if os.fstat(stream.fileno()).st_size == 0:
+                raise ValueError("{} is empty".format(path))
+            return FirmwareImage(mmap.mmap(stream.fileno(), 0,
+                                           access=mmap.ACCESS_READ))
+
+    def close(self):
+        self.view.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+class FirmwareJob:
+    """The upgrade of one node.
+
+    Args:
+        nodeID (NodeID): The node.
+        size (int): Bytes in the image.
+
+    Attributes:
+        state (str): "waiting", "freezing", "writing", "unfreezing" or
+            "done".
+        error (str): Why the upgrade failed, or None.
+        bytesWritten (int): Bytes of the image written so far.
+        startTime (float): clock() value when writing started, or None.
+        endTime (float): clock() value when writing ended, or None.
+    """
+    def __init__(self, nodeID, size):
+        # For args see class docstring.
+        self.nodeID = nodeID
+        self.size = size
+        self.state = "waiting"
+        self.error = None
+        self.bytesWritten = 0
+        self.startTime = None
+        self.endTime = None
+
+    def progress(self):
+        """Return the fraction of the image written, from 0.0 to 1.0."""
+        if self.size == 0:
+            return 1.0
+        return self.bytesWritten / self.size
+
+    def bytesPerSecond(self, now=None):
+        """Return the write throughput so far, or None before writing.
+
+        Args:
+            now (float, optional): The current clock() value, used until
+                writing ends.
+        """
+        if self.startTime is None:
+            return None
+        end = self.endTime if self.endTime is not None else now
+        if end is None or end <= self.startTime:
+            return None
+        return self.bytesWritten / (end - self.startTime)
+
+
+class FirmwareUpgrade:
+    """Upgrade node firmware, a limited number of nodes at a time.
+
+    Args:
+        memoryService (MemoryService): Where writes are sent; its
+            DatagramService sends the Freeze and Unfreeze commands.
+        maxInFlight (int, optional): Most nodes being upgraded at once.
+        window (int, optional): Datagram writes queued ahead per node.
+
+    Attributes:
+        freezeWait (float): Seconds to wait for a frozen node to restart
+            before writing to it anyway.
+        clock (Callable): Returns the current time in seconds;
+            time.monotonic unless replaced for testing.
+        frozen (dict): NodeID to (job, deadline, start writing) for the
+            nodes sent Freeze and waiting to restart into their
+            bootloader; deadline is None until Freeze is acknowledged.
+        unfreezing (dict): NodeID to the callback finishing the job, for
+            the nodes sent Unfreeze.
+        jobs (JobRunner): Runs the upgrade jobs.
+    """
+
+    def __init__(self, memoryService, maxInFlight=MAX_NODES_IN_FLIGHT,
+                 window=BULK_WRITE_WINDOW):
+        self.memoryService = memoryService
+        self.window = window
+        self.freezeWait = FREEZE_WAIT
+        self.clock = time.monotonic
+        self.frozen = {}
+        self.unfreezing = {}
+        self.jobs = JobRunner(maxInFlight)
+
+    @staticmethod
+    def nodesWithFirmwareUpgrade(store):
+        """Return the IDs of the nodes in a NodeStore that advertise the
+        Firmware Upgrade protocol."""
+        return [node.id for node in
+                store.query(pip=PIP.FIRMWARE_UPGRADE_PROTOCOL)]
+
+    def upgrade(self, nodeIDs, path, done, progress=None):
+        """Write the image in path to the firmware space of each node.
+
+        Args:
+            nodeIDs (list[NodeID]): Nodes to upgrade.
+            path (str): The image file.
+            done (Callable[list[FirmwareJob]]): Called once every node has
+                been upgraded or has failed.
+            progress (Callable[FirmwareJob], optional): Called each time
+                more of a node's image has been written.
+        """
+        try:
+            image = FirmwareImage.fromFile(path)
+        except (OSError, ValueError) as ex:
+            jobs = [FirmwareJob(nodeID, 0) for nodeID in nodeIDs]
+            for job in jobs:
+                job.error = str(ex)
+            image = None
+        else:
+            jobs = [FirmwareJob(nodeID, len(image.view))
+                    for nodeID in nodeIDs]
+
+        def allDone(jobs):
+            done(jobs)
+            if image is not None:
+                image.close()
+
+        self.runJobs(jobs, lambda job, finished: self.startUpgrade(
+            job, image, progress, finished), allDone)
+
+    def runJobs(self, jobs, start, done):
+        """Queue jobs, calling done once all have finished."""
+        def finishing(job):
+            job.state = "done"
+            if job.error is not None:
+                logging.warning("Firmware upgrade of {} failed: {}"
+                                "".format(job.nodeID, job.error))
+
+        self.jobs.run(jobs, start, done, finishing)
+
+    def sendCommand(self, nodeID, command, okReply, rejectedReply):
+        self.memoryService.service.sendDatagram(DatagramWriteMemo(
+            nodeID, bytearray([
+                DatagramService.ProtocolID.MemoryOperation.value, command,
+                FIRMWARE_SPACE]),
+            okReply, rejectedReply))
+
+    def startUpgrade(self, job, image, progress, finished):
+        """Freeze the node, then wait for it to restart before writing."""
+        def frozen(dgMemo):
+            if job.nodeID in self.frozen:  # not restarted yet
+                self.frozen[job.nodeID] = (
+                    job, self.clock() + self.freezeWait, startWrite)
+
+        def freezeFailed(dgMemo):
+            if job.state != "freezing":
+                return  # restarted into the bootloader without an ack
+            self.frozen.pop(job.nodeID, None)
+            if dgMemo.errorCode is None:
+                startWrite()  # may have restarted before acknowledging
+                return
+            job.error = "freeze failed: {}".format(dgMemo.reason)
+            finished(job)
+
+        def startWrite():
+            job.state = "writing"
+            job.startTime = self.clock()
+            self.memoryService.requestMemoryBulkWrite(MemoryBulkWriteMemo(
+                job.nodeID, FIRMWARE_SPACE, 0, image.view, written,
+                writeFailed, writeProgress, self.window))
+
+        def writeProgress(memo):
+            job.bytesWritten = memo.written
+            if progress is not None:
+                progress(job)
+
+        def writeFailed(memo):
+            job.endTime = self.clock()
+            job.error = "write failed after {} bytes".format(memo.written)
+            finished(job)
+
+        def written(memo):
+            job.endTime = self.clock()
+            job.bytesWritten = memo.written
+            job.state = "unfreezing"
+            self.unfreezing[job.nodeID] = unfrozen
+            self.sendCommand(job.nodeID, UNFREEZE,
+                             lambda dgMemo: unfrozen(), unfreezeFailed)
+
+        def unfrozen():
+            if job.state == "unfreezing":
+                self.unfreezing.pop(job.nodeID, None)
+                finished(job)
+
+        def unfreezeFailed(dgMemo):
+            if dgMemo.errorCode is None:
+                unfrozen()  # may have restarted before acknowledging
+                return
+            if job.state == "unfreezing":
+                self.unfreezing.pop(job.nodeID, None)
+                job.error = "unfreeze failed: {}".format(dgMemo.reason)
+                finished(job)
+
+        job.state = "freezing"
+        self.frozen[job.nodeID] = (job, None, startWrite)
+        self.sendCommand(job.nodeID, FREEZE, frozen, freezeFailed)
+
+    def checkTimeouts(self, now=None):
+        """Start writing to frozen nodes that haven't restarted within
+        freezeWait, as some bootloaders run without a restart. Call
+        periodically.
+
+        Args:
+            now (float, optional): The current clock() value.
+        """
+        if not self.frozen:
+            return
+        if now is None:
+            now = self.clock()
+        for nodeID, (job, deadline, startWrite) in list(self.frozen.items()):
+            if deadline is not None and now >= deadline:
+                del self.frozen[nodeID]
+                startWrite()
+
+    def process(self, message):
+        '''Processor entry point: start writing to a frozen node once it
+        has restarted into its bootloader, and finish an unfrozen one
+        once it has restarted into its new firmware.
+
+        Returns:
+            bool: Always False; nothing published changes.
+        '''
+        if message.mti in (MTI.Initialization_Complete,
+                           MTI.Initialization_Complete_Simple):
+            entry = self.frozen.pop(message.source, None)
+            if entry is not None:
+                entry[2]()
+            unfrozen = self.unfreezing.get(message.source)
+            if unfrozen is not None:
+                unfrozen()
+        return False
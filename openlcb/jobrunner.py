@@ -0,0 +1,75 @@
+'''
+Run jobs on many nodes, a limited number at a time.
+
+Used by ``ConfigBackup`` and ``FirmwareUpgrade``: each job is started
+through a callback and reports back once it has finished, which starts
+the next job waiting.
+'''
+
+from collections import deque
+
+
+class JobRunner:
+    """Start queued jobs while fewer than maxInFlight are running.
+
+    Args:
+        maxInFlight (int): Most jobs running at once.
+
+    Attributes:
+        pendingJobs (deque): (job, start, finished) not yet started.
+        activeJobs (int): Jobs started and not yet finished.
+        starting (bool): Whether startJobs is running, so a job that
+            finishes as it starts leaves the next ones to that loop
+            rather than nesting another.
+    """
+
+    def __init__(self, maxInFlight):
+        self.maxInFlight = maxInFlight
+        self.pendingJobs = deque()
+        self.activeJobs = 0
+        self.starting = False
+
+    def run(self, jobs, start, done, finishing=None):
+        """Queue jobs, calling done once all have finished.
+
+        Args:
+            jobs (list): The jobs, each with an ``error`` attribute; one
+                whose error is already set is finished without starting.
+            start (Callable[job, Callable[job]]): Starts a job, given the
+                callback to call once it has finished.
+            done (Callable[list]): Called with jobs once all have finished.
+            finishing (Callable[job], optional): Called as each job
+                finishes, before done.
+        """
+        remaining = [len(jobs)]
+
+        def finished(job):
+            self.activeJobs -= 1
+            if finishing is not None:
+                finishing(job)
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done(jobs)
+            self.startJobs()
+
+        if not jobs:
+            done(jobs)
+            return
+        for job in jobs:
+            self.pendingJobs.append((job, start, finished))
+        self.startJobs()
+
+    def startJobs(self):
+        if self.starting:
+            return  # the loop below goes on once this job returns
+        self.starting = True
+        try:
+            while self.pendingJobs and self.activeJobs < self.maxInFlight:
+                job, start, finished = self.pendingJobs.popleft()
+                self.activeJobs += 1
+                if job.error is not None:
+                    finished(job)  # failed before starting
+                else:
+                    start(job, finished)
+        finally:
+            self.starting = False
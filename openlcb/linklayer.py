@@ -20,6 +20,7 @@ class LinkLayer:
 
     def __init__(self, localNodeID):
         self.localNodeID = localNodeID
+        self.listeners = []  # local list of listener callbacks
 
     def sendMessage(self, msg):
         '''This is the basic abstract interface
@@ -28,8 +29,6 @@ class LinkLayer:
     def registerMessageReceivedListener(self, listener):
         self.listeners.append(listener)
 
-    listeners = []  # local list of listener callbacks
-
     def fireListeners(self, msg):
         for listener in self.listeners:
             listener(msg)
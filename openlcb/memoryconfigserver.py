@@ -0,0 +1,374 @@
+'''
+Serve the memory spaces of a node implemented here, answering the memory
+configuration requests that other nodes send it.
+
+- Create with the local node's ``DatagramService``; the server registers
+  for its datagrams. (MemoryService on the same DatagramService keeps
+  handling the replies to this node's own requests.)
+- Add each space with ``addSpace(_:_:)``, giving a ``MemorySpace``:
+  ``MemorySpace.fromFile`` maps a file, so reads and writes go straight
+  to the page cache; ``MemorySpace(buffer)`` serves a bytearray or
+  bytes, such as the CDI (which should end with a 0 byte).
+- Reads, writes, Get Configuration Options and Address Space Information
+  are answered; other commands are rejected as not implemented.
+- Given a ``StreamService``, Read Stream and Write Stream commands are
+  answered too, moving the whole range through one stream. A read's
+  stream is initiated once the reply datagram has been acknowledged.
+- Freeze and Unfreeze are acknowledged and passed to ``freezeCallback``
+  if it is set, for a node that takes firmware upgrades.
+- Writes to files are batched: ``checkTimeouts()``, which should be
+  called periodically, flushes them ``flushDelay`` after the first
+  unflushed write; ``flush()`` does so at once.
+'''
+
+import logging
+import mmap
+import os
+import time
+
+from openlcb.datagramservice import (
+    DatagramService,
+    DatagramWriteMemo,
+)
+from openlcb.memoryservice import (
+    MemoryService,
+    STREAM_TO_END,
+)
+from openlcb.streamservice import (
+    StreamReadMemo,
+    StreamWriteMemo,
+)
+
+FLUSH_DELAY = 1.0  # default seconds after a write before files are flushed
+MAX_READ = 64  # most data bytes in one read reply
+
+# error codes in read and write error replies
+ERROR_UNKNOWN_SPACE = 0x1081
+ERROR_OUT_OF_BOUNDS = 0x1082
+ERROR_READ_ONLY = 0x1083
+ERROR_NOT_IMPLEMENTED = 0x1042  # datagram rejected: command unknown
+ERROR_INVALID_ARGUMENTS = 0x1080
+
+
+class MemorySpace:
+    """The contents of one memory space, in any buffer.
+
+    Args:
+        buffer (Union[bytearray,bytes,mmap.mmap]): The contents; its length
+            is the size of the space. A bytes buffer is read-only.
+        readOnly (bool, optional): Refuse writes.
+        lowAddress (int, optional): Address of the first byte.
+
+    Attributes:
+        view (memoryview): Over buffer, so reads are sliced without
+            copying.
+        dirty (bool): Written since last flushed.
+    """
+    def __init__(self, buffer, readOnly=False, lowAddress=0):
+        # For args see class docstring.
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.readOnly = readOnly or self.view.readonly
+        self.lowAddress = lowAddress
+        self.dirty = False
+
+    @staticmethod
+    def fromFile(path, size, readOnly=False, lowAddress=0):
+        """Map a file as a space, creating or growing it to size bytes.
+
+        Args:
+            path (str): The file.
+            size (int): Size of the space in bytes.
+            readOnly (bool, optional): Refuse writes.
+            lowAddress (int, optional): Address of the first byte.
+        """
+        fd = os.open(path, os.O_RDONLY if readOnly
+                     else os.O_RDWR | os.O_CREAT)
+        try:
+            if not readOnly and os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            access = mmap.ACCESS_READ if readOnly else mmap.ACCESS_WRITE
+            buffer = mmap.mmap(fd, size, access=access)
+        finally:
+            os.close(fd)  # the mapping stays valid
+        return MemorySpace(buffer, readOnly, lowAddress)
+
+    def highestAddress(self):
+        return self.lowAddress + len(self.view) - 1
+
+    def flush(self):
+        """Write changes to the file, if the space is mapped from one."""
+        if self.dirty and isinstance(self.buffer, mmap.mmap):
+            self.buffer.flush()
+        self.dirty = False
+
+    def close(self):
+        self.flush()
+        self.view.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+class MemoryConfigServer:
+    """Answer memory configuration requests for the local node.
+
+    Args:
+        service (DatagramService): The local node's datagram service.
+        flushDelay (float, optional): Seconds after a write before
+            checkTimeouts flushes written files.
+        streamService (StreamService, optional): The local node's stream
+            service, to answer stream commands.
+
+    Attributes:
+        spaces (dict): Space number to MemorySpace.
+        flushTime (float): clock() time after which checkTimeouts flushes,
+            or None if nothing is waiting.
+        clock (Callable): Returns the current time in seconds;
+            time.monotonic unless replaced for testing.
+        freezeCallback (Callable[int, bool]): Called with the space and
+            True on Freeze or False on Unfreeze, or None to reject both.
+    """
+
+    def __init__(self, service, flushDelay=FLUSH_DELAY, streamService=None):
+        self.service = service
+        self.flushDelay = flushDelay
+        self.streamService = streamService
+        self.spaces = {}
+        self.flushTime = None
+        self.clock = time.monotonic
+        self.freezeCallback = None
+        self.service.registerDatagramReceivedListener(
+            self.datagramReceivedListener)
+
+    def addSpace(self, space, memorySpace):
+        """Serve a space.
+
+        Args:
+            space (int): Space number, such as 0xFF for the CDI or 0xFD
+                for configuration.
+            memorySpace (MemorySpace): Its contents.
+        """
+        self.spaces[space] = memorySpace
+
+    def datagramReceivedListener(self, dmemo):
+        '''Answer a memory configuration request.
+
+        Returns:
+            bool: True if the datagram was a request for this server, which
+                has then replied to it.
+        '''
+        data = dmemo.data
+        if (self.service.datagramType(data)
+                != DatagramService.ProtocolID.MemoryOperation
+                or len(data) < 2 or MemoryService.isReplyCommand(data[1])):
+            return False
+        command = data[1]
+        if (command in (0xA0, 0xA1) and len(data) >= 3
+                and self.freezeCallback is not None):
+            self.service.positiveReplyToDatagram(dmemo, 0)  # no reply
+            self.freezeCallback(data[2], command == 0xA1)
+            return True
+        if command & 0xF0 in (0x00, 0x40):
+            reply = self.readOrWrite(data)
+        elif command & 0xB0 == 0x20 and self.streamService is not None:
+            reply = self.streamCommand(dmemo)
+        elif command == 0x80:
+            reply = self.configurationOptions()
+        elif command == 0x84 and len(data) >= 3:
+            reply = self.spaceInformation(data[2])
+        else:
+            reply = None
+        if reply is None:
+            self.service.negativeReplyToDatagram(dmemo,
+                                                 ERROR_NOT_IMPLEMENTED)
+            return True
+        self.service.positiveReplyToDatagram(dmemo, 0x80)  # reply pending
+        if not isinstance(reply, DatagramWriteMemo):
+            reply = DatagramWriteMemo(dmemo.srcID, reply)
+        self.service.sendDatagram(reply)
+        return True
+
+    def readOrWrite(self, data):
+        """Do a read or write request, returning the reply datagram data,
+        or None if the command isn't a plain read or write."""
+        command = data[1]
+        if command & 0x0C != 0:
+            return None  # reserved bits
+        decoded = self.decodeSpace(data)
+        if decoded is None:
+            return None
+        space, header = decoded
+        reply = bytearray(data[0:header])
+        reply[1] = command | 0x10
+        address = int.from_bytes(data[2:6], "big")
+        memorySpace = self.spaces.get(space)
+        if memorySpace is None:
+            return self.errorReply(reply, ERROR_UNKNOWN_SPACE)
+        start = address - memorySpace.lowAddress
+        if start < 0 or address > memorySpace.highestAddress():
+            return self.errorReply(reply, ERROR_OUT_OF_BOUNDS)
+        view = memorySpace.view
+        if command & 0x40:  # read
+            if len(data) <= header or not 0 < data[header] <= MAX_READ:
+                return self.errorReply(reply, ERROR_INVALID_ARGUMENTS)
+            reply += view[start:start + data[header]]
+            return reply
+        # write
+        if memorySpace.readOnly:
+            return self.errorReply(reply, ERROR_READ_ONLY)
+        content = memoryview(data)[header:]
+        if start + len(content) > len(view):
+            return self.errorReply(reply, ERROR_OUT_OF_BOUNDS)
+        view[start:start + len(content)] = content
+        self.written(memorySpace)
+        return reply
+
+    @staticmethod
+    def decodeSpace(data):
+        """Return (space, header length) of a read or write style command,
+        or None if it is too short."""
+        if data[1] & 0x03 == 0:
+            if len(data) < 7:
+                return None
+            return (data[6], 7)
+        if len(data) < 6:
+            return None
+        return (0xFC | (data[1] & 0x03), 6)
+
+    def written(self, memorySpace):
+        """Note a write, to be flushed flushDelay later."""
+        memorySpace.dirty = True
+        if self.flushTime is None and self.flushDelay is not None:
+            self.flushTime = self.clock() + self.flushDelay
+
+    def streamCommand(self, dmemo):
+        """Start a Read Stream or Write Stream.
+
+        Returns:
+            Union[DatagramWriteMemo,bytearray]: The reply; for a read, a
+                memo that initiates the stream once the reply is
+                acknowledged. A write's stream is expected before the
+                reply is sent. None if the command is malformed.
+        """
+        data = dmemo.data
+        command = data[1]
+        decoded = self.decodeSpace(data)
+        if command & 0x0C != 0 or decoded is None:
+            return None
+        space, header = decoded
+        if len(data) < header + 2:
+            return None
+        reply = bytearray(data[0:header])
+        reply[1] = command | 0x10
+        address = int.from_bytes(data[2:6], "big")
+        memorySpace = self.spaces.get(space)
+        if memorySpace is None:
+            return self.errorReply(reply, ERROR_UNKNOWN_SPACE)
+        start = address - memorySpace.lowAddress
+        if start < 0 or address > memorySpace.highestAddress():
+            return self.errorReply(reply, ERROR_OUT_OF_BOUNDS)
+        view = memorySpace.view
+        if command & 0x40:  # read
+            if len(data) < header + 6:
+                return self.errorReply(reply, ERROR_INVALID_ARGUMENTS)
+            count = int.from_bytes(data[header + 2:header + 6], "big")
+            end = len(view) if count == STREAM_TO_END \
+                else min(len(view), start + count)
+            destStreamID = data[header + 1]
+            stream = StreamWriteMemo(
+                dmemo.srcID, view[start:end], lambda memo: None,
+                lambda memo: logging.warning(
+                    "Read Stream to {} failed".format(memo.destID)),
+                destStreamID)
+            self.streamService.holdStream(stream)
+            return DatagramWriteMemo(
+                dmemo.srcID,
+                reply + bytearray([stream.sourceStreamID, destStreamID]),
+                lambda dgMemo: self.streamService.sendStream(stream),
+                lambda dgMemo: self.streamService.releaseStream(stream))
+        # write
+        if memorySpace.readOnly:
+            return self.errorReply(reply, ERROR_READ_ONLY)
+
+        def received(stream):
+            content = stream.data[:len(view) - start]
+            if len(content) < len(stream.data):
+                logging.warning("Write Stream from {} past the end of space"
+                                " 0x{:02X}".format(dmemo.srcID, space))
+            view[start:start + len(content)] = content
+            self.written(memorySpace)
+
+        stream = StreamReadMemo(
+            dmemo.srcID, received,
+            failedReply=lambda stream: logging.warning(
+                "Write Stream from {} to space 0x{:02X} failed"
+                "".format(dmemo.srcID, space)))
+        self.streamService.expectStream(stream)
+        return reply + bytearray([data[header], stream.destStreamID])
+
+    @staticmethod
+    def errorReply(reply, error):
+        reply[1] |= 0x08
+        reply += error.to_bytes(2, "big")
+        return reply
+
+    def configurationOptions(self):
+        """Build the Get Configuration Options reply."""
+        commands = 0x6000  # unaligned reads and writes
+        if 0xFC in self.spaces:
+            commands |= 0x0800  # read manufacturer ACDI
+        if 0xFB in self.spaces:
+            commands |= 0x0400  # read user ACDI
+            if not self.spaces[0xFB].readOnly:
+                commands |= 0x0200  # write user ACDI
+        lengths = 0xF2  # 1, 2, 4 and 64 bytes, and any length
+        if self.streamService is not None:
+            lengths |= 0x01  # streams
+        spaces = list(self.spaces) or [0]
+        return (bytearray([0x20, 0x82]) + commands.to_bytes(2, "big")
+                + bytearray([lengths, max(spaces), min(spaces)]))
+
+    def spaceInformation(self, space):
+        """Build the Address Space Information reply for a space."""
+        memorySpace = self.spaces.get(space)
+        if memorySpace is None:
+            return bytearray([0x20, 0x86, space])
+        flags = 0x01 if memorySpace.readOnly else 0
+        reply = (bytearray([0x20, 0x87, space])
+                 + memorySpace.highestAddress().to_bytes(4, "big"))
+        if memorySpace.lowAddress != 0:
+            reply.append(flags | 0x02)
+            reply += memorySpace.lowAddress.to_bytes(4, "big")
+        else:
+            reply.append(flags)
+        return reply
+
+    def checkTimeouts(self, now=None):
+        """Flush written files once flushDelay has passed since the first
+        unflushed write. Call periodically.
+
+        Args:
+            now (float, optional): The current clock() value.
+        """
+        if self.flushTime is None:
+            return
+        if now is None:
+            now = self.clock()
+        if now >= self.flushTime:
+            self.flush()
+
+    def flush(self):
+        """Flush every written space to its file now."""
+        self.flushTime = None
+        for memorySpace in self.spaces.values():
+            try:
+                memorySpace.flush()
+            except OSError as ex:
+                logging.error("Couldn't flush memory space: {}".format(ex))
+
+    def close(self):
+        """Flush and release every space."""
+        self.flushTime = None
+        for memorySpace in self.spaces.values():
+            memorySpace.close()
+        self.spaces = {}
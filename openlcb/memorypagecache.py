@@ -0,0 +1,292 @@
+'''
+Client-side cache of remote node memory, in pages.
+
+Sits in front of a ``MemoryService`` so repeated reads of the same
+memory, such as UI refreshes or scripted configuration checks, are
+answered locally instead of from the bus.
+
+- Create with the ``MemoryService`` to read through
+- Submit ``MemoryReadMemo`` and ``MemoryWriteMemo`` objects via
+  ``requestMemoryRead(_:)`` and ``requestMemoryWrite(_:)`` as with the
+  MemoryService. A read that is fully cached is answered before the call
+  returns.
+- Feed messages to ``process(_:)`` so a node's pages are dropped when it
+  sends Initialization_Complete.
+
+Pages of read-only spaces such as the CDI are kept for the session.
+Pages of other spaces are read again once older than ``maxAge``, as the
+node or another tool may change them. Writes go straight through to the
+node; cached pages, and pages still being read, are updated at once and
+marked dirty until the write is acknowledged.
+'''
+
+from collections import OrderedDict
+import time
+
+from openlcb.memoryservice import (
+    MemoryReadMemo,
+    MemoryWriteMemo,
+)
+from openlcb.mti import MTI
+
+PAGE_SIZE = 64  # bytes per page; one read datagram each
+CACHE_BUDGET = 1024 * 1024  # default most bytes of page data kept
+MAX_AGE = 10.0  # default seconds pages of writable spaces are trusted
+READ_ONLY_SPACES = (0xFF, 0xFC, 0xFA)  # CDI, ACDI manufacturer, FDI
+
+
+class CachedPage:
+    """Contents of one page of a memory space.
+
+    Args:
+        data (bytearray): Page contents; shorter than PAGE_SIZE at the end
+            of a space.
+        loadTime (float): clock() value when it was read.
+
+    Attributes:
+        dirty (int): Writes to this page not yet acknowledged. Dirty pages
+            are not evicted or expired.
+    """
+    def __init__(self, data, loadTime):
+        # For args see class docstring.
+        self.data = data
+        self.loadTime = loadTime
+        self.dirty = 0
+
+
+class PendingWrite:
+    """A write sent through the cache.
+
+    Args:
+        memo (MemoryWriteMemo): The write.
+
+    Attributes:
+        pages (list[tuple]): (key, CachedPage) made dirty by the write, so
+            its acknowledgement cleans those very pages even if they have
+            been dropped and read again since.
+        done (bool): True once the write has been acknowledged or
+            rejected.
+        failed (bool): True if it was rejected.
+    """
+    def __init__(self, memo):
+        # For args see class docstring.
+        self.memo = memo
+        self.pages = []
+        self.done = False
+        self.failed = False
+
+
+class MemoryPageCache:
+    """Cache memory reads per (node, space, page), least recently used
+    pages evicted first.
+
+    Args:
+        memoryService (MemoryService): Where pages are read and writes
+            are sent.
+        budget (int, optional): Most bytes of page data to keep.
+
+    Attributes:
+        pages (OrderedDict): (NodeID, space, page number) to CachedPage,
+            least recently used first.
+        size (int): Bytes of page data held.
+        maxAge (float): Seconds pages of spaces not in readOnlySpaces are
+            used before being read again; None to keep them until
+            invalidated.
+        readOnlySpaces (set): Spaces whose pages are kept for the session.
+        clock (Callable): Returns the current time in seconds;
+            time.monotonic unless replaced for testing.
+        hits (int): Reads answered from cached pages alone.
+        misses (int): Reads that had to load one or more pages.
+    """
+
+    def __init__(self, memoryService, budget=CACHE_BUDGET):
+        self.memoryService = memoryService
+        self.budget = budget
+        self.pages = OrderedDict()
+        self.size = 0
+        self.maxAge = MAX_AGE
+        self.readOnlySpaces = set(READ_ONLY_SPACES)
+        self.clock = time.monotonic
+        self.loading = {}  # page key to callbacks waiting for that page
+        # page key to the writes sent while that page was being read; the
+        # read was queued first, so its data is from before them
+        self.loadingWrites = {}
+        self.hits = 0
+        self.misses = 0
+
+    def getPage(self, key):
+        """Return a usable cached page and mark it recently used, or None.
+        """
+        page = self.pages.get(key)
+        if page is None:
+            return None
+        if (page.dirty == 0 and self.maxAge is not None
+                and key[1] not in self.readOnlySpaces
+                and self.clock() - page.loadTime > self.maxAge):
+            self.dropPage(key)
+            return None
+        self.pages.move_to_end(key)
+        return page
+
+    def dropPage(self, key):
+        page = self.pages.pop(key)
+        self.size -= len(page.data)
+
+    def storePage(self, key, data):
+        """Cache a page that has been read, then evict least recently used
+        clean pages until within budget."""
+        if key in self.pages:
+            self.dropPage(key)
+        self.pages[key] = CachedPage(data, self.clock())
+        self.size += len(data)
+        for oldKey in list(self.pages):
+            if self.size <= self.budget:
+                break
+            if oldKey != key and self.pages[oldKey].dirty == 0:
+                self.dropPage(oldKey)
+
+    def requestMemoryRead(self, memo):
+        """Read through the cache, loading the pages it lacks.
+
+        Args:
+            memo (MemoryReadMemo): Request; dataReply or rejectedReply is
+                called as with MemoryService.
+        """
+        first = memo.address // PAGE_SIZE
+        last = (memo.address + max(memo.size, 1) - 1) // PAGE_SIZE
+        missing = [number for number in range(first, last + 1)
+                   if self.getPage((memo.nodeID, memo.space, number)) is None]
+        if not missing:
+            self.hits += 1
+            self.completeRead(memo)
+            return
+        self.misses += 1
+        remaining = [len(missing)]
+
+        def pageLoaded():
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                self.completeRead(memo)
+
+        for number in missing:
+            self.loadPage((memo.nodeID, memo.space, number), pageLoaded)
+
+    def loadPage(self, key, callback):
+        """Read a page from the node, or wait for a read already sent."""
+        callbacks = self.loading.get(key)
+        if callbacks is not None:
+            callbacks.append(callback)
+            return
+        self.loading[key] = [callback]
+        nodeID, space, number = key
+        self.memoryService.requestMemoryRead(MemoryReadMemo(
+            nodeID, PAGE_SIZE, space, number * PAGE_SIZE,
+            lambda pageMemo: self.pageDone(key, None),
+            lambda pageMemo: self.pageDone(key, pageMemo.data)))
+
+    def pageDone(self, key, data):
+        """A page read finished; data is None if it failed. Writes sent
+        while it was being read are applied to it, or it is discarded if
+        one of them failed, as the node's contents are then unknown."""
+        writes = self.loadingWrites.pop(key, ())
+        if any(write.failed for write in writes):
+            data = None
+        if data is not None:
+            self.storePage(key, bytearray(data))
+            page = self.pages[key]
+            for write in writes:
+                self.applyWrite(key, page, write)
+        for callback in self.loading.pop(key, ()):
+            callback()
+
+    def completeRead(self, memo):
+        """Answer a read from cached pages. A short page ends the space,
+        so the data stops there, as the node's own reply would."""
+        data = bytearray()
+        number = memo.address // PAGE_SIZE
+        offset = memo.address - number * PAGE_SIZE
+        while len(data) < memo.size:
+            page = self.pages.get((memo.nodeID, memo.space, number))
+            if page is None:
+                # the read of this page failed
+                memo.rejectedReply(memo)
+                return
+            data.extend(page.data[offset:offset + memo.size - len(data)])
+            if len(page.data) < PAGE_SIZE:
+                break  # end of space
+            number += 1
+            offset = 0
+        memo.data = data
+        memo.dataReply(memo)
+
+    def requestMemoryWrite(self, memo):
+        """Send a write to the node, updating cached pages it covers.
+
+        Args:
+            memo (MemoryWriteMemo): Request; okReply or rejectedReply is
+                called as with MemoryService.
+        """
+        write = PendingWrite(memo)
+        number = memo.address // PAGE_SIZE
+        while number * PAGE_SIZE < memo.address + len(memo.data):
+            key = (memo.nodeID, memo.space, number)
+            page = self.pages.get(key)
+            if page is not None:
+                self.applyWrite(key, page, write)
+            elif key in self.loading:
+                self.loadingWrites.setdefault(key, []).append(write)
+            number += 1
+
+        def written(ok):
+            write.done = True
+            write.failed = not ok
+            for key, page in write.pages:
+                page.dirty -= 1
+                # a page dropped and read again since is left alone
+                if not ok and self.pages.get(key) is page:
+                    self.dropPage(key)  # contents now unknown
+            if ok:
+                memo.okReply(memo)
+            else:
+                memo.rejectedReply(memo)
+
+        self.memoryService.requestMemoryWrite(MemoryWriteMemo(
+            memo.nodeID, lambda w: written(True), lambda w: written(False),
+            memo.size, memo.space, memo.address, memo.data))
+
+    def applyWrite(self, key, page, write):
+        """Copy the part of a write that falls in a page into it, and
+        count the page dirty until the write is acknowledged."""
+        memo = write.memo
+        base = key[2] * PAGE_SIZE
+        start = max(memo.address, base)
+        end = min(memo.address + len(memo.data), base + len(page.data))
+        if start < end:
+            page.data[start - base:end - base] = \
+                memo.data[start - memo.address:end - memo.address]
+        if not write.done:
+            page.dirty += 1
+            write.pages.append((key, page))
+
+    def invalidate(self, nodeID, space=None):
+        """Drop cached pages of a node, or of one of its spaces.
+
+        Args:
+            nodeID (NodeID): The node.
+            space (int, optional): Only this space.
+        """
+        for key in list(self.pages):
+            if key[0] == nodeID and (space is None or key[1] == space):
+                self.dropPage(key)
+
+    def process(self, message):
+        '''Processor entry point: drop a node's pages once it
+        reinitializes, as its memory may have changed.
+
+        Returns:
+            bool: Always False; nothing published changes.
+        '''
+        if message.mti in (MTI.Initialization_Complete,
+                           MTI.Initialization_Complete_Simple):
+            self.invalidate(message.source)
+        return False
@@ -3,10 +3,17 @@ based on MemoryService.swift
 
 Created by Bob Jacobsen on 6/1/22.
 
-TODO: Read requests are serialized, but write requests are not yet
+Requests to each node are queued and sent in order, so a write followed
+by a read of the same node sees the written data. Requests to different
+nodes proceed in parallel.
 
 Datagram retry handles the link being queisced/restarted, so it's not
-explicitly handled here.
+explicitly handled here. A node that accepts a request datagram but then
+sends no reply in time fails that request, so the requests queued behind
+it go on; ``process(_:)`` checks for this, and ``checkTimeouts()`` should
+also be called periodically. The reply is due within the 2^N seconds the
+node gives in its Datagram_Received_OK, else ``replyTimeout``. A write
+acknowledged without Reply Pending is complete, as no reply will come.
 
 Does memory read and write requests.
 
@@ -19,15 +26,61 @@ To do memory write:
 To do memory read:
 - Create a ``MemoryReadMemo`` and submit via ``requestMemoryRead(_:)``
 - Wait for either dataReply or rejectedReply call back.
+
+To read a range of any length, or up to a 0 byte (such as the CDI):
+- Create a ``MemoryBulkReadMemo`` and submit via
+  ``requestMemoryBulkRead(_:)``
+- The range is read in 64-byte chunks, with the next ones already queued
+  so each goes out as soon as the one before is answered. Only
+  ``requestWindow`` requests to a node are sent at once, so raise it to
+  have several chunk reads in flight together, for nodes that accept
+  that. Chunk reads still queued when the read finishes are dropped.
+- Wait for a single dataReply or rejectedReply call back.
+
+To write a range of any length (such as firmware):
+- Create a ``MemoryBulkWriteMemo`` and submit via
+  ``requestMemoryBulkWrite(_:)``
+- Wait for a single okReply or rejectedReply call back.
+
+Given a ``StreamService``, bulk reads and writes to a node that reports
+the Stream protocol in its Protocol Support Reply (which ``process(_:)``
+notes) use the Read Stream and Write Stream commands, so a whole range
+moves in one stream instead of 64-byte datagrams. If the node refuses
+the command, the datagram method is used instead.
+
+To get information about a memory space (such as its length):
+- Call ``requestSpaceInfo(_:)`` with a callback for the ``SpaceInfo``
+- Results are cached per node until that node reinitializes, which
+  ``process(_:)`` notices, so feed it messages as part of common execution.
 '''
 
+from collections import deque
 import logging
+import time
 from openlcb.datagramservice import (
     # DatagramReadMemo,
     DatagramWriteMemo,
     DatagramService,
+    REPLY_PENDING,
+    TIMEOUT_EXPONENT,
+)
+from openlcb.mti import MTI
+from openlcb.pip import PIP
+from openlcb.streamservice import (
+    StreamReadMemo,
+    StreamWriteMemo,
 )
 
+REQUEST_WINDOW = 1  # default requests per node awaiting replies at once
+# (chunk reads beyond it wait in the node's queue; see requestWindow)
+BULK_READ_WINDOW = 4  # default chunk reads a bulk read queues ahead
+BULK_WRITE_WINDOW = 4  # default chunk writes a bulk write queues ahead
+# replies among the commands from 0x80 up: Get Configuration Options,
+# Address Space Information (not present, present), Lock and Get Unique ID
+REPLY_COMMANDS = (0x82, 0x86, 0x87, 0x8A, 0x8D)
+REPLY_TIMEOUT = 3.0  # default seconds for a reply after a request's ack
+STREAM_TO_END = 0xFFFFFFFF  # Read Stream count: until the end of the space
+
 
 class MemoryReadMemo:
     """Memo carries request and reply.
@@ -98,19 +151,172 @@ class MemoryWriteMemo:
         self.data = data
 
 
+class MemoryBulkReadMemo:
+    """A read of a memory range of any length, and its result.
+
+    Args:
+        nodeID (NodeID): Remote node id (where to read).
+        space (int): Encoded memory space identifier; see MemoryReadMemo.
+        address (int): The address in memory where reading starts.
+        length (int): Number of bytes to read, or None to read until a 0
+            byte or the end of the space.
+        rejectedReply (Callable[MemoryBulkReadMemo]): Called if a chunk
+            can't be read. data holds what was read before it.
+        dataReply (Callable[MemoryBulkReadMemo]): Called once, when all of
+            the data has been read.
+        chunkReply (Callable[MemoryBulkReadMemo], optional): Called each
+            time more data is added, in address order, for callers that
+            process the data as it arrives.
+        window (int, optional): Chunk reads queued ahead at once; how many
+            are sent together is limited by MemoryService.requestWindow.
+
+    Attributes:
+        data (bytearray): The data read so far. When length is None, the
+            terminating 0 byte is not included.
+        done (bool): Set when dataReply or rejectedReply has been called.
+    """
+    def __init__(self, nodeID, space, address, length, rejectedReply,
+                 dataReply, chunkReply=None, window=BULK_READ_WINDOW):
+        # For args see class docstring.
+        self.nodeID = nodeID
+        self.space = space
+        self.address = address
+        self.length = length
+        self.rejectedReply = rejectedReply
+        self.dataReply = dataReply
+        self.chunkReply = chunkReply
+        self.window = window
+        self.data = bytearray()
+        self.done = False
+        self.nextAddress = address  # of the next chunk to request
+        self.readsQueued = 0
+        self.chunkReads = set()  # chunk memos requested, not yet answered
+        self.chunks = {}  # address to chunk memo, received out of order
+
+
+class MemoryBulkWriteMemo:
+    """A write of a memory range of any length.
+
+    Args:
+        nodeID (NodeID): Remote node id (where to write).
+        space (int): Encoded memory space identifier; see MemoryReadMemo.
+        address (int): The address in memory where writing starts.
+        data (Union[bytes,bytearray,memoryview]): The data to write.
+        okReply (Callable[MemoryBulkWriteMemo]): Called once all of the
+            data has been written.
+        rejectedReply (Callable[MemoryBulkWriteMemo]): Called if any of
+            it couldn't be written.
+        progressReply (Callable[MemoryBulkWriteMemo], optional): Called
+            each time more has been written.
+        window (int, optional): Chunk writes queued ahead at once.
+
+    Attributes:
+        written (int): Bytes written so far; for a stream, bytes sent.
+        done (bool): Set when okReply or rejectedReply has been called.
+    """
+    def __init__(self, nodeID, space, address, data, okReply,
+                 rejectedReply, progressReply=None,
+                 window=BULK_WRITE_WINDOW):
+        # For args see class docstring.
+        self.nodeID = nodeID
+        self.space = space
+        self.address = address
+        self.data = data
+        self.okReply = okReply
+        self.rejectedReply = rejectedReply
+        self.progressReply = progressReply
+        self.window = window
+        self.written = 0
+        self.done = False
+        self.nextOffset = 0  # of the next chunk to request
+        self.writesQueued = 0
+
+
+class StreamCommandMemo:
+    """A Read Stream or Write Stream command queued for a bulk memo.
+
+    Args:
+        bulkMemo (Union[MemoryBulkReadMemo,MemoryBulkWriteMemo]): The
+            transfer it starts.
+        rejectedReply (Callable[StreamCommandMemo]): Called if the command
+            datagram fails.
+    """
+    def __init__(self, bulkMemo, rejectedReply):
+        # For args see class docstring.
+        self.bulkMemo = bulkMemo
+        self.rejectedReply = rejectedReply
+        self.nodeID = bulkMemo.nodeID
+        self.space = bulkMemo.space
+        self.address = bulkMemo.address
+        self.streamMemo = None  # StreamReadMemo of a read
+
+
+class SpaceInfo:
+    """Result of an Address Space Information query.
+
+    Args:
+        nodeID (NodeID): Node that was asked.
+        space (int): Memory space that was asked about.
+        present (bool): Whether the node has the space.
+        highestAddress (int, optional): Highest valid address.
+        readOnly (bool, optional): Whether the space can't be written.
+        lowAddress (int, optional): Lowest valid address; 0 unless the
+            node reported otherwise.
+    """
+    def __init__(self, nodeID, space, present, highestAddress=0,
+                 readOnly=False, lowAddress=0):
+        # For args see class docstring.
+        self.nodeID = nodeID
+        self.space = space
+        self.present = present
+        self.highestAddress = highestAddress
+        self.readOnly = readOnly
+        self.lowAddress = lowAddress
+
+
 class MemoryService:
     """Manage memory read and write requests
     (64 bytes at a time).
 
     Args:
         service (DatagramService): See DatagramService.
+
+    Attributes:
+        pendingMemos (dict): NodeID to a deque of the MemoryReadMemos and
+            MemoryWriteMemos waiting to be sent to that node, in order.
+        sentMemos (dict): NodeID to a list of the memos sent to that node
+            and awaiting their reply, oldest first.
+        requestWindow (int): Most requests to one node sent and awaiting
+            their reply at once. Raising it lets the next request go out
+            while a node prepares its reply, for nodes that accept that.
+        spaceInfoCache (dict): NodeID to a dict of space to SpaceInfo.
+        spaceInfoCallbacks (dict): (NodeID, space) to the callbacks
+            waiting for that Address Space Information reply.
+        streamSupport (dict): NodeID to whether bulk transfers with it use
+            streams; filled from Protocol Support Replies, and may be set
+            directly.
+        replyTimeout (float): Seconds to wait for the reply to a request
+            once the node has acknowledged its datagram, unless the node
+            gave its own timeout.
+        replyDeadlines (dict): Sent memo to the clock() time its reply is
+            due, once its datagram has been acknowledged.
+        clock (Callable): Returns the current time in seconds;
+            time.monotonic unless replaced for testing.
     """
 
-    def __init__(self, service):
+    def __init__(self, service, streamService=None):
         self.service = service
-        self.readMemos = []
-        self.writeMemos = []
-        self.spaceLengthCallback = None
+        self.streamService = streamService
+        self.pendingMemos = {}
+        self.sentMemos = {}
+        self.requestWindow = REQUEST_WINDOW
+        self.spaceInfoCache = {}
+        self.spaceInfoCallbacks = {}
+        self.streamSupport = {}
+        self.replyTimeout = REPLY_TIMEOUT
+        self.replyDeadlines = {}
+        self.spaceInfoDeadlines = {}  # (NodeID, space) to its deadline
+        self.clock = time.monotonic
 
         # register to DatagramService to hear arriving datagrams
         self.service.registerDatagramReceivedListener(
@@ -152,10 +358,77 @@ class MemoryService:
             memo (MemoryReadMemo): Request to enqueue.
         '''
         # preserve the request
-        self.readMemos.append(memo)
+        self.queueRequest(memo)
 
-        if len(self.readMemos) == 1:
-            self.requestMemoryReadNext(memo)
+    def queueRequest(self, memo):
+        """Queue a read or write behind others to the same node.
+
+        Args:
+            memo (Union[MemoryReadMemo,MemoryWriteMemo]): Request to
+                enqueue.
+        """
+        queue = self.pendingMemos.get(memo.nodeID)
+        if queue is None:
+            queue = deque()
+            self.pendingMemos[memo.nodeID] = queue
+        queue.append(memo)
+        self.sendQueuedRequests(memo.nodeID)
+
+    def sendQueuedRequests(self, nodeID):
+        """Send queued requests to a node while fewer than requestWindow
+        are awaiting replies.
+
+        Args:
+            nodeID (NodeID): The node to send to.
+        """
+        queue = self.pendingMemos.get(nodeID)
+        if queue is None:
+            return
+        sent = self.sentMemos.get(nodeID)
+        if sent is None:
+            sent = []
+            self.sentMemos[nodeID] = sent
+        while queue and len(sent) < self.requestWindow:
+            memo = queue.popleft()
+            sent.append(memo)
+            if isinstance(memo, MemoryReadMemo):
+                self.requestMemoryReadNext(memo)
+            elif isinstance(memo, StreamCommandMemo):
+                self.requestStreamCommandNext(memo)
+            else:
+                self.requestMemoryWriteNext(memo)
+        if not queue:
+            del self.pendingMemos[nodeID]
+
+    def matchSentMemo(self, nodeID, memoType, space, address):
+        """Find and remove the sent request that a reply answers. The
+        caller sends the next request queued for that node, after the
+        reply's callbacks, so a finished bulk read's queued chunks are
+        dropped before they go out.
+
+        Args:
+            nodeID (NodeID): Source of the reply.
+            memoType (type): MemoryReadMemo or MemoryWriteMemo.
+            space (int): Memory space in the reply.
+            address (int): Starting address in the reply.
+
+        Returns:
+            Union[MemoryReadMemo,MemoryWriteMemo]: The request, or None if
+                none matches.
+        """
+        sent = self.sentMemos.get(nodeID, ())
+        for index, memo in enumerate(sent):
+            if (isinstance(memo, memoType) and memo.space == space
+                    and memo.address == address):
+                del sent[index]
+                if not sent:
+                    del self.sentMemos[nodeID]
+                self.replyDeadlines.pop(memo, None)
+                return memo
+        logging.error("Did not match reply from {} for space 0x{:02X}"
+                      " address 0x{:X} to a request"
+                      "".format(nodeID, space, address))
+        return None
 
     def requestMemoryReadNext(self, memo):
         """send the read request
@@ -178,25 +451,114 @@ class MemoryService:
         if byte6:
             data.extend([(memo.space & 0xFF)])
         data.extend([memo.size])
-        dgWriteMemo = DatagramWriteMemo(memo.nodeID, data,
-                                        self.receivedOkReplyToWrite)
+        dgWriteMemo = DatagramWriteMemo(
+            memo.nodeID, data,
+            lambda dgMemo: self.requestAccepted(memo, dgMemo.flags),
+            lambda dgMemo: self.requestRejected(memo, dgMemo))
         self.service.sendDatagram(dgWriteMemo)
 
+    def requestRejected(self, memo, dgMemo):
+        """The request datagram itself failed, so no reply will come.
+
+        Args:
+            memo (Union[MemoryReadMemo,MemoryWriteMemo]): The request that
+                failed.
+            dgMemo (DatagramWriteMemo): Its datagram, with the reason.
+        """
+        logging.warning("Memory request to {} failed: {}"
+                        "".format(memo.nodeID, dgMemo.reason))
+        self.forgetSentMemo(memo)
+        self.sendQueuedRequests(memo.nodeID)
+        memo.rejectedReply(memo)
+
+    def forgetSentMemo(self, memo):
+        sent = self.sentMemos.get(memo.nodeID, [])
+        if memo in sent:
+            sent.remove(memo)
+            if not sent:
+                del self.sentMemos[memo.nodeID]
+        self.replyDeadlines.pop(memo, None)
+
+    def requestAccepted(self, memo, flags=None):
+        '''The node has the request. A write without Reply Pending is
+        done; otherwise the reply is due within the node's timeout.
+
+        Args:
+            memo (Union[MemoryReadMemo,MemoryWriteMemo,StreamCommandMemo]):
+                The request acknowledged.
+            flags (int, optional): Flags of the Datagram_Received_OK, or
+                None if it had none.
+        '''
+        if memo not in self.sentMemos.get(memo.nodeID, ()):
+            return
+        if (isinstance(memo, MemoryWriteMemo) and flags is not None
+                and flags & REPLY_PENDING == 0):
+            self.forgetSentMemo(memo)
+            self.sendQueuedRequests(memo.nodeID)
+            memo.okReply(memo)
+            return
+        self.replyDeadlines[memo] = self.clock() + self.timeoutFor(flags)
+
+    def timeoutFor(self, flags):
+        '''Seconds to wait for a reply after a Datagram_Received_OK with
+        flags: 2^N for a timeout exponent N, else replyTimeout.'''
+        if flags is None or flags & TIMEOUT_EXPONENT == 0:
+            return self.replyTimeout
+        return 2 ** (flags & TIMEOUT_EXPONENT)
+
     def receivedOkReplyToWrite(self, memo):
         '''Wait for following response to be returned via listener.
         This is normal.
         '''
         pass
 
+    def checkTimeouts(self, now=None):
+        '''Fail requests whose node acknowledged them but sent no reply
+        in time, and send the requests queued behind them.
+
+        Called from process(); call it periodically as well so timeouts
+        are noticed when no messages arrive.
+
+        Args:
+            now (float, optional): The current clock() value.
+        '''
+        if not self.replyDeadlines and not self.spaceInfoDeadlines:
+            return
+        if now is None:
+            now = self.clock()
+        for memo, deadline in list(self.replyDeadlines.items()):
+            if now < deadline:
+                continue
+            logging.warning("No memory reply from {} in time"
+                            "".format(memo.nodeID))
+            self.forgetSentMemo(memo)
+            self.sendQueuedRequests(memo.nodeID)
+            if isinstance(memo, StreamCommandMemo):
+                self.streamCommandFailed(memo)
+            else:
+                memo.rejectedReply(memo)
+        for key, deadline in list(self.spaceInfoDeadlines.items()):
+            if now < deadline:
+                continue
+            del self.spaceInfoDeadlines[key]
+            logging.warning("No Address Space Information reply from {}"
+                            " within {} s".format(key[0], self.replyTimeout))
+            for callback in self.spaceInfoCallbacks.pop(key, ()):
+                callback(None)
+
     def datagramReceivedListener(self, dmemo):
         '''Process a datagram.
 
-        Sends the positive reply and returns true if this is from our service.
+        Sends the positive reply and returns true if this is a reply to
+        our service. Requests from other nodes are left for a server such
+        as MemoryConfigServer.
         '''
         # node received a datagram, is it our service?
         if self.service.datagramType(dmemo.data) \
                 != DatagramService.ProtocolID.MemoryOperation :
             return False
+        if len(dmemo.data) >= 2 and not self.isReplyCommand(dmemo.data[1]):
+            return False
 
         # datagram must has a command value
         if len(dmemo.data) < 2:
@@ -210,72 +572,367 @@ class MemoryService:
         self.service.positiveReplyToDatagram(dmemo, 0x0000)
 
         # decode if read, write or some other reply
-        if dmemo.data[1] in (0x50, 0x51, 0x52, 0x53, 0x58, 0x59, 0x5A, 0x5B):
-            # read or read-error reply
-
-            # return data to requestor: first find matching memory read
-            # memo, then reply
-            for index in range(0, len(self.readMemos)):
-                if self.readMemos[index].nodeID == dmemo.srcID:
-                    tMemoryMemo = self.readMemos[index]
-                    del self.readMemos[index]
-                    # decode type of operation, hence offset for start of
-                    # data
-                    offset = 6
-                    if dmemo.data[1] == 0x50 or dmemo.data[1] == 0x58:
-                        offset = 7
-
-                    # are there any additional requests queued to send?
-                    if len(self.readMemos) > 0:
-                        self.requestMemoryReadNext(self.readMemos[0])
-
-                    # fill data for call-back to requestor
-                    if len(dmemo.data) > offset:
-                        tMemoryMemo.data = dmemo.data[offset:]
-
-                    # check for read or read error reply
-                    if (dmemo.data[1] & 0x08 == 0):
-                        tMemoryMemo.dataReply(tMemoryMemo)
-                    else:
-                        tMemoryMemo.rejectedReply(tMemoryMemo)
-                    break
-        elif dmemo.data[1] in (0x10, 0x11, 0x12, 0x13, 0x18, 0x19, 0x1A, 0x1B):
-            # write reply good, bad
-
-            # return data to requestor: first find matching memory write
-            # memo, then reply
-            for index in range(0, len(self.writeMemos)):
-                if self.writeMemos[index].nodeID == dmemo.srcID:
-                    tMemoryMemo = self.writeMemos[index]
-                    del self.writeMemos[index]
-                    if dmemo.data[1] & 0x08 == 0 :
-                        tMemoryMemo.okReply(tMemoryMemo)
-                    else:
-                        tMemoryMemo.rejectedReply(tMemoryMemo)
-                    break
-        elif dmemo.data[1] in (0x86, 0x87):  # Address Space Information Reply
-            if self.spaceLengthCallback is None:
-                logging.error("Address Space Information Reply"
-                              " received with no callback")
-                return True
-            if dmemo.data[1] == 0x86:
-                # not present
-                self.spaceLengthCallback(-1)
-                self.spaceLengthCallback = None
+        if dmemo.data[1] in (0x50, 0x51, 0x52, 0x53, 0x58, 0x59, 0x5A, 0x5B,
+                             0x10, 0x11, 0x12, 0x13, 0x18, 0x19, 0x1A, 0x1B):
+            # read, write or error reply: decode space and address, hence
+            # offset for start of data
+            if len(dmemo.data) < 6 or (dmemo.data[1] & 0x03 == 0
+                                       and len(dmemo.data) < 7):
+                logging.error("Memory reply too short: {}"
+                              "".format(list(dmemo.data)))
                 return True
-            # normal reply
-            address = ((int(dmemo.data[3]) << 24)
-                       + (int(dmemo.data[4]) << 16)
-                       + (int(dmemo.data[5]) << 8)
-                       + int(dmemo.data[6]))
-            self.spaceLengthCallback(address)
-            self.spaceLengthCallback = None
+            address = ((dmemo.data[2] << 24) | (dmemo.data[3] << 16)
+                       | (dmemo.data[4] << 8) | dmemo.data[5])
+            if dmemo.data[1] & 0x03 == 0:
+                space = dmemo.data[6]
+                offset = 7
+            else:
+                space = 0xFC | (dmemo.data[1] & 0x03)
+                offset = 6
+
+            if dmemo.data[1] & 0x40 != 0:
+                # return data to requestor: first find matching memory read
+                # memo, then reply
+                tMemoryMemo = self.matchSentMemo(dmemo.srcID, MemoryReadMemo,
+                                                 space, address)
+                if tMemoryMemo is None:
+                    return True
+
+                # fill data for call-back to requestor
+                if len(dmemo.data) > offset:
+                    tMemoryMemo.data = dmemo.data[offset:]
+
+                # check for read or read error reply
+                if (dmemo.data[1] & 0x08 == 0):
+                    tMemoryMemo.dataReply(tMemoryMemo)
+                else:
+                    tMemoryMemo.rejectedReply(tMemoryMemo)
+                # are there any additional requests queued to send?
+                self.sendQueuedRequests(dmemo.srcID)
+            else:
+                # write reply good, bad
+                tMemoryMemo = self.matchSentMemo(dmemo.srcID, MemoryWriteMemo,
+                                                 space, address)
+                if tMemoryMemo is None:
+                    return True
+                if dmemo.data[1] & 0x08 == 0 :
+                    tMemoryMemo.okReply(tMemoryMemo)
+                else:
+                    tMemoryMemo.rejectedReply(tMemoryMemo)
+                self.sendQueuedRequests(dmemo.srcID)
+        elif dmemo.data[1] & 0xB4 == 0x30:
+            # Read Stream (0x7x) or Write Stream (0x3x) reply
+            self.receivedStreamCommandReply(dmemo)
+        elif dmemo.data[1] in (0x86, 0x87):  # Address Space Information Reply
+            self.receivedSpaceInfo(dmemo)
         else:
             logging.error("Did not expect reply of type 0x{:02X}"
                           "".format(dmemo.data[1]))
 
         return True
 
+    @staticmethod
+    def isReplyCommand(command):
+        """Whether a memory configuration command byte is a reply (to be
+        handled here) rather than a request to this node."""
+        if command < 0x80:
+            return command & 0x10 != 0  # read, write and stream replies
+        return command in REPLY_COMMANDS
+
+    def requestMemoryBulkRead(self, memo):
+        """Read a range of any length, or up to a 0 byte, in one stream
+        if the node supports them, else in 64-byte chunks, keeping up to
+        memo.window chunk reads queued.
+
+        Args:
+            memo (MemoryBulkReadMemo): The range to read.
+        """
+        if self.usesStreams(memo.nodeID):
+            self.queueRequest(StreamCommandMemo(memo,
+                                                self.streamCommandRejected))
+            return
+        self.queueBulkReads(memo)
+
+    def usesStreams(self, nodeID):
+        return (self.streamService is not None
+                and self.streamSupport.get(nodeID, False))
+
+    def requestStreamCommandNext(self, memo):
+        """Send a Read Stream or Write Stream command. For a read, the
+        stream the node will open is expected first.
+
+        Args:
+            memo (StreamCommandMemo): Command to send.
+        """
+        bulk = memo.bulkMemo
+        (byte6, flag) = self.spaceDecode(memo.space)
+        read = isinstance(bulk, MemoryBulkReadMemo)
+        command = 0x60 if read else 0x20
+        data = bytearray([DatagramService.ProtocolID.MemoryOperation.value,
+                          command if byte6 else command | flag])
+        data += memo.address.to_bytes(4, "big")
+        if byte6:
+            data.append(memo.space & 0xFF)
+        if read:
+            memo.streamMemo = StreamReadMemo(
+                memo.nodeID, lambda stream: self.streamReadDone(bulk),
+                lambda stream: self.streamReadChunk(bulk, stream),
+                lambda stream: self.streamCommandFailed(memo))
+            self.streamService.expectStream(memo.streamMemo)
+            count = STREAM_TO_END if bulk.length is None else bulk.length
+            data += bytearray([0xFF, memo.streamMemo.destStreamID])
+            data += count.to_bytes(4, "big")
+        else:
+            data += bytearray([0xFF, 0xFF])  # stream IDs chosen later
+        self.service.sendDatagram(DatagramWriteMemo(
+            memo.nodeID, data,
+            lambda dgMemo: self.requestAccepted(memo, dgMemo.flags),
+            lambda dgMemo: self.requestRejected(memo, dgMemo)))
+
+    def receivedStreamCommandReply(self, dmemo):
+        """Start sending a Write Stream once the node has accepted it, or
+        fail the transfer if the node replied with an error."""
+        data = dmemo.data
+        offset = 7 if data[1] & 0x03 == 0 else 6
+        if len(data) < offset:
+            logging.error("Memory stream reply too short: {}"
+                          "".format(list(data)))
+            return
+        space = data[6] if data[1] & 0x03 == 0 else 0xFC | (data[1] & 0x03)
+        memo = self.matchSentMemo(dmemo.srcID, StreamCommandMemo, space,
+                                  int.from_bytes(data[2:6], "big"))
+        if memo is None:
+            return
+        self.sendQueuedRequests(dmemo.srcID)
+        if data[1] & 0x08 != 0 or len(data) < offset + 2:
+            self.streamCommandFailed(memo)
+            return
+        bulk = memo.bulkMemo
+        if isinstance(bulk, MemoryBulkWriteMemo):
+            self.streamService.sendStream(StreamWriteMemo(
+                bulk.nodeID, bulk.data,
+                lambda stream: self.streamWriteProgress(bulk, stream, True),
+                lambda stream: self.streamRejected(memo, stream),
+                data[offset + 1],
+                lambda stream: self.streamWriteProgress(bulk, stream)))
+
+    def streamWriteProgress(self, memo, stream, complete=False):
+        """Report how much of a Write Stream has been sent, and finish the
+        bulk write once the stream completes."""
+        memo.written = stream.sent
+        if memo.progressReply is not None and not complete:
+            memo.progressReply(memo)
+        if complete:
+            memo.done = True
+            memo.okReply(memo)
+
+    def streamRejected(self, memo, stream):
+        """A Write Stream's stream was refused, so streams aren't used
+        with the node again, or timed out, which fails the transfer."""
+        if stream.errorCode is None:
+            self.streamCommandFailed(memo)
+        else:
+            self.streamCommandRejected(memo)
+
+    def streamCommandFailed(self, memo):
+        """The node couldn't do a stream command, such as one outside the
+        space; fail the transfer as a datagram error reply would."""
+        bulk = memo.bulkMemo
+        logging.warning("Memory stream with {} failed at address 0x{:X}"
+                        "".format(memo.nodeID, memo.address))
+        if isinstance(bulk, MemoryBulkWriteMemo):
+            bulk.done = True
+            bulk.rejectedReply(bulk)
+            return
+        self.streamService.cancelExpectedStream(memo.streamMemo)
+        if not bulk.done:
+            bulk.done = True
+            bulk.rejectedReply(bulk)
+
+    def streamCommandRejected(self, memo):
+        """A node refused a stream command or stream; stop using streams
+        with it and do the transfer with datagrams."""
+        logging.info("Node {} refused a memory stream, using datagrams"
+                     "".format(memo.nodeID))
+        self.streamSupport[memo.nodeID] = False
+        bulk = memo.bulkMemo
+        if isinstance(bulk, MemoryBulkWriteMemo):
+            self.queueBulkWrites(bulk)
+            return
+        if memo.streamMemo is not None:
+            self.streamService.cancelExpectedStream(memo.streamMemo)
+        if not bulk.done and len(bulk.data) == 0:
+            self.queueBulkReads(bulk)
+
+    def streamReadChunk(self, memo, stream):
+        """Add newly streamed data to a bulk read, stopping at its length
+        or a 0 byte."""
+        if memo.done:
+            return
+        start = memo.nextAddress - memo.address
+        data = stream.data[start:]
+        memo.nextAddress += len(data)
+        end = -1
+        if memo.length is None:
+            end = data.find(0)
+            if end >= 0:
+                data = data[:end]
+        else:
+            data = data[:memo.length - len(memo.data)]
+        memo.data.extend(data)
+        if memo.chunkReply is not None:
+            memo.chunkReply(memo)
+        if end >= 0 or (memo.length is not None
+                        and len(memo.data) >= memo.length):
+            memo.done = True
+            memo.dataReply(memo)
+
+    def streamReadDone(self, memo):
+        """The stream ended, at the end of the range or space."""
+        if not memo.done:
+            memo.done = True
+            memo.dataReply(memo)
+
+    def queueBulkReads(self, memo):
+        """Queue chunk reads for a bulk read, up to its window."""
+        end = None if memo.length is None else memo.address + memo.length
+        while not memo.done and memo.readsQueued < memo.window:
+            size = 64
+            if end is not None:
+                size = min(size, end - memo.nextAddress)
+                if size <= 0:
+                    return
+            chunk = MemoryReadMemo(
+                memo.nodeID, size, memo.space, memo.nextAddress,
+                lambda chunk: self.bulkChunkRejected(memo, chunk),
+                lambda chunk: self.bulkChunkReceived(memo, chunk))
+            memo.nextAddress += size
+            memo.readsQueued += 1
+            memo.chunkReads.add(chunk)
+            self.requestMemoryRead(chunk)
+
+    def dropQueuedChunks(self, memo):
+        """Remove a finished bulk read's chunk reads not yet sent, so they
+        don't read past its end or hold up the node's queue."""
+        queue = self.pendingMemos.get(memo.nodeID)
+        if queue is None:
+            return
+        kept = deque(m for m in queue if m not in memo.chunkReads)
+        memo.readsQueued -= len(queue) - len(kept)
+        memo.chunkReads.intersection_update(
+            self.sentMemos.get(memo.nodeID, ()))
+        if kept:
+            self.pendingMemos[memo.nodeID] = kept
+        else:
+            del self.pendingMemos[memo.nodeID]
+
+    def bulkChunkReceived(self, memo, chunk):
+        """Add a chunk to its bulk read, in address order, and finish the
+        read at its length, a 0 byte (if reading until one) or a short
+        chunk (the end of the space)."""
+        memo.readsQueued -= 1
+        memo.chunkReads.discard(chunk)
+        if memo.done:
+            return  # read ahead past the end
+        memo.chunks[chunk.address] = chunk
+        while True:
+            chunk = memo.chunks.pop(memo.address + len(memo.data), None)
+            if chunk is None:
+                break
+            data = chunk.data
+            end = -1
+            if memo.length is None:
+                end = data.find(0)
+                if end >= 0:
+                    data = data[:end]
+            memo.data.extend(data)
+            if memo.chunkReply is not None:
+                memo.chunkReply(memo)
+            if (end >= 0 or len(chunk.data) < chunk.size
+                    or (memo.length is not None
+                        and len(memo.data) >= memo.length)):
+                memo.done = True
+                self.dropQueuedChunks(memo)
+                memo.dataReply(memo)
+                return
+        self.queueBulkReads(memo)
+
+    def bulkChunkRejected(self, memo, chunk):
+        """A chunk couldn't be read. When reading until a 0 byte, an error
+        right after the data read so far is taken as the end of the
+        space; otherwise the bulk read fails."""
+        memo.readsQueued -= 1
+        memo.chunkReads.discard(chunk)
+        if memo.done:
+            return
+        memo.done = True
+        self.dropQueuedChunks(memo)
+        if (memo.length is None and len(memo.data) > 0
+                and chunk.address == memo.address + len(memo.data)):
+            memo.dataReply(memo)
+            return
+        logging.warning("Bulk read from {} failed at address 0x{:X}"
+                        "".format(memo.nodeID, chunk.address))
+        memo.rejectedReply(memo)
+
+    def requestMemoryBulkWrite(self, memo):
+        """Write a range of any length, in one stream if the node supports
+        them, else in 64-byte writes.
+
+        Args:
+            memo (MemoryBulkWriteMemo): What to write.
+        """
+        if self.usesStreams(memo.nodeID):
+            self.queueRequest(StreamCommandMemo(memo,
+                                                self.streamCommandRejected))
+            return
+        self.queueBulkWrites(memo)
+
+    def queueBulkWrites(self, memo):
+        """Queue 64-byte writes for a bulk write, up to its window. Each is
+        copied from memo.data only when queued, so a large image (such as
+        a mapped file) isn't copied at once."""
+        if len(memo.data) == 0 and not memo.done:
+            memo.done = True
+            memo.okReply(memo)
+            return
+        while (not memo.done and memo.writesQueued < memo.window
+                and memo.nextOffset < len(memo.data)):
+            offset = memo.nextOffset
+            chunk = bytearray(memo.data[offset:offset + 64])
+            memo.nextOffset += len(chunk)
+            memo.writesQueued += 1
+            self.requestMemoryWrite(MemoryWriteMemo(
+                memo.nodeID,
+                lambda chunk: self.bulkChunkWritten(memo, chunk),
+                lambda chunk: self.bulkChunkWriteRejected(memo, chunk),
+                len(chunk), memo.space, memo.address + offset, chunk))
+
+    def bulkChunkWritten(self, memo, chunk):
+        """Count a written chunk, finishing the bulk write after the last.
+        """
+        memo.writesQueued -= 1
+        if memo.done:
+            return
+        memo.written += len(chunk.data)
+        if memo.progressReply is not None:
+            memo.progressReply(memo)
+        if memo.written >= len(memo.data):
+            memo.done = True
+            memo.okReply(memo)
+            return
+        self.queueBulkWrites(memo)
+
+    def bulkChunkWriteRejected(self, memo, chunk):
+        """A chunk couldn't be written, so the bulk write fails."""
+        memo.writesQueued -= 1
+        if memo.done:
+            return
+        memo.done = True
+        logging.warning("Bulk write to {} failed at address 0x{:X}"
+                        "".format(memo.nodeID, chunk.address))
+        memo.rejectedReply(memo)
+
     def requestMemoryWrite(self, memo):
         """Request memory write.
 
@@ -283,7 +940,14 @@ class MemoryService:
             memo (MemoryWriteMemo): information to send
         """
         # preserve the request
-        self.writeMemos.append(memo)
+        self.queueRequest(memo)
+
+    def requestMemoryWriteNext(self, memo):
+        """send the write request
+
+        Args:
+            memo (MemoryWriteMemo): Request to send.
+        """
         # create & send a write datagram
         byte6 = False
         flag = 0
@@ -300,7 +964,10 @@ class MemoryService:
         if byte6:
             data.extend([(memo.space & 0xFF)])
         data.extend(memo.data)
-        dgWriteMemo = DatagramWriteMemo(memo.nodeID, data)
+        dgWriteMemo = DatagramWriteMemo(
+            memo.nodeID, data,
+            lambda dgMemo: self.requestAccepted(memo, dgMemo.flags),
+            lambda dgMemo: self.requestRejected(memo, dgMemo))
         self.service.sendDatagram(dgWriteMemo)
 
     def requestSpaceLength(self, space, nodeID, callback):
@@ -320,17 +987,108 @@ class MemoryService:
         Returns:
             None
         '''
-        if self.spaceLengthCallback is not None:
-            logging.error("Overlapping calls to requestSpaceLength")
+        def spaceInfoReply(info):
+            if info is None or not info.present:
+                callback(-1)
+            else:
+                callback(info.highestAddress)
+        self.requestSpaceInfo(space, nodeID, spaceInfoReply)
+
+    def requestSpaceInfo(self, space, nodeID, callback):
+        '''Request information about a memory space on a remote node.
+
+        A cached result is passed to the callback before this returns.
+        Otherwise the query is sent, unless one for the same node and
+        space is already waiting, in which case both get its reply.
+
+        Args:
+            space (int): Encoded memory space identifier.
+            nodeID (NodeID): ID of remote node to ask.
+            callback (Callable): Receives the SpaceInfo, or None if the
+                query failed.
+        '''
+        info = self.spaceInfoCache.get(nodeID, {}).get(space)
+        if info is not None:
+            callback(info)
             return
-        self.spaceLengthCallback = callback
+        key = (nodeID, space)
+        callbacks = self.spaceInfoCallbacks.get(key)
+        if callbacks is not None:
+            callbacks.append(callback)  # already asked
+            return
+        self.spaceInfoCallbacks[key] = [callback]
         # send request
         dgReqMemo = DatagramWriteMemo(
             nodeID,
-            [DatagramService.ProtocolID.MemoryOperation.value, 0x84, space]
+            bytearray([DatagramService.ProtocolID.MemoryOperation.value,
+                       0x84, space]),
+            lambda dgMemo: self.spaceInfoAccepted(key, dgMemo.flags),
+            lambda dgMemo: self.spaceInfoRequestRejected(key, dgMemo)
         )
         self.service.sendDatagram(dgReqMemo)
 
+    def spaceInfoAccepted(self, key, flags=None):
+        if key in self.spaceInfoCallbacks:
+            self.spaceInfoDeadlines[key] = (self.clock()
+                                            + self.timeoutFor(flags))
+
+    def spaceInfoRequestRejected(self, key, dgMemo):
+        '''The query datagram failed, so no reply will come.'''
+        logging.warning("Address Space Information request to {} failed: {}"
+                        "".format(key[0], dgMemo.reason))
+        for callback in self.spaceInfoCallbacks.pop(key, ()):
+            callback(None)
+
+    def receivedSpaceInfo(self, dmemo):
+        '''Decode an Address Space Information Reply, cache it and pass
+        it to the callbacks waiting for it.'''
+        data = dmemo.data
+        if len(data) < 3:
+            logging.error("Address Space Information Reply too short: {}"
+                          "".format(list(data)))
+            return
+        space = data[2]
+        if data[1] == 0x86 or len(data) < 7:
+            # not present
+            info = SpaceInfo(dmemo.srcID, space, False)
+        else:
+            # normal reply
+            flags = data[7] if len(data) > 7 else 0
+            lowAddress = 0
+            if flags & 0x02 != 0 and len(data) >= 12:
+                lowAddress = self.arrayToInt(data[8:12])
+            info = SpaceInfo(dmemo.srcID, space, True,
+                             self.arrayToInt(data[3:7]),
+                             flags & 0x01 != 0, lowAddress)
+        self.spaceInfoDeadlines.pop((dmemo.srcID, space), None)
+        callbacks = self.spaceInfoCallbacks.pop((dmemo.srcID, space), None)
+        if callbacks is None:
+            logging.error("Address Space Information Reply"
+                          " received with no callback")
+            return
+        self.spaceInfoCache.setdefault(dmemo.srcID, {})[space] = info
+        for callback in callbacks:
+            callback(info)
+
+    def process(self, message):
+        '''Processor entry point: forget what a node reported about its
+        spaces once it reinitializes, note which nodes support streams, and
+        check for replies that are overdue.
+
+        Returns:
+            bool: Always False; nothing published changes.
+        '''
+        self.checkTimeouts()
+        if message.mti in (MTI.Initialization_Complete,
+                           MTI.Initialization_Complete_Simple):
+            self.spaceInfoCache.pop(message.source, None)
+        elif (message.mti == MTI.Protocol_Support_Reply
+                and len(message.data) > 0):
+            self.streamSupport[message.source] = (
+                PIP.STREAM_PROTOCOL
+                in PIP.setContentsFromList(message.data))
+        return False
+
     def arrayToInt(self, data):
         """Convert an array in MSB-first order to an integer
 
@@ -0,0 +1,177 @@
+'''
+Write-behind buffer for memory writes.
+
+Configuration tools often write many small adjacent fields one after
+another. Submitting them through a ``MemoryWriteBuffer`` instead of
+directly to ``MemoryService.requestMemoryWrite(_:)`` holds them briefly
+per node and memory space, merges adjacent and overlapping writes, and
+sends the result as as few datagrams (of up to 64 bytes) as possible.
+
+- Create with the ``MemoryService`` to write through
+- Submit ``MemoryWriteMemo`` objects via ``requestMemoryWrite(_:)``
+- Call ``commit()`` to send everything held, or call ``checkTimeouts()``
+  periodically to send writes that have been idle for ``flushDelay``
+- Each memo gets its own okReply or rejectedReply once every datagram
+  carrying its bytes has been answered
+
+Reads through the MemoryService don't see writes still held here, so
+commit before reading back.
+'''
+
+import time
+
+from openlcb.memoryservice import MemoryWriteMemo
+
+FLUSH_DELAY = 0.05  # default seconds a write waits for neighbors
+MAX_WRITE = 64  # most data bytes in one memory write datagram
+
+
+class PendingSegment:
+    """Contiguous bytes waiting to be written, with the memos that
+    contributed them.
+
+    Args:
+        address (int): Address of the first byte.
+        data (bytearray): The bytes; later writes already applied.
+        memos (list[MemoryWriteMemo]): Contributing writes, in order.
+    """
+    def __init__(self, address, data, memos):
+        # For args see class docstring.
+        self.address = address
+        self.data = data
+        self.memos = memos
+
+    def end(self):
+        return self.address + len(self.data)
+
+
+class MemoryWriteBuffer:
+    """Merge memory writes per (node, space) before sending them.
+
+    Args:
+        memoryService (MemoryService): Where merged writes are sent.
+        flushDelay (float, optional): Seconds without a new write to a
+            node and space before checkTimeouts sends its writes. None
+            means only commit() sends them.
+
+    Attributes:
+        segments (dict): (NodeID, space) to a list of PendingSegments,
+            in address order and neither overlapping nor adjacent.
+        flushTimes (dict): (NodeID, space) to the clock time after which
+            checkTimeouts sends its segments.
+        clock (Callable): Returns the current time in seconds;
+            time.monotonic unless replaced for testing.
+    """
+
+    def __init__(self, memoryService, flushDelay=FLUSH_DELAY):
+        self.memoryService = memoryService
+        self.flushDelay = flushDelay
+        self.segments = {}
+        self.flushTimes = {}
+        self.clock = time.monotonic
+
+    def requestMemoryWrite(self, memo):
+        """Hold a write, merging it with held writes it overlaps or
+        touches. Where they overlap, this write's bytes win.
+
+        Args:
+            memo (MemoryWriteMemo): information to send
+        """
+        if len(memo.data) == 0:
+            memo.okReply(memo)  # nothing to write
+            return
+        key = (memo.nodeID, memo.space)
+        segments = self.segments.setdefault(key, [])
+        address = memo.address
+        end = address + len(memo.data)
+        # the segments this one overlaps or touches are consecutive
+        first = 0
+        while first < len(segments) and segments[first].end() < address:
+            first += 1
+        last = first
+        while last < len(segments) and segments[last].address <= end:
+            last += 1
+        merged = segments[first:last]
+        if merged:
+            address = min(address, merged[0].address)
+            end = max(end, merged[-1].end())
+        data = bytearray(end - address)
+        memos = []
+        for segment in merged:
+            start = segment.address - address
+            data[start:start + len(segment.data)] = segment.data
+            memos.extend(segment.memos)
+        start = memo.address - address
+        data[start:start + len(memo.data)] = memo.data
+        memos.append(memo)
+        segments[first:last] = [PendingSegment(address, data, memos)]
+        if self.flushDelay is not None:
+            self.flushTimes[key] = self.clock() + self.flushDelay
+
+    def commit(self, nodeID=None, space=None):
+        """Send held writes now.
+
+        Args:
+            nodeID (NodeID, optional): Only send writes to this node.
+            space (int, optional): Only send writes to this space.
+        """
+        for key in list(self.segments):
+            if nodeID is not None and key[0] != nodeID:
+                continue
+            if space is not None and key[1] != space:
+                continue
+            self.flush(key)
+
+    def checkTimeouts(self, now=None):
+        """Send the writes to each node and space that have had no new
+        write for flushDelay. Call periodically.
+
+        Args:
+            now (float, optional): The current clock() value.
+        """
+        if now is None:
+            now = self.clock()
+        for key, flushTime in list(self.flushTimes.items()):
+            if now >= flushTime:
+                self.flush(key)
+
+    def flush(self, key):
+        """Send the segments held for one (node, space) in datagrams of
+        up to MAX_WRITE bytes."""
+        self.flushTimes.pop(key, None)
+        nodeID, space = key
+        for segment in self.segments.pop(key, ()):
+            # each memo completes when all chunks carrying its bytes have
+            results = {}  # id(memo) to [chunks outstanding, failed]
+            for memo in segment.memos:
+                first = (memo.address - segment.address) // MAX_WRITE
+                last = (memo.address + len(memo.data) - 1
+                        - segment.address) // MAX_WRITE
+                results[id(memo)] = [last - first + 1, False]
+            for offset in range(0, len(segment.data), MAX_WRITE):
+                chunkData = segment.data[offset:offset + MAX_WRITE]
+                start = segment.address + offset
+                covered = [memo for memo in segment.memos
+                           if memo.address < start + len(chunkData)
+                           and memo.address + len(memo.data) > start]
+                chunk = MemoryWriteMemo(
+                    nodeID,
+                    lambda chunk, covered=covered, results=results:
+                        self.chunkDone(covered, results, False),
+                    lambda chunk, covered=covered, results=results:
+                        self.chunkDone(covered, results, True),
+                    len(chunkData), space, start, chunkData)
+                self.memoryService.requestMemoryWrite(chunk)
+
+    def chunkDone(self, memos, results, failed):
+        """Record a chunk's reply, and reply to each of its memos whose
+        last chunk this was."""
+        for memo in memos:
+            result = results[id(memo)]
+            result[0] -= 1
+            result[1] = result[1] or failed
+            if result[0] == 0:
+                if result[1]:
+                    memo.rejectedReply(memo)
+                else:
+                    memo.okReply(memo)
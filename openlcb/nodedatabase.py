@@ -0,0 +1,236 @@
+'''
+Remember remote nodes between sessions in an SQLite file, so a warm
+start doesn't query every node for its SNIP, PIP and events again.
+
+- Create with the file path and give it to ``RemoteNodeStore``
+- When the store first sees a node, its saved SNIP, PIP and events are
+  restored and it isn't queried, unless the node has just sent
+  Initialization_Complete. Rows are read as nodes are seen, not all at
+  startup; ``loadAll(_:)`` fills a store with every saved node at once,
+  such as for a node list before the layout is on line.
+- A node's saved data is valid until that node sends
+  Initialization_Complete; then the row is dropped and the node queried
+  again.
+- Changes are written in batches: ``checkTimeouts()``, which should be
+  called periodically, writes them ``flushDelay`` after the first
+  unwritten change; ``flush()`` does so at once, and ``close()`` before
+  closing the file. A row's SNIP, PIP and events are written only after
+  they have changed; a node that has only been seen has just its last
+  seen time and alias updated. Rows of reinitialized nodes are deleted
+  in the same batch.
+
+Each row holds the node ID, the SNIP bytes, the PIP bits, the produced
+and consumed events (8 bytes each), when the node last sent anything,
+and its last known alias on CAN.
+'''
+
+import logging
+import sqlite3
+import time
+
+from openlcb.eventid import EventID
+from openlcb.node import Node
+from openlcb.nodeid import NodeID
+from openlcb.pip import PIP
+
+FLUSH_DELAY = 5.0  # default seconds after a change before it is written
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    nodeID INTEGER PRIMARY KEY,
+    snip BLOB NOT NULL,
+    pip INTEGER NOT NULL,
+    produced BLOB NOT NULL,
+    consumed BLOB NOT NULL,
+    lastSeen REAL,
+    alias INTEGER
+)
+"""
+
+
+def eventsToBlob(events):
+    return b"".join(bytes(event.toArray())
+                    for event in sorted(events, key=lambda e: e.eventId))
+
+
+def eventsFromBlob(blob):
+    return set(EventID(bytearray(blob[i:i + 8]))
+               for i in range(0, len(blob) - 7, 8))
+
+
+class NodeDatabase:
+    """Save and restore remote nodes in an SQLite file.
+
+    Args:
+        path (str): The database file; created if missing.
+        flushDelay (float, optional): Seconds after a change before
+            checkTimeouts writes it.
+        aliases (dict, optional): NodeID to CAN alias, such as
+            CanLink.nodeIdToAlias, read when rows are written.
+
+    Attributes:
+        dirty (dict): NodeID to the Node, for nodes whose SNIP, PIP or
+            events changed since the last flush.
+        lastSeenTimes (dict): NodeID to clock() time the node last sent a
+            message, since it was last written.
+        invalid (set): NodeIDs whose rows are to be deleted at the next
+            flush; they are no longer restored.
+        flushTime (float): clock() time after which checkTimeouts writes,
+            or None if nothing is waiting.
+        clock (Callable): Returns the current time in seconds since the
+            epoch; time.time unless replaced for testing.
+    """
+
+    def __init__(self, path, flushDelay=FLUSH_DELAY, aliases=None):
+        self.path = path
+        self.flushDelay = flushDelay
+        self.aliases = aliases if aliases is not None else {}
+        self.dirty = {}
+        self.lastSeenTimes = {}
+        self.invalid = set()
+        self.flushTime = None
+        self.clock = time.time
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+    def restoreNode(self, node):
+        """Fill a node's SNIP, PIP and events from its saved row.
+
+        Args:
+            node (Node): A node just created for its ID.
+
+        Returns:
+            bool: True if the node was saved and has been filled in.
+        """
+        if node.id in self.invalid:
+            return False
+        row = self.connection.execute(
+            "SELECT snip, pip, produced, consumed FROM nodes"
+            " WHERE nodeID = ?", (node.id.nodeId,)).fetchone()
+        if row is None:
+            return False
+        self.fillNode(node, row)
+        return True
+
+    @staticmethod
+    def fillNode(node, row):
+        snip, pip, produced, consumed = row
+        node.snip.addData(bytearray(snip))
+        node.pipSet = PIP.setContentsFromInt(pip)
+        node.events.eventsProduced = eventsFromBlob(produced)
+        node.events.eventsConsumed = eventsFromBlob(consumed)
+
+    def loadAll(self, store):
+        """Store every saved node not already in a NodeStore.
+
+        Args:
+            store (NodeStore): Where to add them.
+
+        Returns:
+            int: How many were added.
+        """
+        added = 0
+        for row in self.connection.execute(
+                "SELECT nodeID, snip, pip, produced, consumed FROM nodes"):
+            nodeID = NodeID(row[0])
+            if nodeID in self.invalid or store.isPresent(nodeID):
+                continue
+            node = Node(nodeID)
+            self.fillNode(node, row[1:])
+            store.store(node)
+            added += 1
+        return added
+
+    def lastSeen(self, nodeID):
+        """Return (lastSeen time, alias) saved for a node, or None."""
+        if nodeID in self.lastSeenTimes:
+            return (self.lastSeenTimes[nodeID], self.aliases.get(nodeID))
+        return self.connection.execute(
+            "SELECT lastSeen, alias FROM nodes WHERE nodeID = ?",
+            (nodeID.nodeId,)).fetchone()
+
+    def seen(self, node):
+        """Note that a node has sent a message."""
+        self.lastSeenTimes[node.id] = self.clock()
+        self.scheduleFlush()
+
+    def nodeChanged(self, node):
+        """Note that a node's SNIP, PIP or events have changed, so its row
+        is written at the next flush."""
+        self.dirty[node.id] = node
+        self.scheduleFlush()
+
+    def invalidate(self, nodeID):
+        """Drop a node's row at the next flush, as it has reinitialized
+        and its saved data may be out of date."""
+        self.dirty.pop(nodeID, None)
+        self.invalid.add(nodeID)
+        self.scheduleFlush()
+
+    def scheduleFlush(self):
+        if self.flushTime is None and self.flushDelay is not None:
+            self.flushTime = self.clock() + self.flushDelay
+
+    def checkTimeouts(self, now=None):
+        """Write changes once flushDelay has passed since the first
+        unwritten one. Call periodically.
+
+        Args:
+            now (float, optional): The current clock() value.
+        """
+        if self.flushTime is None:
+            return
+        if now is None:
+            now = self.clock()
+        if now >= self.flushTime:
+            self.flush()
+
+    def flush(self):
+        """Write every change now, in one transaction."""
+        self.flushTime = None
+        if not (self.dirty or self.lastSeenTimes or self.invalid):
+            return
+        deleted = [(nodeID.nodeId,) for nodeID in self.invalid]
+        seen = [(seenTime, self.aliases.get(nodeID), nodeID.nodeId)
+                for nodeID, seenTime in self.lastSeenTimes.items()
+                if nodeID not in self.dirty]
+        rows = []
+        for nodeID, node in self.dirty.items():
+            if not node.pipSet and node.snip.index == 0:
+                continue  # nothing learned yet, such as after a restart
+            pips = 0
+            for pip in node.pipSet:
+                pips |= pip.value
+            rows.append((
+                nodeID.nodeId, bytes(node.snip.data[:node.snip.index]), pips,
+                eventsToBlob(node.events.eventsProduced),
+                eventsToBlob(node.events.eventsConsumed),
+                self.lastSeenTimes.get(nodeID), self.aliases.get(nodeID)))
+        self.dirty = {}
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    "DELETE FROM nodes WHERE nodeID = ?", deleted)
+                self.connection.executemany(
+                    "UPDATE nodes SET lastSeen = ?,"
+                    " alias = COALESCE(?, alias) WHERE nodeID = ?", seen)
+                # keep the saved lastSeen and alias when not known anew
+                self.connection.executemany(
+                    "INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(nodeID) DO UPDATE SET snip = excluded.snip,"
+                    " pip = excluded.pip, produced = excluded.produced,"
+                    " consumed = excluded.consumed,"
+                    " lastSeen = COALESCE(excluded.lastSeen, lastSeen),"
+                    " alias = COALESCE(excluded.alias, alias)", rows)
+        except sqlite3.Error as ex:
+            logging.error("Couldn't save nodes to {}: {}"
+                          "".format(self.path, ex))
+            return
+        self.lastSeenTimes = {}
+        self.invalid = set()
+
+    def close(self):
+        """Write changes and close the file."""
+        self.flush()
+        self.connection.close()
@@ -1,5 +1,157 @@
+from bisect import bisect_left
+
+from openlcb.eventid import EventID
+from openlcb.mti import MTI
 from openlcb.nodeid import NodeID
 
+# Messages about the link itself, which concern every node
+BROADCAST_MTIS = (
+    MTI.Link_Layer_Up,
+    MTI.Link_Layer_Quiesce,
+    MTI.Link_Layer_Restarted,
+    MTI.Link_Layer_Down,
+)
+
+
+# SNIP fields each indexed under their own name
+SNIP_INDEX_FIELDS = (
+    "manufacturerName",
+    "modelName",
+    "userProvidedNodeName",
+    "userProvidedDescription",
+)
+
+# Built-in indexes each message may change in the nodes it concerns, as
+# RemoteNodeProcessor handles it; views are re-sorted after these too
+INDEXES_CHANGED_BY = {
+    MTI.Initialization_Complete: SNIP_INDEX_FIELDS + ("pip",),
+    MTI.Initialization_Complete_Simple: SNIP_INDEX_FIELDS + ("pip",),
+    MTI.Protocol_Support_Reply: ("pip",),
+    MTI.Simple_Node_Ident_Info_Request: SNIP_INDEX_FIELDS,
+    MTI.Simple_Node_Ident_Info_Reply: SNIP_INDEX_FIELDS,
+}
+
+# Messages that add the one event they carry to a node, by index
+EVENT_INDEX_OF = {
+    MTI.Producer_Identified_Active: "produces",
+    MTI.Producer_Identified_Inactive: "produces",
+    MTI.Producer_Identified_Unknown: "produces",
+    MTI.Producer_Consumer_Event_Report: "produces",
+    MTI.Consumer_Identified_Active: "consumes",
+    MTI.Consumer_Identified_Inactive: "consumes",
+    MTI.Consumer_Identified_Unknown: "consumes",
+}
+
+BUILT_IN_INDEXES = SNIP_INDEX_FIELDS + ("pip", "produces", "consumes")
+
+
+def nodeNameKey(node) :
+    '''Sort key of the default view: SNIP user name, blanks at front'''
+    return node.snip.userProvidedNodeName
+
+
+class SortedNodeView :
+    '''Nodes kept in order of a key, by bisect insertion, so adding or
+    re-sorting one node doesn't sort them all.
+
+    Ties are ordered by node ID. Iterate, index or len() like a list.
+
+    Args:
+        key (Callable[Node]): Returns the value to sort a node by.
+    '''
+
+    def __init__(self, key) :
+        self.key = key
+        self.entries = []  # (key, node ID number) in order
+        self.nodes = []  # in the same order as entries
+        self.keys = {}  # NodeID to its entry, to find it again
+
+    def add(self, node) :
+        entry = (self.key(node), node.id.nodeId)
+        index = bisect_left(self.entries, entry)
+        self.entries.insert(index, entry)
+        self.nodes.insert(index, node)
+        self.keys[node.id] = entry
+
+    def remove(self, node) :
+        entry = self.keys.pop(node.id, None)
+        if entry is None :
+            return
+        index = bisect_left(self.entries, entry)
+        del self.entries[index]
+        del self.nodes[index]
+
+    def update(self, node) :
+        '''Move a node whose key may have changed; True if it moved.'''
+        entry = self.keys.get(node.id)
+        if entry is not None and entry[0] == self.key(node) :
+            return False
+        self.remove(node)
+        self.add(node)
+        return True
+
+    def __iter__(self) :
+        return iter(self.nodes)
+
+    def __len__(self) :
+        return len(self.nodes)
+
+    def __getitem__(self, index) :
+        return self.nodes[index]
+
+
+class NodeIndex :
+    '''Map each value some nodes have, such as a model name or a produced
+    event, to the IDs of those nodes.
+
+    Args:
+        values (Callable[Node]): Returns the values a node has, as an
+            iterable.
+    '''
+
+    def __init__(self, values) :
+        self.values = values
+        self.byValue = {}  # value to set of NodeIDs
+        self.valuesOf = {}  # NodeID to the set of values indexed
+
+    def update(self, node) :
+        '''Index a node's current values; True if they changed.'''
+        old = self.valuesOf.get(node.id, set())
+        new = set(self.values(node))
+        if new == old :
+            return False
+        for value in old - new :
+            ids = self.byValue[value]
+            ids.discard(node.id)
+            if not ids :
+                del self.byValue[value]
+        for value in new - old :
+            self.byValue.setdefault(value, set()).add(node.id)
+        self.valuesOf[node.id] = new
+        return True
+
+    def add(self, node, value) :
+        '''Index one more value of a node, if the node has it, without
+        reading all of its values again; True if it was new.'''
+        values = self.valuesOf.setdefault(node.id, set())
+        if value in values or value not in self.values(node) :
+            return False
+        values.add(value)
+        self.byValue.setdefault(value, set()).add(node.id)
+        return True
+
+    def remove(self, node) :
+        for value in self.valuesOf.pop(node.id, ()) :
+            ids = self.byValue[value]
+            ids.discard(node.id)
+            if not ids :
+                del self.byValue[value]
+
+    def find(self, value) :
+        '''Return the IDs of the nodes with value, as a set not to be
+        changed.'''
+        return self.byValue.get(value, frozenset())
+
 
 class NodeStore :
     '''
@@ -7,30 +159,152 @@ class NodeStore :
 
     Storage and indexing methods are an internal detail.
     You can't remove a node; once we know about it, we know about it.
+
+    Messages are routed to the nodes they concern: an addressed message
+    to its source and destination nodes, link layer messages to every
+    node through fanOut, and other global messages to every node, or
+    only to their source node if routeGlobalToSource is set.
+
+    ``nodes`` is kept sorted by SNIP user name (ascending, blanks at
+    front); addSortedView adds other orders. ``indexes`` find nodes by
+    each SNIP_INDEX_FIELDS value, by PIP ("pip"), and by produced and
+    consumed event ("produces", "consumes"); ``query`` combines them.
+    Views and indexes are updated as nodes are stored and after
+    processors have handled a message for them, as a SNIP, PIP or event
+    reply may change a node. Only what the message can change is updated
+    (see INDEXES_CHANGED_BY and EVENT_INDEX_OF), so other messages cost
+    nothing here; indexes from addIndex are updated after all of those
+    messages. Call nodeChanged after changing a node some other way.
     '''
 
+    routeGlobalToSource = False
+
     def __init__(self) :
         self.byIdMap = {}
-        self.nodes = []
+        self.nodes = SortedNodeView(nodeNameKey)
+        self.views = [self.nodes]
+        self.indexes = {}
+        for field in SNIP_INDEX_FIELDS :
+            self.indexes[field] = NodeIndex(
+                lambda node, field=field: (getattr(node.snip, field),))
+        self.indexes["pip"] = NodeIndex(lambda node: node.pipSet)
+        self.indexes["produces"] = NodeIndex(
+            lambda node: node.events.eventsProduced)
+        self.indexes["consumes"] = NodeIndex(
+            lambda node: node.events.eventsConsumed)
         self.processors = []
 
     # Store a new node or replace an existing stored node
     # - Parameter node: new Node content
     def store(self, node) :
+        old = self.byIdMap.get(node.id)
         self.byIdMap[node.id] = node
-        self.nodes.append(node)
+        for view in self.views :
+            if old is not None :
+                view.remove(old)
+            view.add(node)
+        for index in self.indexes.values() :
+            index.update(node)
 
-        # sort by SNIP user name (ascending, blanks at front)
-        # This can be too early, when node created but no SNIP yet,
-        #   so also sort before use in View
-        self.nodes.sort(key=lambda x: x.snip.userProvidedNodeName,
-                        reverse=True)
+    def addSortedView(self, key) :
+        '''Keep the nodes sorted by another key as well.
+
+        Args:
+            key (Callable[Node]): Returns the value to sort a node by.
+
+        Returns:
+            SortedNodeView: The view, holding every stored node.
+        '''
+        view = SortedNodeView(key)
+        for node in self.byIdMap.values() :
+            view.add(node)
+        self.views.append(view)
+        return view
+
+    def addIndex(self, name, values) :
+        '''Index the nodes by other values as well, for query.
+
+        Args:
+            name (str): The query keyword for the index.
+            values (Callable[Node]): Returns the values a node has, as an
+                iterable.
+        '''
+        index = NodeIndex(values)
+        for node in self.byIdMap.values() :
+            index.update(node)
+        self.indexes[name] = index
+
+    def nodeChanged(self, node) :
+        '''Re-sort and re-index a node, where its values have changed.'''
+        for view in self.views :
+            view.update(node)
+        for index in self.indexes.values() :
+            index.update(node)
+
+    def refreshNode(self, message, node) :
+        '''Update the views and indexes a message may have changed for a
+        node it was processed on.
+
+        Returns:
+            bool: True if any of them changed.
+        '''
+        changed = False
+        eventIndex = EVENT_INDEX_OF.get(message.mti)
+        if eventIndex is not None :
+            if len(message.data) >= 8 :
+                changed = self.indexes[eventIndex].add(
+                    node, EventID(message.data))
+        else :
+            names = INDEXES_CHANGED_BY.get(message.mti)
+            if names is None :
+                return False
+            for name in names :
+                changed = self.indexes[name].update(node) or changed
+            for view in self.views :
+                changed = view.update(node) or changed
+        for name, index in self.indexes.items() :
+            if name not in BUILT_IN_INDEXES :
+                changed = index.update(node) or changed
+        return changed
+
+    def query(self, **criteria) :
+        '''Find the nodes that match every criterion, using the indexes.
+
+        For example ``query(pip=PIP.MEMORY_CONFIGURATION_PROTOCOL,
+        manufacturerName="Acme")``.
+
+        Args:
+            criteria: Index name to the value wanted, or to a list or set
+                of values which the node must all have (such as several
+                PIPs).
+
+        Returns:
+            list[Node]: The matching nodes, in ``nodes`` order.
+
+        Raises:
+            KeyError: If a criterion names no index.
+        '''
+        matches = []
+        for name, wanted in criteria.items() :
+            index = self.indexes[name]
+            if isinstance(wanted, (list, tuple, set, frozenset)) :
+                matches.extend(index.find(value) for value in wanted)
+            else :
+                matches.append(index.find(wanted))
+        if not matches :
+            return list(self.nodes)
+        matches.sort(key=len)  # intersect from the smallest
+        ids = set(matches[0])
+        for match in matches[1:] :
+            ids &= match
+        return sorted((self.byIdMap[nodeID] for nodeID in ids),
+                      key=lambda node: self.nodes.keys[node.id])
 
     def isPresent(self, nodeID) :
-        return self.byIdMap.get(nodeID) is not None
+        return nodeID in self.byIdMap
 
     def asArray(self) :
-        return [self.byIdMap[i] for i in self.byIdMap]
+        return list(self.byIdMap.values())
 
     # Retrieve a Node's content from the store
     # - Parameter is either
@@ -39,19 +313,43 @@ class NodeStore :
     # - Returns: None if the there's no match
     def lookup(self, parm) :
         if isinstance(parm, NodeID) :
-            if parm not in self.byIdMap :
-                self.byIdMap[parm] = None
-            return self.byIdMap[parm]
+            return self.byIdMap.get(parm)
         # assume parm is string
-        for node in self.byIdMap.values() :
-            if (node.snip.userProvidedDescription == parm) :
-                return node
-        return None
+        nodes = self.query(userProvidedDescription=parm)
+        return nodes[0] if nodes else None
 
-    # Process a message across all nodes
+    def nodesFor(self, message) :
+        '''Return the stored nodes a message concerns, looked up by ID
+        rather than by scanning, except for messages to every node.
+        '''
+        if message.mti.isGlobal() and not self.routeGlobalToSource :
+            return self.asArray()
+        nodes = []
+        source = self.byIdMap.get(message.source)
+        if source is not None :
+            nodes.append(source)
+        if message.destination is not None \
+                and message.destination != message.source :
+            destination = self.byIdMap.get(message.destination)
+            if destination is not None :
+                nodes.append(destination)
+        return nodes
+
+    # Process a message on the nodes it concerns
     def invokeProcessorsOnNodes(self, message) :
+        if message.mti in BROADCAST_MTIS :
+            return self.fanOut(message)
+        return self.invokeProcessors(message, self.nodesFor(message))
+
+    # Process a message on every node, whatever its addressing
+    def fanOut(self, message) :
+        return self.invokeProcessors(message, self.asArray())
+
+    def invokeProcessors(self, message, nodes) :
         publish = False  # has any processor returned True?
         for processor in self.processors :
-            for node in self.byIdMap.values() :
+            for node in nodes :
                 publish = processor.process(message, node) or publish  # always invoke Processor on node first  # noqa: E501
+        for node in nodes :
+            self.refreshNode(message, node)  # such as renamed by SNIP
         return publish
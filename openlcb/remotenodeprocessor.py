@@ -17,8 +17,9 @@ class RemoteNodeProcessor(Processor) :
     track memory (config, CDI) contents due to size.
     '''
 
-    def __init__(self, linkLayer=None) :
+    def __init__(self, linkLayer=None, scheduler=None) :
         self.linkLayer = linkLayer
+        self.scheduler = scheduler  # paces newNodeSeen requests, if given
 
     def process(self, message, node) :
         """Do a fast drop of messages not to us, from us, or global
@@ -90,12 +91,16 @@ class RemoteNodeProcessor(Processor) :
         # don't clear out PIP, SNIP caches, they're probably still good
 
     def newNodeSeen(self, message, node) :
+        if self.scheduler is not None :
+            # the DiscoveryScheduler sends the same requests, paced
+            self.scheduler.discover(node.id)
+            return
         # send pip and snip requests for info from the new node
         pip = Message(MTI.Protocol_Support_Inquiry,
                       self.linkLayer.localNodeID, node.id, bytearray())
         self.linkLayer.sendMessage(pip)
         # We request SNIP data on startup so that we can display node names.
-        #   Can consider deferring this is it's a issue on big networks
+        #   On big networks, give a DiscoveryScheduler to pace this
         snip = Message(MTI.Simple_Node_Ident_Info_Request,
                        self.linkLayer.localNodeID, node.id, bytearray())
         self.linkLayer.sendMessage(snip)
@@ -2,27 +2,47 @@
 Store for seen remote (not implemented here) nodes
 '''
 
-from openlcb.nodestore import NodeStore
+from openlcb.nodestore import (
+    INDEXES_CHANGED_BY,
+    NodeStore,
+)
 
 from openlcb.message import Message
 from openlcb.mti import MTI
 from openlcb.node import Node
 from openlcb.nodeid import NodeID
 
+INITIALIZATION_MTIS = (
+    MTI.Initialization_Complete,
+    MTI.Initialization_Complete_Simple,
+)
+
 
 class RemoteNodeStore(NodeStore) :
     '''Accumulates Nodes that it sees requested
     unless they're already in a given local NodeStore.
+
+    A remote node's image only changes from what that node sends, or from
+    what is sent to it, so global messages go to their source node only.
+
+    Args:
+        localNodeID (NodeID): The local node, not stored here.
+        database (NodeDatabase, optional): Saves nodes between sessions.
+            A node seen again is restored from it instead of queried,
+            until the node sends Initialization_Complete.
     '''
 
-    def __init__(self, localNodeID) :
+    routeGlobalToSource = True
+
+    def __init__(self, localNodeID, database=None) :
         self.localNodeID = localNodeID
+        self.database = database
         NodeStore.__init__(self)
 
     def description(self) :
         '''Provide a more detailed string description
         '''
-        return "RemoteNodeStore w {}".format(self.nodes.count)
+        return "RemoteNodeStore w {}".format(len(self.nodes))
 
     def checkForNewNode(self, message) :
         '''Check if the message is to a new node.
@@ -54,12 +74,20 @@ class RemoteNodeStore(NodeStore) :
         # need to create the node and process it's New_Node_Seen
         nodeID = message.source
         node = Node(nodeID)
+        if self.database is not None :
+            if message.mti in INITIALIZATION_MTIS :
+                # any saved data may be out of date
+                self.database.invalidate(nodeID)
+            elif self.database.restoreNode(node) :
+                # known from an earlier session: nothing to ask it
+                self.store(node)
+                return
 
         self.store(node)
-        # All nodes process a notification that there's a new node
+        # Processors see the notification that there's a new node on
+        # that node only
         new_message = Message(MTI.New_Node_Seen, nodeID, None)
-        for processor in self.processors :
-            processor.process(new_message, node)
+        self.invokeProcessors(new_message, [node])
 
     def processMessageFromLinkLayer(self, message) :
         '''Process an incoming message
@@ -73,9 +101,42 @@ class RemoteNodeStore(NodeStore) :
         '''
         publish = False
 
-        if self.checkForNewNode(message) :
+        new = self.checkForNewNode(message)
+        if new :
             self.createNewRemoteNode(message)
             publish = True
         # always run invoke Processors on nodes
         publish = self.invokeProcessorsOnNodes(message) or publish
+        if self.database is not None :
+            self.noteInDatabase(message, new)
         return publish
+
+    def noteInDatabase(self, message, new) :
+        '''Note the source node as seen, and drop and query again a known
+        node that has reinitialized, as its saved data may be out of date.
+        '''
+        node = self.byIdMap.get(message.source)
+        if node is None :
+            return
+        if message.mti in INITIALIZATION_MTIS and not new :
+            self.database.invalidate(node.id)
+            # its PIP and SNIP are already cleared; so too its events
+            node.events.eventsProduced = set()
+            node.events.eventsConsumed = set()
+            self.nodeChanged(node)
+            self.invokeProcessors(Message(MTI.New_Node_Seen, node.id, None),
+                                  [node])
+        self.database.seen(node)
+
+    def nodeChanged(self, node) :
+        NodeStore.nodeChanged(self, node)
+        if self.database is not None :
+            self.database.nodeChanged(node)
+
+    def refreshNode(self, message, node) :
+        changed = NodeStore.refreshNode(self, message, node)
+        # a SNIP reply may change fields that aren't indexed
+        if self.database is not None \
+                and (changed or message.mti in INDEXES_CHANGED_BY) :
+            self.database.nodeChanged(node)
+        return changed
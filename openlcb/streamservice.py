@@ -0,0 +1,364 @@
+'''
+Send and receive buffers of any length with the OpenLCB Stream protocol.
+
+A stream moves bulk data with one acknowledgement (Stream Data Proceed)
+per window of ``bufferSize`` bytes, negotiated when the stream is
+initiated, instead of one per 64-byte datagram.
+
+Sending to a remote node:
+- Create a ``StreamWriteMemo`` and submit via ``sendStream(_:)``
+- The stream is initiated, the data sent a window at a time, and the
+  stream completed; then okReply is called. If the remote node refuses
+  the stream, rejectedReply is called with ``errorCode`` set; if it stops
+  answering, rejectedReply is called with ``errorCode`` None.
+- When the source stream ID must be told to the remote node before the
+  stream is initiated, ``holdStream(_:)`` chooses it first;
+  ``releaseStream(_:)`` frees it if the stream won't be sent after all.
+
+Receiving from a remote node:
+- Create a ``StreamReadMemo`` and submit via ``expectStream(_:)`` before
+  the remote node initiates the stream, usually before asking it to
+  (such as with a memory configuration Read Stream command). The memo's
+  ``destStreamID`` tells the remote node which stream to use.
+- Initiate requests that weren't expected are refused.
+- chunkReply is called as data arrives, and dataReply at completion.
+  If the stream isn't initiated, or stops, for ``timeout`` seconds,
+  failedReply is called instead.
+
+``checkTimeouts()`` is called from ``process(_:)``; call it periodically
+as well so timeouts are noticed when no messages arrive.
+
+Implements `Processor`, should be fed as part of common execution.
+The link layer carries Stream Data Send as stream frames on CAN and as
+ordinary messages on TCP.
+'''
+
+import logging
+import time
+
+from openlcb.message import Message
+from openlcb.mti import MTI
+
+STREAM_BUFFER_SIZE = 2048  # default largest window offered or accepted
+ACCEPT = 0x8000  # Stream Initiate Reply flag: stream accepted
+ERROR_NOT_EXPECTED = 0x1000  # permanent error: stream refused
+UNASSIGNED = 0xFF  # stream ID not yet chosen
+STREAM_TIMEOUT = 5.0  # default seconds to wait for the other node
+
+
+class StreamWriteMemo:
+    """Data to send in a stream, and the reply callbacks.
+
+    Args:
+        destID (NodeID): Node to send to.
+        data (Union[bytes,bytearray,memoryview]): The data.
+        okReply (Callable[StreamWriteMemo]): Called once all the data
+            has been sent and the stream completed.
+        rejectedReply (Callable[StreamWriteMemo]): Called if the stream
+            is refused.
+        destStreamID (int, optional): Stream ID the receiver told us to
+            use, if any.
+        progressReply (Callable[StreamWriteMemo], optional): Called after
+            each window is sent.
+
+    Attributes:
+        sourceStreamID (int): Our ID for the stream.
+        bufferSize (int): Negotiated window in bytes.
+        sent (int): Bytes sent so far.
+        errorCode (int): From a refusing Stream Initiate Reply, or None.
+    """
+    def __init__(self, destID, data, okReply, rejectedReply,
+                 destStreamID=UNASSIGNED, progressReply=None):
+        # For args see class docstring.
+        self.destID = destID
+        self.data = data
+        self.okReply = okReply
+        self.rejectedReply = rejectedReply
+        self.destStreamID = destStreamID
+        self.progressReply = progressReply
+        self.sourceStreamID = UNASSIGNED
+        self.bufferSize = 0
+        self.sent = 0
+        self.errorCode = None
+        self.deadline = None  # clock time to give up waiting
+
+
+class StreamReadMemo:
+    """A stream expected from a remote node, and its data.
+
+    Args:
+        srcID (NodeID): Node that will send the stream.
+        dataReply (Callable[StreamReadMemo]): Called when the stream
+            completes.
+        chunkReply (Callable[StreamReadMemo], optional): Called each time
+            data is added.
+        failedReply (Callable[StreamReadMemo], optional): Called if the
+            stream isn't initiated or doesn't complete in time.
+
+    Attributes:
+        destStreamID (int): Our ID for the stream, chosen by expectStream.
+        sourceStreamID (int): The sender's ID for the stream.
+        bufferSize (int): Negotiated window in bytes.
+        data (bytearray): The data received so far.
+    """
+    def __init__(self, srcID, dataReply, chunkReply=None, failedReply=None):
+        # For args see class docstring.
+        self.srcID = srcID
+        self.dataReply = dataReply
+        self.chunkReply = chunkReply
+        self.failedReply = failedReply
+        self.destStreamID = UNASSIGNED
+        self.sourceStreamID = UNASSIGNED
+        self.bufferSize = 0
+        self.data = bytearray()
+        self.unacknowledged = 0  # bytes since the last Proceed
+        self.deadline = None  # clock time to give up waiting
+
+
+class StreamService:
+    """Send and receive streams for the local node.
+
+    Args:
+        linkLayer (LinkLayer): Link to send messages through.
+        bufferSize (int, optional): Largest window offered or accepted.
+
+    Attributes:
+        outgoing (dict): (NodeID, source stream ID) to StreamWriteMemo.
+        expected (dict): (NodeID, destination stream ID) to the
+            StreamReadMemos not yet initiated.
+        incoming (dict): (NodeID, destination stream ID) to the
+            StreamReadMemos being received.
+        timeout (float): Seconds to wait for the other node before a
+            stream fails.
+        clock (Callable): Returns the current time in seconds;
+            time.monotonic unless replaced for testing.
+    """
+
+    def __init__(self, linkLayer, bufferSize=STREAM_BUFFER_SIZE):
+        self.linkLayer = linkLayer
+        self.bufferSize = bufferSize
+        self.outgoing = {}
+        self.expected = {}
+        self.incoming = {}
+        self.nextStreamID = 0
+        self.timeout = STREAM_TIMEOUT
+        self.clock = time.monotonic
+
+    def allocateStreamID(self, nodeID, *tables):
+        """Choose a stream ID not in use with nodeID in any of tables."""
+        for _ in range(UNASSIGNED):
+            streamID = self.nextStreamID
+            self.nextStreamID = (self.nextStreamID + 1) % UNASSIGNED
+            if not any((nodeID, streamID) in table for table in tables):
+                return streamID
+        raise RuntimeError("No free stream ID for {}".format(nodeID))
+
+    def send(self, mti, destID, data):
+        self.linkLayer.sendMessage(Message(mti, self.linkLayer.localNodeID,
+                                           destID, bytearray(data)))
+
+    def holdStream(self, memo):
+        """Choose the source stream ID of a stream to send later.
+
+        Args:
+            memo (StreamWriteMemo): Gets sourceStreamID.
+        """
+        memo.sourceStreamID = self.allocateStreamID(memo.destID,
+                                                    self.outgoing)
+        self.outgoing[(memo.destID, memo.sourceStreamID)] = memo
+
+    def releaseStream(self, memo):
+        """Free the stream ID of a held stream that won't be sent."""
+        self.outgoing.pop((memo.destID, memo.sourceStreamID), None)
+
+    def sendStream(self, memo):
+        """Initiate a stream and send memo.data through it.
+
+        Args:
+            memo (StreamWriteMemo): What to send, held by holdStream or
+                not.
+        """
+        if self.outgoing.get((memo.destID, memo.sourceStreamID)) is not memo:
+            self.holdStream(memo)
+        memo.deadline = self.clock() + self.timeout
+        self.send(MTI.Stream_Initiate_Request, memo.destID,
+                  self.bufferSize.to_bytes(2, "big")
+                  + bytearray([0, 0, memo.sourceStreamID,
+                               memo.destStreamID]))
+
+    def expectStream(self, memo):
+        """Accept a stream that memo.srcID will initiate, choosing the
+        destination stream ID it should use.
+
+        Args:
+            memo (StreamReadMemo): Gets the data; destStreamID is set.
+        """
+        memo.destStreamID = self.allocateStreamID(memo.srcID, self.expected,
+                                                  self.incoming)
+        self.expected[(memo.srcID, memo.destStreamID)] = memo
+        memo.deadline = self.clock() + self.timeout
+
+    def cancelExpectedStream(self, memo):
+        """Stop waiting for a stream that won't come."""
+        self.expected.pop((memo.srcID, memo.destStreamID), None)
+
+    def checkTimeouts(self, now=None):
+        '''Fail streams whose other node hasn't answered for timeout
+        seconds. Called from process().
+
+        Args:
+            now (float, optional): The current clock() value.
+        '''
+        if not (self.outgoing or self.expected or self.incoming):
+            return
+        if now is None:
+            now = self.clock()
+        for key, memo in list(self.outgoing.items()):
+            if memo.deadline is not None and now >= memo.deadline:
+                del self.outgoing[key]
+                logging.warning("Stream {} to {} timed out after {} bytes"
+                                "".format(memo.sourceStreamID, memo.destID,
+                                          memo.sent))
+                memo.errorCode = None
+                memo.rejectedReply(memo)
+        for table in (self.expected, self.incoming):
+            for key, memo in list(table.items()):
+                if now >= memo.deadline:
+                    del table[key]
+                    logging.warning("Stream {} from {} timed out after {}"
+                                    " bytes".format(memo.destStreamID,
+                                                    memo.srcID,
+                                                    len(memo.data)))
+                    if memo.failedReply is not None:
+                        memo.failedReply(memo)
+
+    def process(self, message):
+        '''Processor entry point.
+
+        Returns:
+            bool: Always False; streams don't change the node.
+        '''
+        self.checkTimeouts()
+        if message.destination != self.linkLayer.localNodeID:
+            return False
+        if message.mti == MTI.Stream_Data_Send:
+            self.handleData(message)
+        elif message.mti == MTI.Stream_Data_Proceed:
+            self.handleProceed(message)
+        elif message.mti == MTI.Stream_Initiate_Request:
+            self.handleInitiateRequest(message)
+        elif message.mti == MTI.Stream_Initiate_Reply:
+            self.handleInitiateReply(message)
+        elif message.mti == MTI.Stream_Data_Complete:
+            self.handleComplete(message)
+        return False
+
+    def handleInitiateRequest(self, message):
+        '''Accept an expected stream, or refuse it.'''
+        data = message.data
+        if len(data) < 5:
+            logging.warning("Stream Initiate Request too short: {}"
+                            "".format(list(data)))
+            return
+        offered = int.from_bytes(data[0:2], "big")
+        sourceStreamID = data[4]
+        destStreamID = data[5] if len(data) > 5 else UNASSIGNED
+        memo = self.expected.pop((message.source, destStreamID), None)
+        if memo is None or offered == 0:
+            self.send(MTI.Stream_Initiate_Reply, message.source,
+                      bytearray([0, 0]) + ERROR_NOT_EXPECTED.to_bytes(2, "big")
+                      + bytearray([sourceStreamID, destStreamID]))
+            return
+        memo.sourceStreamID = sourceStreamID
+        memo.bufferSize = min(offered, self.bufferSize)
+        memo.deadline = self.clock() + self.timeout
+        self.incoming[(message.source, memo.destStreamID)] = memo
+        self.send(MTI.Stream_Initiate_Reply, message.source,
+                  memo.bufferSize.to_bytes(2, "big")
+                  + ACCEPT.to_bytes(2, "big")
+                  + bytearray([sourceStreamID, memo.destStreamID]))
+
+    def handleInitiateReply(self, message):
+        '''Start sending, or report the refusal.'''
+        data = message.data
+        if len(data) < 6:
+            logging.warning("Stream Initiate Reply too short: {}"
+                            "".format(list(data)))
+            return
+        key = (message.source, data[4])
+        memo = self.outgoing.get(key)
+        if memo is None:
+            logging.warning("Stream Initiate Reply for unknown stream {}"
+                            " from {}".format(data[4], message.source))
+            return
+        code = int.from_bytes(data[2:4], "big")
+        memo.bufferSize = min(int.from_bytes(data[0:2], "big"),
+                              self.bufferSize)
+        if code & ACCEPT == 0 or memo.bufferSize == 0:
+            del self.outgoing[key]
+            memo.errorCode = code
+            memo.rejectedReply(memo)
+            return
+        memo.destStreamID = data[5]
+        self.sendWindow(memo)
+
+    def handleProceed(self, message):
+        '''The receiver has room for another window.'''
+        if len(message.data) < 2:
+            return
+        memo = self.outgoing.get((message.source, message.data[0]))
+        if memo is not None:
+            self.sendWindow(memo)
+
+    def sendWindow(self, memo):
+        """Send the next window of data, completing the stream after the
+        last."""
+        chunk = memo.data[memo.sent:memo.sent + memo.bufferSize]
+        if len(chunk) > 0:
+            self.send(MTI.Stream_Data_Send, memo.destID,
+                      bytearray([memo.destStreamID]) + chunk)
+            memo.sent += len(chunk)
+            if memo.progressReply is not None:
+                memo.progressReply(memo)
+        if memo.sent < len(memo.data):
+            memo.deadline = self.clock() + self.timeout
+            return  # wait for Proceed
+        del self.outgoing[(memo.destID, memo.sourceStreamID)]
+        self.send(MTI.Stream_Data_Complete, memo.destID,
+                  bytearray([memo.sourceStreamID, memo.destStreamID, 0, 0])
+                  + memo.sent.to_bytes(4, "big"))
+        memo.okReply(memo)
+
+    def handleData(self, message):
+        '''Add received data to its stream, allowing the sender to go on
+        after each full window.'''
+        data = message.data
+        if len(data) < 1:
+            return
+        memo = self.incoming.get((message.source, data[0]))
+        if memo is None:
+            logging.warning("Stream data for unknown stream {} from {}"
+                            "".format(data[0], message.source))
+            return
+        memo.data += data[1:]
+        memo.deadline = self.clock() + self.timeout
+        memo.unacknowledged += len(data) - 1
+        while memo.unacknowledged >= memo.bufferSize:
+            memo.unacknowledged -= memo.bufferSize
+            self.send(MTI.Stream_Data_Proceed, message.source,
+                      bytearray([memo.sourceStreamID, memo.destStreamID,
+                                 0, 0]))
+        if memo.chunkReply is not None:
+            memo.chunkReply(memo)
+
+    def handleComplete(self, message):
+        '''The sender has finished.'''
+        if len(message.data) < 2:
+            return
+        memo = self.incoming.pop((message.source, message.data[1]), None)
+        if memo is None:
+            logging.warning("Stream Data Complete for unknown stream {}"
+                            " from {}".format(message.data[1],
+                                              message.source))
+            return
+        memo.dataReply(memo)
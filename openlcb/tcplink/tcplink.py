@@ -24,8 +24,10 @@ class TcpLink(LinkLayer):
     """A TCP link layer.
 
     Attributes:
-        accumulatedData (list): input accumulated until an entire message is
-            present.
+        accumulatedData (bytearray): input accumulated until an entire
+            message is present.
+        readOffset (int): index in accumulatedData of the first byte not
+            yet parsed.
 
     Args:
         localNodeID (NodeID): The node ID of the Configuration Tool or other
@@ -34,11 +36,12 @@ class TcpLink(LinkLayer):
 
     def __init__(self, localNodeID):
         # See class docstring for argument(s) and attributes.
-        self.localNodeID = localNodeID
+        LinkLayer.__init__(self, localNodeID)
         self.linkCall = None
         self.accumulatedParts = {}
         self.nextInternallyAssignedNodeID = 1
         self.accumulatedData = bytearray()
+        self.readOffset = 0
 
     def linkPhysicalLayer(self, lpl):
         """Register the handler for when the layer is up.
@@ -49,54 +52,68 @@ class TcpLink(LinkLayer):
         """
         self.linkCall = lpl
 
-    def receiveListener(self, inputData):  # [] input
+    def receiveListener(self, inputData):
         """Receives bytes from lower level
         and accumulates them into individual message parts.
 
+        Parts are parsed in place through memoryview slices, advancing
+        readOffset, and the consumed bytes are only dropped from
+        accumulatedData occasionally, so a large burst costs linear time.
+
         Args:
-            inputData ([int]) : next chunk of the input stream
+            inputData (Union[bytes,bytearray,memoryview]) : next chunk of
+                the input stream
         """
-        self.accumulatedData.extend(inputData)
-        # Now check it if has one or more complete message.
-        while len(self.accumulatedData) > 0 :
+        buffer = self.accumulatedData
+        if self.readOffset > len(buffer) // 2:
+            # compact: amortized over at least as many bytes as it moves
+            del buffer[:self.readOffset]
+            self.readOffset = 0
+        buffer.extend(inputData)
+        offset = self.readOffset
+        end = len(buffer)
+        with memoryview(buffer) as view:
+            # Now check it if has one or more complete message.
             # first, see if entire prefix is present
-            if len(self.accumulatedData) < 17 :  # 2+3+6+6
-                # not yet, wait for more
-                return
-            flags = (self.accumulatedData[0] << 8) | self.accumulatedData[1]
-            length = (self.accumulatedData[2] << 16) | (self.accumulatedData[3] << 8) | self.accumulatedData[4]  # noqa: E501
-            # check if entire message (part) is present
-            if len(self.accumulatedData) < 5+length :
-                # not yet, wait for more
-                return
-
-            # Check for message indicated bit
-            if (self.accumulatedData[0] & 0x80) == 0x80:
-                # we have a message (part)!  Forward for further processing
-                self.receivedPart(self.accumulatedData[:5+length], flags,
-                                  length)
-            else:
-                # We don't have definitions for link control messages
-                # so log and ignore
-                logging.info(
-                    "Found a link control message"
-                    " with flags 0x{:04X} length {}, ignoring"
-                    .format(flags, length)
-                )
-            # drop that message (part)
-            self.accumulatedData = self.accumulatedData[5+length:]
-            # and repeat
+            while end - offset >= 17:  # 2+3+6+6
+                length = ((buffer[offset+2] << 16) | (buffer[offset+3] << 8)
+                          | buffer[offset+4])
+                # check if entire message (part) is present
+                if end - offset < 5+length:
+                    # not yet, wait for more
+                    break
+                flags = (buffer[offset] << 8) | buffer[offset+1]
+                # Check for message indicated bit
+                if (flags & 0x8000) == 0x8000:
+                    # we have a message (part)!  Forward for further processing
+                    self.receivedPart(view[offset:offset+5+length], flags,
+                                      length)
+                else:
+                    # We don't have definitions for link control messages
+                    # so log and ignore
+                    logging.info(
+                        "Found a link control message"
+                        " with flags 0x{:04X} length {}, ignoring"
+                        .format(flags, length)
+                    )
+                # drop that message (part) and repeat
+                offset += 5+length
+        if offset == end:
+            buffer.clear()
+            offset = 0
+        self.readOffset = offset
 
     def receivedPart(self, messagePart, flags, length):
         """Receives message parts from receiveListener
         and groups them into single OpenLCB messages as needed
 
         Args:
-            messagePart (bytearray) : Raw message data. A single TCP-level message,
-                which may include all or part of a single OpenLCB message.
+            messagePart (memoryview) : Raw message data. A single TCP-level
+                message, which may include all or part of a single OpenLCB
+                message. Only valid during this call.
         """
         # set the source NodeID from the data
-        gatewayNodeID = NodeID(messagePart[5:11])
+        gatewayNodeID = NodeID(int.from_bytes(messagePart[5:11], "big"))
 
         # handle simplest case first - complete message
         if (flags & 0x00C0) == 0x00000 :
@@ -110,9 +127,9 @@ class TcpLink(LinkLayer):
             # check for error
             if self.accumulatedParts.get(key) is not None :
                 # this was a first, but shouldn't have been
-                logging.warn("Found a first part from {}"
-                             " while already accumulating"
-                             "".format(gatewayNodeID))
+                logging.warning("Found a first part from {}"
+                                " while already accumulating"
+                                "".format(gatewayNodeID))
                 # start over
             # start accumulation
             self.accumulatedParts[key] = bytearray()
@@ -134,21 +151,23 @@ class TcpLink(LinkLayer):
         it in a Message object, and forwards to listeners
 
         Args:
-            messageBytes ([int]) : the bytes making up a
-                single OpenLCB message, starting with the MTI
+            messageBytes (Union[bytearray,memoryview]) : the bytes making
+                up a single OpenLCB message, starting with the MTI. Only
+                the message data is copied.
         """
         # extract MTI
         mti = MTI((messageBytes[0] << 8) | messageBytes[1])
         # extract sourceNodeID
-        sourceNodeID = NodeID(messageBytes[2:8])
+        sourceNodeID = NodeID(int.from_bytes(messageBytes[2:8], "big"))
         # if there a destination Node ID?
         destNodeID = None
-        data = messageBytes[8:]
+        dataStart = 8
         if mti.addressPresent() :
-            destNodeID = NodeID(messageBytes[8:13])
-            data = messageBytes[14:]
+            destNodeID = NodeID(int.from_bytes(messageBytes[8:14], "big"))
+            dataStart = 14
         # and finally create the message
-        message = Message(mti, sourceNodeID, destNodeID, data)
+        message = Message(mti, sourceNodeID, destNodeID,
+                          bytearray(messageBytes[dataStart:]))
         # forward to listeners
         self.fireListeners(message)
 
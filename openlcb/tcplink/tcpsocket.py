@@ -1,9 +1,10 @@
 '''
-simple TCP socket input for byte[] send and receive
+simple TCP socket input for bytes send and receive
 expects prior setting of host and port variables
 '''
 # https://docs.python.org/3/howto/sockets.html
 import socket
+RECEIVE_BUFFER_SIZE = 4096
 
 
 class TcpSocket:
@@ -15,6 +16,9 @@ class TcpSocket:
             )
         else:
             self.sock = sock
+        # reused for every read
+        self.receiveBuffer = bytearray(RECEIVE_BUFFER_SIZE)
+        self.receiveView = memoryview(self.receiveBuffer)
 
     def settimeout(self, seconds):
         """Set the timeout for connect and transfer.
@@ -29,27 +33,30 @@ class TcpSocket:
         self.sock.connect((host, port))
 
     def send(self, data):
-        '''Send a single message, provided as an [int]
+        '''Send a single message, provided as bytes (or an [int])
         '''
-        msg = bytes(data)
+        if isinstance(data, list):
+            data = bytes(data)
         total_sent = 0
-        while total_sent < len(msg[total_sent:]):
-            sent = self.sock.send(msg[total_sent:])
+        while total_sent < len(data):
+            sent = self.sock.send(data[total_sent:])
             if sent == 0:
                 raise RuntimeError("socket connection broken")
             total_sent = total_sent + sent
 
     def receive(self):
-        '''Receive one or more bytes and return as an [int]
+        '''Receive one or more bytes into a reusable buffer.
         Blocks until at least one byte is received, but may return more.
 
         Returns:
-            list(int): one or more bytes, converted to a list of ints.
+            memoryview: The bytes received, ready for
+                TcpLink.receiveListener. It refers to the internal buffer,
+                so it is only valid until the next call.
         '''
-        chunk = self.sock.recv(128)
-        if chunk == b'':
+        count = self.sock.recv_into(self.receiveView)
+        if count == 0:
             raise RuntimeError("socket connection broken")
-        return list(chunk)  # convert from bytes
+        return self.receiveView[:count]
 
     def close(self):
         self.sock.close()
@@ -14,6 +14,8 @@ from tests.test_canframe import *
 from tests.test_physicallayer import *
 from tests.test_canphysicallayer import *
 from tests.test_canphysicallayergridconnect import *
+from tests.test_cantcpsocket import *
+from tests.test_seriallink import *
 
 from tests.test_tcplink import *
 
@@ -26,6 +28,16 @@ from tests.test_canlink import *
 from tests.test_datagramservice import *
 
 from tests.test_memoryservice import *
+from tests.test_memorywritebuffer import *
+from tests.test_memorypagecache import *
+from tests.test_memoryconfigserver import *
+from tests.test_streamservice import *
+from tests.test_cdiservice import *
+from tests.test_configbackup import *
+from tests.test_jobrunner import *
+from tests.test_firmwareupgrade import *
+from tests.test_discoveryscheduler import *
+from tests.test_nodedatabase import *
 
 from tests.test_snip import *
 from tests.test_pip import *
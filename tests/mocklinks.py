@@ -0,0 +1,23 @@
+'''Link layers that stand in for the bus in tests.'''
+
+from openlcb.linklayer import LinkLayer
+
+
+class LoopbackLink(LinkLayer):
+    """Queues each sent message for the nodes sharing the queue."""
+    def __init__(self, localNodeID, queue):
+        LinkLayer.__init__(self, localNodeID)
+        self.queue = queue
+
+    def sendMessage(self, message):
+        self.queue.append(message)
+
+
+class RecordingLink(LinkLayer):
+    """Keeps each sent message in `sent`."""
+    def __init__(self, localNodeID):
+        LinkLayer.__init__(self, localNodeID)
+        self.sent = []
+
+    def sendMessage(self, message):
+        self.sent.append(message)
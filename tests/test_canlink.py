@@ -4,6 +4,9 @@ from openlcb.canbus.canlink import CanLink
 
 from openlcb.canbus.canframe import CanFrame
 from openlcb.canbus.canphysicallayer import CanPhysicalLayer
+from openlcb.canbus.canphysicallayergridconnect import (
+    CanPhysicalLayerGridConnect,
+)
 from openlcb.canbus.canphysicallayersimulation import CanPhysicalLayerSimulation
 from openlcb.message import Message
 from openlcb.mti import MTI
@@ -210,6 +213,26 @@ class TestCanLinkClass(unittest.TestCase):
             MTI.Verify_NodeID_Number_Global
         )
 
+    def testUnknownCanMtiMarkedUnknown(self):
+        canLink = CanLink(NodeID("05.01.01.01.03.01"))
+        self.assertEqual(
+            canLink.canHeaderToFullFormat(CanFrame(0x19FFF247,
+                                                   bytearray())),
+            MTI.Unknown
+        )
+
+    def testUnknownControlFrameIgnored(self):
+        canPhysicalLayer = CanPhysicalLayerSimulation()
+        canLink = CanLink(NodeID("05.01.01.01.03.01"))
+        canLink.linkPhysicalLayer(canPhysicalLayer)
+        messageLayer = MessageMockLayer()
+        canLink.registerMessageReceivedListener(messageLayer.receiveMessage)
+
+        canPhysicalLayer.fireListeners(CanFrame(0x1000, 0x000))
+
+        self.assertEqual(len(canPhysicalLayer.receivedFrames), 0)
+        self.assertEqual(len(messageLayer.receivedMessages), 0)
+
     def testControlFrameDecode(self):
         canLink = CanLink(NodeID("05.01.01.01.03.01"))
         frame = CanFrame(0x1000, 0x000)  # invalid control frame content
@@ -494,6 +517,76 @@ class TestCanLinkClass(unittest.TestCase):
         self.assertEqual(messageLayer.receivedMessages[1].data[10], 32)
         self.assertEqual(messageLayer.receivedMessages[1].data[11], 33)
 
+    def testPartialDatagramTimesOut(self):
+        canPhysicalLayer = CanPhysicalLayerSimulation()
+        canLink = CanLink(NodeID("05.01.01.01.03.01"))
+        canLink.linkPhysicalLayer(canPhysicalLayer)
+        messageLayer = MessageMockLayer()
+        canLink.registerMessageReceivedListener(messageLayer.receiveMessage)
+        now = [100.0]
+        canLink.clock = lambda: now[0]
+        canLink.state = CanLink.State.Permitted
+
+        frame = CanFrame(0x1B123, 0x247)  # first frame, sender then dies
+        frame.data = bytearray([10, 11, 12, 13])
+        canPhysicalLayer.fireListeners(frame)
+        self.assertEqual(len(canLink.accumulator), 1)
+
+        now[0] += canLink.accumulationTimeout + 1
+        canLink.expireAccumulations()
+        self.assertEqual(len(canLink.accumulator), 0)
+        self.assertEqual(canLink.accumulationsTimedOut, 1)
+
+        # a late last frame is dropped rather than shipped
+        frame = CanFrame(0x1D123, 0x247)
+        frame.data = bytearray([30, 31, 32, 33])
+        canPhysicalLayer.fireListeners(frame)
+        self.assertEqual(len(messageLayer.receivedMessages), 0)
+
+        # a complete datagram leaves nothing behind
+        frame = CanFrame(0x1B123, 0x247)
+        frame.data = bytearray([10, 11, 12, 13])
+        canPhysicalLayer.fireListeners(frame)
+        frame = CanFrame(0x1D123, 0x247)
+        frame.data = bytearray([30, 31, 32, 33])
+        canPhysicalLayer.fireListeners(frame)
+        self.assertEqual(len(messageLayer.receivedMessages), 1)
+        self.assertEqual(len(canLink.accumulator), 0)
+        self.assertEqual(canLink.accumulationsCompleted, 1)
+
+    def testOldestPartialMessageEvicted(self):
+        canPhysicalLayer = CanPhysicalLayerSimulation()
+        canLink = CanLink(NodeID("05.01.01.01.03.01"))
+        canLink.linkPhysicalLayer(canPhysicalLayer)
+        messageLayer = MessageMockLayer()
+        canLink.registerMessageReceivedListener(messageLayer.receiveMessage)
+        canLink.maxAccumulations = 2
+        canLink.state = CanLink.State.Permitted
+
+        # first frames from three sources to one destination
+        for source in (0x201, 0x202, 0x203):
+            if source == 0x203:
+                # extend the first so the second becomes least recent
+                frame = CanFrame(0x1C123, 0x201)
+                frame.data = bytearray([2])
+                canPhysicalLayer.fireListeners(frame)
+            frame = CanFrame(0x1B123, source)
+            frame.data = bytearray([source & 0xFF])
+            canPhysicalLayer.fireListeners(frame)
+
+        self.assertEqual(len(canLink.accumulator), 2)
+        self.assertEqual(canLink.accumulationsEvicted, 1)
+        for source in (0x201, 0x202, 0x203):
+            frame = CanFrame(0x1D123, source)
+            frame.data = bytearray([3])
+            canPhysicalLayer.fireListeners(frame)
+        # the one from 0x202 was evicted
+        self.assertEqual(len(messageLayer.receivedMessages), 2)
+        self.assertEqual(messageLayer.receivedMessages[0].data,
+                         bytearray([0x01, 2, 3]))
+        self.assertEqual(messageLayer.receivedMessages[1].data,
+                         bytearray([0x03, 3]))
+
     def testZeroLengthDatagram(self):
         canPhysicalLayer = PhyMockLayer()
         canLink = CanLink(NodeID("05.01.01.01.03.01"))
@@ -572,6 +665,69 @@ class TestCanLinkClass(unittest.TestCase):
         self.assertEqual(str(canPhysicalLayer.receivedFrames[2]),
                          "CanFrame header: 0x1D000000 [17, 18, 19]")
 
+    def testThreeFrameDatagramOneWrite(self):
+        writes = []
+        canPhysicalLayer = CanPhysicalLayerGridConnect(writes.append,
+                                                       sendBytes=True)
+        canLink = CanLink(NodeID("05.01.01.01.03.01"))
+        canLink.linkPhysicalLayer(canPhysicalLayer)
+
+        message = Message(MTI.Datagram, NodeID("05.01.01.01.03.01"),
+                          NodeID("05.01.01.01.03.01"),
+                          bytearray(range(1, 20)))
+
+        canLink.sendMessage(message)
+
+        self.assertEqual(writes, [bytearray(
+            b":X1B000000N0102030405060708;\n"
+            b":X1C000000N090A0B0C0D0E0F10;\n"
+            b":X1D000000N111213;\n")])
+
+    def testStreamDataSend(self):
+        canPhysicalLayer = PhyMockLayer()
+        canLink = CanLink(NodeID("05.01.01.01.03.01"))
+        canLink.linkPhysicalLayer(canPhysicalLayer)
+
+        message = Message(MTI.Stream_Data_Send, NodeID("05.01.01.01.03.01"),
+                          NodeID("05.01.01.01.03.01"),
+                          bytearray([4]) + bytearray(range(1, 10)))
+
+        canLink.sendMessage(message)
+
+        self.assertEqual(len(canPhysicalLayer.receivedFrames), 2)
+        self.assertEqual(
+            str(canPhysicalLayer.receivedFrames[0]),
+            "CanFrame header: 0x1F000000 [4, 1, 2, 3, 4, 5, 6, 7]"
+        )
+        self.assertEqual(str(canPhysicalLayer.receivedFrames[1]),
+                         "CanFrame header: 0x1F000000 [4, 8, 9]")
+
+    def testStreamDataReceived(self):
+        canPhysicalLayer = CanPhysicalLayerSimulation()
+        canLink = CanLink(NodeID("05.01.01.01.03.01"))
+        canLink.linkPhysicalLayer(canPhysicalLayer)
+        messageLayer = MessageMockLayer()
+        canLink.registerMessageReceivedListener(messageLayer.receiveMessage)
+
+        canPhysicalLayer.physicalLayerUp()
+
+        amd = CanFrame(0x0701, 0x247)
+        amd.data = bytearray([1, 2, 3, 4, 5, 6])
+        canPhysicalLayer.fireListeners(amd)
+        amd = CanFrame(0x0701, 0x123)
+        amd.data = bytearray([6, 5, 4, 3, 2, 1])
+        canPhysicalLayer.fireListeners(amd)
+
+        frame = CanFrame(0x1F123247, bytearray([4, 10, 11]))
+        canPhysicalLayer.fireListeners(frame)
+
+        self.assertEqual(len(messageLayer.receivedMessages), 2)
+        message = messageLayer.receivedMessages[1]
+        self.assertEqual(message.mti, MTI.Stream_Data_Send)
+        self.assertEqual(message.source, NodeID(0x01_02_03_04_05_06))
+        self.assertEqual(message.destination, NodeID(0x06_05_04_03_02_01))
+        self.assertEqual(message.data, bytearray([4, 10, 11]))
+
     # MARK: - Test Remote Node Alias Tracking
     def testAmdAmrSequence(self):
         canPhysicalLayer = CanPhysicalLayerSimulation()
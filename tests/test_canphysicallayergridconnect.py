@@ -36,6 +36,15 @@ class CanPhysicalLayerGridConnectTest(unittest.TestCase):
                                  0x05, 0x6C])))
         self.assertEqual(self.capturedString, ":X19170365N020112FE056C;\n")
 
+    def testFramesSentAsOneBytesWrite(self):
+        writes = []
+        gc = CanPhysicalLayerGridConnect(writes.append, sendBytes=True)
+
+        gc.sendCanFrames([CanFrame(0x19170365, bytearray([0x02, 0xFE])),
+                          CanFrame(0x19490365, bytearray())])
+        self.assertEqual(writes,
+                         [bytearray(b":X19170365N02FE;\n:X19490365N;\n")])
+
     def testOneFrameReceivedExactlyHeaderOnly(self):
         gc = CanPhysicalLayerGridConnect(self.captureString)
         gc.registerFrameReceivedListener(self.receiveListener)
@@ -140,6 +149,33 @@ class CanPhysicalLayerGridConnectTest(unittest.TestCase):
         self.assertEqual(self.receivedFrames[0],
                          CanFrame(0x19490365, bytearray()))
 
+    def testManyFramesOneByteAtATime(self):
+        gc = CanPhysicalLayerGridConnect(self.captureString)
+        gc.registerFrameReceivedListener(self.receiveListener)
+        text = b":X19490365N;\n:X19170365N020112FE056C;\n" * 3
+
+        for index in range(len(text)):
+            gc.receiveChars(text[index:index+1])
+
+        self.assertEqual(len(self.receivedFrames), 6)
+        self.assertEqual(
+            self.receivedFrames[5],
+            CanFrame(0x19170365,
+                     bytearray([0x02, 0x01, 0x12, 0xFE, 0x05, 0x6C]))
+        )
+        self.assertEqual(gc.inboundBuffer, bytearray(b"\n"))  # only noise
+
+    def testNoiseAndMalformedFramesDropped(self):
+        gc = CanPhysicalLayerGridConnect(self.captureString)
+        gc.registerFrameReceivedListener(self.receiveListener)
+
+        gc.receiveChars(b"junk;:X1949:X19490365N;\n:XZZ490365N;:X1949N0;"
+                        b":x19170365n020112fe056c;")
+
+        self.assertEqual(len(self.receivedFrames), 1)
+        self.assertEqual(self.receivedFrames[0],
+                         CanFrame(0x19490365, bytearray()))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+import socket
+import unittest
+
+from openlcb.canbus.canframe import CanFrame
+from openlcb.canbus.canphysicallayergridconnect import (
+    CanPhysicalLayerGridConnect,
+)
+from openlcb.canbus.tcpsocket import RECEIVE_BUFFER_SIZE, TcpSocket
+
+
+class TestCanTcpSocketClass(unittest.TestCase):
+
+    def setUp(self):
+        self.near, self.far = socket.socketpair()
+        self.socket = TcpSocket(self.near)
+        self.receivedFrames = []
+
+    def tearDown(self):
+        self.near.close()
+        self.far.close()
+
+    def receiveListener(self, frame):
+        self.receivedFrames.append(frame)
+
+    def testReceiveBytesReturnsCompleteFrames(self):
+        self.far.sendall(b":X19490365N;\n:X19170365N0201;\n:X1917")
+
+        received = self.socket.receiveBytes()
+        self.assertEqual(bytes(received),
+                         b":X19490365N;\n:X19170365N0201;")
+
+        # partial frame is held until the rest arrives
+        self.far.sendall(b"0365N;\n")
+        self.assertEqual(bytes(self.socket.receiveBytes()),
+                         b"\n:X19170365N;")
+
+    def testReceiveFeedsParserDirectly(self):
+        gc = CanPhysicalLayerGridConnect(None)
+        gc.registerFrameReceivedListener(self.receiveListener)
+        self.far.sendall(b":X19490365N;\n" * 100)
+
+        while len(self.receivedFrames) < 100:
+            gc.receiveChars(self.socket.receiveBytes())
+
+        self.assertEqual(self.receivedFrames[99],
+                         CanFrame(0x19490365, bytearray()))
+
+    def testReceiveString(self):
+        self.far.sendall(b":X19490365N;\n")
+        self.assertEqual(self.socket.receive(), ":X19490365N;")
+
+    def testNonGridConnectInputIsForwarded(self):
+        self.far.sendall(b"x" * (RECEIVE_BUFFER_SIZE + 10))
+
+        self.assertEqual(len(self.socket.receiveBytes()), RECEIVE_BUFFER_SIZE)
+
+    def testClosedConnection(self):
+        self.far.close()
+        with self.assertRaises(RuntimeError):
+            self.socket.receiveBytes()
+
+    def testSendBytes(self):
+        self.socket.send(bytearray(b":X19490365N;\n"))
+        self.socket.send(":X19490366N;\n")
+        self.assertEqual(self.far.recv(100),
+                         b":X19490365N;\n:X19490366N;\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import os
+import tempfile
+import unittest
+
+from openlcb.nodeid import NodeID
+from openlcb.linklayer import LinkLayer
+from openlcb.mti import MTI
+from openlcb.message import Message
+from openlcb.memoryservice import MemoryService
+from openlcb.datagramservice import (
+    DatagramService,
+)
+from openlcb.cdiservice import (
+    CdiGroup,
+    CdiModel,
+    CdiService,
+    ConfigurationReadMemo,
+)
+from openlcb.eventid import EventID
+from openlcb.snip import SNIP
+
+CDI = b'''<?xml version="1.0"?>
+<cdi>
+<identification><name>Ignored</name></identification>
+<segment space="253" origin="16">
+  <name>Settings</name>
+  <string size="8"><name>User name</name></string>
+  <group offset="2" replication="3">
+    <name>Ports</name>
+    <repname>Port</repname>
+    <int size="2"><name>Mode</name></int>
+    <group replication="2">
+      <eventid><name>Event</name></eventid>
+    </group>
+  </group>
+  <int><name>Last</name></int>
+</segment>
+</cdi>'''
+
+
+class LinkMockLayer(LinkLayer):
+    sentMessages = []
+
+    def sendMessage(self, message):
+        LinkMockLayer.sentMessages.append(message)
+
+
+class TestCdiServiceClass(unittest.TestCase):
+
+    def setUp(self):
+        LinkMockLayer.sentMessages = []
+        self.models = []
+        self.dService = DatagramService(LinkMockLayer(NodeID(12)))
+        self.mService = MemoryService(self.dService)
+        self.service = CdiService(self.mService)
+        self.snip = SNIP("Maker", "Board", "1", "2.0")
+        self.answered = 0
+        self.config = bytearray(81)
+        self.config[16:21] = b"Shed\0"
+        for port in range(3):
+            self.config[26 + 18 * port + 1] = port + 1  # Mode
+            for event in range(2):
+                address = 28 + 18 * port + 8 * event
+                self.config[address:address + 8] = bytes([5, 1, 1, 1, 3, 1,
+                                                          port, event])
+        self.config[80] = 7
+
+    def answerReads(self, cdi=CDI):
+        """Act as remote nodes, answering each CDI read with 64 bytes of
+        cdi, followed by a 0 byte, and each space 0xFD read from
+        self.config.
+
+        Returns:
+            int: How many reads were answered.
+        """
+        content = cdi + b"\0"
+        count = 0
+        while self.answered < len(LinkMockLayer.sentMessages):
+            request = LinkMockLayer.sentMessages[self.answered]
+            self.answered += 1
+            if request.mti != MTI.Datagram:
+                continue
+            count += 1
+            node = request.destination
+            self.dService.process(Message(MTI.Datagram_Received_OK, node,
+                                          NodeID(12)))
+            address = int.from_bytes(request.data[2:6], "big")
+            memory = content if request.data[1] == 0x43 else self.config
+            reply = (bytearray([0x20, request.data[1] | 0x10])
+                     + request.data[2:6]
+                     + memory[address:address + request.data[-1]])
+            self.dService.process(Message(MTI.Datagram, node, NodeID(12),
+                                          reply))
+        return count
+
+    def testModelAddresses(self):
+        self.service.requestCdi(NodeID(123), self.snip, self.models.append)
+        self.assertGreater(self.answerReads(), 0)
+        model = self.models[0]
+        segment, = model.segments
+        self.assertEqual((segment.name, segment.space, segment.origin),
+                         ("Settings", 253, 16))
+        group = segment.children[1]
+        self.assertIsInstance(group, CdiGroup)
+        self.assertEqual((group.name, group.address, group.size,
+                          group.replication), ("Ports", 26, 18, 3))
+        fields = [(field.name, address) for _, field, address
+                  in model.fields()]
+        self.assertEqual(fields[:5], [("User name", 16), ("Mode", 26),
+                                      ("Event", 28), ("Event", 36),
+                                      ("Mode", 44)])
+        self.assertEqual(fields[-1], ("Last", 80))
+        self.assertEqual(len(fields), 1 + 3 * 3 + 1)
+
+    def testIdenticalNodeSkipsRead(self):
+        self.service.requestCdi(NodeID(123), self.snip, self.models.append)
+        self.service.requestCdi(NodeID(124), SNIP("Maker", "Board", "1",
+                                                  "2.0"),
+                                self.models.append)  # while reading
+        self.answerReads()
+        self.service.requestCdi(NodeID(125), self.snip, self.models.append)
+        self.assertEqual(self.answerReads(), 0)
+        self.assertEqual(self.service.downloads, 1)
+        self.assertEqual(len(self.models), 3)
+        self.assertIs(self.models[0], self.models[2])
+
+    def testOtherVersionRead(self):
+        self.service.requestCdi(NodeID(123), self.snip, self.models.append)
+        self.service.requestCdi(NodeID(124), SNIP("Maker", "Board", "1",
+                                                  "2.1"),
+                                self.models.append)
+        self.answerReads()
+        self.assertEqual(self.service.downloads, 2)
+
+    def testDiskCache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.service = CdiService(self.mService, directory)
+            self.service.requestCdi(NodeID(123), self.snip,
+                                    self.models.append)
+            self.answerReads()
+            self.assertEqual(len(os.listdir(directory)), 1)
+            later = CdiService(self.mService, directory)
+            later.requestCdi(NodeID(123), self.snip, self.models.append)
+            self.assertEqual(later.downloads, 0)
+            self.assertEqual(self.models[1].toDict(),
+                             self.models[0].toDict())
+
+    def testBadCdi(self):
+        self.service.requestCdi(NodeID(123), self.snip, self.models.append)
+        self.answerReads(b"<cdi><segment space='253'></cdi>")
+        self.assertEqual(self.models, [None])
+        self.assertEqual(self.service.models, {})
+
+    def testInvalidCdiStructure(self):
+        for cdi in (b"<cdi><segment origin='0'><int/></segment></cdi>",
+                    b"<cdi><segment space='253'><name><int/></name>"
+                    b"</segment></cdi>"):
+            self.service.requestCdi(NodeID(123), self.snip,
+                                    self.models.append)
+            self.answerReads(cdi)
+        self.assertEqual(self.models, [None, None])
+        self.assertEqual(self.service.models, {})
+
+    def testRoundTrip(self):
+        self.service.requestCdi(NodeID(123), self.snip, self.models.append)
+        self.answerReads()
+        values = self.models[0].toDict()
+        self.assertEqual(CdiModel.fromDict(values).toDict(), values)
+
+    def testConfigurationRead(self):
+        self.service.requestCdi(NodeID(123), self.snip, self.models.append)
+        self.answerReads()
+        reads = []
+        memo = ConfigurationReadMemo(NodeID(123), self.models[0],
+                                     reads.append, reads.append)
+        self.service.requestConfigurationRead(memo)
+        self.assertEqual(self.answerReads(), 2)  # 65 bytes in 64 + 1
+        self.assertEqual(memo.ranges, [(253, 16, 65)])
+        self.assertEqual(reads, [memo])
+        values = [value.value for value in memo.values]
+        self.assertEqual(values[:4], ["Shed", 1,
+                                      EventID("05.01.01.01.03.01.00.00"),
+                                      EventID("05.01.01.01.03.01.00.01")])
+        self.assertEqual(values[7], 3)
+        self.assertEqual(values[-1], 7)
+
+    def testConfigurationReadPastEnd(self):
+        self.service.requestCdi(NodeID(123), self.snip, self.models.append)
+        self.answerReads()
+        del self.config[70:]
+        failed = []
+        memo = ConfigurationReadMemo(NodeID(123), self.models[0],
+                                     failed.append, lambda memo: None)
+        self.service.requestConfigurationRead(memo)
+        self.answerReads()
+        self.assertEqual(failed, [])
+        self.assertIsNone(memo.values[-1].value)
+        self.assertEqual(memo.values[0].value, "Shed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import tempfile
+import unittest
+
+from openlcb.canbus.canlink import CanLink
+from openlcb.canbus.canphysicallayersimulation import (
+    CanPhysicalLayerSimulation,
+)
+from openlcb.configbackup import (
+    ConfigBackup,
+    ConfigSnapshot,
+    diffRanges,
+)
+from openlcb.datagramservice import (
+    DatagramService,
+    DatagramWriteMemo,
+)
+from openlcb.memoryservice import MemoryService
+from openlcb.node import Node
+from openlcb.nodeid import NodeID
+from openlcb.pip import PIP
+from openlcb.remotenodestore import RemoteNodeStore
+
+
+class SimulatedBus:
+    """Connects CanPhysicalLayerSimulation instances, delivering each
+    frame one sends to all the others when pumped."""
+    def __init__(self):
+        self.layers = []
+
+    def attach(self, layer):
+        self.layers.append(layer)
+
+    def pump(self):
+        """Deliver frames until none are left to deliver."""
+        moved = True
+        while moved:
+            moved = False
+            for layer in self.layers:
+                frames = layer.receivedFrames
+                layer.receivedFrames = []
+                for frame in frames:
+                    moved = True
+                    for other in self.layers:
+                        if other is not layer:
+                            other.fireListeners(frame)
+
+
+class SimulatedNode:
+    """A node on the bus with a configuration space, answering memory
+    configuration reads, writes and space information queries.
+
+    Attributes:
+        memory (bytearray): Space 0xFD.
+        writes (list[tuple(int, int)]): (address, length) of each write.
+    """
+    def __init__(self, bus, nodeID, size):
+        self.nodeID = nodeID
+        self.memory = bytearray((nodeID.nodeId + n) & 0xFF
+                                for n in range(size))
+        self.writes = []
+        self.physicalLayer = CanPhysicalLayerSimulation()
+        bus.attach(self.physicalLayer)
+        self.link = CanLink(nodeID)
+        self.link.linkPhysicalLayer(self.physicalLayer)
+        self.service = DatagramService(self.link)
+        self.link.registerMessageReceivedListener(self.service.process)
+        self.service.registerDatagramReceivedListener(self.datagramReceived)
+
+    def datagramReceived(self, dg):
+        data = dg.data
+        if len(data) < 2 or data[0] != 0x20:
+            return False
+        self.service.positiveReplyToDatagram(dg)
+        command = data[1]
+        if command == 0x84:
+            reply = (bytearray([0x20, 0x87, data[2]])
+                     + (len(self.memory) - 1).to_bytes(4, "big")
+                     + bytearray([0]))
+        elif command == 0x41:  # read 0xFD
+            address = int.from_bytes(data[2:6], "big")
+            reply = (bytearray([0x20, 0x51]) + data[2:6]
+                     + self.memory[address:address + data[6]])
+        elif command == 0x01:  # write 0xFD
+            address = int.from_bytes(data[2:6], "big")
+            self.memory[address:address + len(data) - 6] = data[6:]
+            self.writes.append((address, len(data) - 6))
+            reply = bytearray([0x20, 0x11]) + data[2:6]
+        else:
+            return True
+        self.service.sendDatagram(DatagramWriteMemo(dg.srcID, reply))
+        return True
+
+
+class TestConfigBackupClass(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = SimulatedBus()
+        self.nodes = [SimulatedNode(self.bus, NodeID(0x050101010100 + n),
+                                    100 + 30 * n)
+                      for n in range(5)]
+        for node in self.nodes:
+            node.physicalLayer.physicalLayerUp()
+        self.physicalLayer = CanPhysicalLayerSimulation()
+        self.bus.attach(self.physicalLayer)
+        self.link = CanLink(NodeID(0x050101010001))
+        self.link.linkPhysicalLayer(self.physicalLayer)
+        self.dService = DatagramService(self.link)
+        self.mService = MemoryService(self.dService)
+        self.link.registerMessageReceivedListener(self.dService.process)
+        self.link.registerMessageReceivedListener(self.mService.process)
+        self.backup = ConfigBackup(self.mService, 2)
+        self.physicalLayer.physicalLayerUp()
+        self.bus.pump()
+        self.directory = tempfile.TemporaryDirectory()
+        self.results = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testBackupAndRestore(self):
+        nodeIDs = [node.nodeID for node in self.nodes]
+        self.backup.backup(nodeIDs, self.directory.name,
+                           self.results.append)
+        self.assertLessEqual(self.backup.jobs.activeJobs, 2)
+        self.bus.pump()
+        jobs, = self.results
+        self.assertEqual([job.error for job in jobs], [None] * 5)
+        self.assertEqual(len(os.listdir(self.directory.name)), 5)
+        for node, job in zip(self.nodes, jobs):
+            snapshot = ConfigSnapshot.load(job.path)
+            self.assertEqual(snapshot.nodeID, node.nodeID)
+            self.assertEqual(snapshot.data, node.memory)
+
+        original = bytearray(self.nodes[3].memory)
+        self.nodes[3].memory[10:12] = b"XY"
+        self.nodes[3].memory[100:180] = bytes(80)
+        self.backup.restore([job.path for job in jobs], self.results.append)
+        self.bus.pump()
+        restored = self.results[1]
+        self.assertEqual([job.error for job in restored], [None] * 5)
+        self.assertEqual(self.nodes[3].memory, original)
+        self.assertEqual(self.nodes[3].writes, [(10, 2), (100, 64),
+                                                (164, 16)])
+        self.assertEqual(restored[3].rangesWritten, 2)
+        self.assertEqual(sum(node.writes != [] for node in self.nodes), 1)
+
+    def testMissingNodeFails(self):
+        self.backup.backup([NodeID(0x050101010199), self.nodes[0].nodeID],
+                           self.directory.name, self.results.append)
+        self.bus.pump()
+        self.dService.checkTimeouts(self.dService.clock() + 100)
+        self.bus.pump()
+        jobs, = self.results
+        self.assertIsNotNone(jobs[0].error)
+        self.assertIsNone(jobs[1].error)
+
+    def testDiffRanges(self):
+        self.assertEqual(diffRanges(b"abcdefghij", b"aXcdefghiY"),
+                         [(1, 2), (9, 10)])
+        self.assertEqual(diffRanges(b"abcdef", b"aXcXef"), [(1, 4)])
+        self.assertEqual(diffRanges(b"abc", b"abcde"), [(3, 5)])
+        self.assertEqual(diffRanges(b"abc", b"abc"), [])
+
+    def testNodesWithConfiguration(self):
+        store = RemoteNodeStore(NodeID(1))
+        store.store(Node(NodeID(2), pipSet={
+            PIP.MEMORY_CONFIGURATION_PROTOCOL}))
+        store.store(Node(NodeID(3)))
+        self.assertEqual(ConfigBackup.nodesWithConfiguration(store),
+                         [NodeID(2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -149,6 +149,122 @@ class DatagramServiceTest(unittest.TestCase):
         # was callback called?
         self.assertTrue(self.callback)
 
+    def testSendToSeveralNodesInParallel(self):
+        for node in (22, 23, 24):
+            self.service.sendDatagram(DatagramWriteMemo(
+                NodeID(node), bytearray([0x20, 0x42, 0x30]),
+                self.writeCallBackCheck))
+        # a second to 22 waits for its reply
+        self.service.sendDatagram(DatagramWriteMemo(
+            NodeID(22), bytearray([0x20, 0x42, 0x31])))
+
+        # one outstanding per destination
+        self.assertEqual(len(LinkMockLayer.sentMessages), 3)
+        self.assertEqual([m.destination for m in LinkMockLayer.sentMessages],
+                         [NodeID(22), NodeID(23), NodeID(24)])
+
+        # replies in any order
+        message = Message(MTI.Datagram_Received_OK, NodeID(24), NodeID(12))
+        self.service.process(message)
+        self.assertTrue(self.callback)
+        self.assertEqual(len(LinkMockLayer.sentMessages), 3)
+
+        message = Message(MTI.Datagram_Received_OK, NodeID(22), NodeID(12))
+        self.service.process(message)
+        self.assertEqual(len(LinkMockLayer.sentMessages), 4)
+        self.assertEqual(LinkMockLayer.sentMessages[3].data,
+                         bytearray([0x20, 0x42, 0x31]))
+
+    def testInFlightLimit(self):
+        self.service.maxInFlight = 2
+        for node in (22, 23, 24):
+            self.service.sendDatagram(DatagramWriteMemo(
+                NodeID(node), bytearray([0x20, 0x42, 0x30])))
+        self.assertEqual(len(LinkMockLayer.sentMessages), 2)
+
+        message = Message(MTI.Datagram_Rejected, NodeID(23), NodeID(12),
+                          bytearray([0x10, 0x00]))
+        self.service.process(message)
+        self.assertEqual(len(LinkMockLayer.sentMessages), 3)
+        self.assertEqual(LinkMockLayer.sentMessages[2].destination,
+                         NodeID(24))
+
+    def testUnmatchedReplyIgnored(self):
+        message = Message(MTI.Datagram_Received_OK, NodeID(22), NodeID(12))
+        self.service.process(message)
+        self.assertEqual(len(LinkMockLayer.sentMessages), 0)
+
+    def rejectedCallBackCheck(self, memo):
+        self.callback = True
+        self.rejectedMemo = memo
+
+    def testTemporaryRejectResentWithBackoff(self):
+        now = [100.0]
+        self.service.clock = lambda: now[0]
+        self.service.maxRetries = 2
+        writeMemo = DatagramWriteMemo(NodeID(22),
+                                      bytearray([0x20, 0x42, 0x30]), None,
+                                      self.rejectedCallBackCheck)
+        self.service.sendDatagram(writeMemo)
+        rejected = Message(MTI.Datagram_Rejected, NodeID(22), NodeID(12),
+                           bytearray([0x20, 0x20]))  # temporary error
+
+        self.service.process(rejected)
+        self.assertFalse(self.callback)
+        now[0] += self.service.retryDelay / 2
+        self.service.checkTimeouts()
+        self.assertEqual(len(LinkMockLayer.sentMessages), 1)  # not yet
+        now[0] += self.service.retryDelay / 2
+        self.service.checkTimeouts()
+        self.assertEqual(len(LinkMockLayer.sentMessages), 2)
+
+        # second delay is twice as long
+        self.service.process(rejected)
+        now[0] += self.service.retryDelay * 1.5
+        self.service.checkTimeouts()
+        self.assertEqual(len(LinkMockLayer.sentMessages), 2)
+        now[0] += self.service.retryDelay * 0.5
+        self.service.checkTimeouts()
+        self.assertEqual(len(LinkMockLayer.sentMessages), 3)
+
+        # out of retries
+        self.service.process(rejected)
+        self.assertTrue(self.callback)
+        self.assertEqual(self.rejectedMemo.errorCode, 0x2020)
+        self.assertEqual(self.rejectedMemo.reason,
+                         "rejected with error 0x2020")
+
+    def testPermanentRejectNotResent(self):
+        writeMemo = DatagramWriteMemo(NodeID(22),
+                                      bytearray([0x20, 0x42, 0x30]), None,
+                                      self.rejectedCallBackCheck)
+        self.service.sendDatagram(writeMemo)
+        message = Message(MTI.Datagram_Rejected, NodeID(22), NodeID(12),
+                          bytearray([0x10, 0x42]))
+        self.service.process(message)
+        self.assertTrue(self.callback)
+        self.assertEqual(self.rejectedMemo.errorCode, 0x1042)
+        self.assertEqual(len(LinkMockLayer.sentMessages), 1)
+
+    def testNoReplyTimesOut(self):
+        now = [100.0]
+        self.service.clock = lambda: now[0]
+        self.service.sendDatagram(DatagramWriteMemo(
+            NodeID(22), bytearray([0x20, 0x42, 0x30]), None,
+            self.rejectedCallBackCheck))
+        self.service.sendDatagram(DatagramWriteMemo(
+            NodeID(22), bytearray([0x20, 0x42, 0x31])))
+
+        now[0] += self.service.replyTimeout + 0.1
+        # any message processed notices the timeout
+        self.service.process(Message(MTI.Verify_NodeID_Number_Global,
+                                     NodeID(23), None))
+        self.assertTrue(self.callback)
+        self.assertIsNone(self.rejectedMemo.errorCode)
+        self.assertEqual(self.rejectedMemo.reason, "no reply within 3.0 s")
+        # the next datagram to that node went out
+        self.assertEqual(len(LinkMockLayer.sentMessages), 2)
+
     def testReceiveDatagramOK(self):
         # set up datagram listener
         receiver = self.receiveListener
@@ -0,0 +1,141 @@
+import unittest
+
+from openlcb.discoveryscheduler import (
+    EVENTS_REQUEST,
+    SNIP_REQUEST,
+    DiscoveryScheduler,
+)
+from openlcb.message import Message
+from openlcb.mti import MTI
+from openlcb.node import Node
+from openlcb.nodeid import NodeID
+from openlcb.remotenodeprocessor import RemoteNodeProcessor
+from openlcb.remotenodestore import RemoteNodeStore
+from tests.mocklinks import RecordingLink
+
+
+class TestDiscoverySchedulerClass(unittest.TestCase):
+
+    def setUp(self):
+        self.link = RecordingLink(NodeID(1))
+        self.scheduler = DiscoveryScheduler(self.link, maxInFlight=2,
+                                            interval=0.1)
+        self.now = 0.0
+        self.scheduler.clock = lambda: self.now
+
+    def reply(self, mti, number, data=bytearray()):
+        self.scheduler.process(Message(mti, NodeID(number), NodeID(1),
+                                       data))
+
+    def sentSince(self, start):
+        return [(m.mti, m.destination.nodeId)
+                for m in self.link.sent[start:]]
+
+    def testPacingAndPriority(self):
+        for number in (10, 11):
+            self.scheduler.discover(NodeID(number))
+        self.assertEqual(self.sentSince(0),
+                         [(MTI.Protocol_Support_Inquiry, 10)])
+        self.now = 0.1
+        self.scheduler.checkTimeouts()
+        self.assertEqual(self.sentSince(1),
+                         [(MTI.Protocol_Support_Inquiry, 11)])
+
+        # full: nothing more until a reply
+        self.now = 0.5
+        self.scheduler.checkTimeouts()
+        self.assertEqual(len(self.link.sent), 2)
+        self.reply(MTI.Protocol_Support_Reply, 10)
+        self.reply(MTI.Protocol_Support_Reply, 11)
+        # PIP and SNIP of every node before any events
+        self.assertEqual(self.sentSince(2),
+                         [(MTI.Simple_Node_Ident_Info_Request, 10)])
+        self.now = 0.6
+        self.scheduler.checkTimeouts()
+        self.assertEqual(self.sentSince(3),
+                         [(MTI.Simple_Node_Ident_Info_Request, 11)])
+
+    def testCompletionAndProgress(self):
+        self.scheduler.interval = 0
+        done = []
+        self.scheduler.progress = lambda s: done.append(s.nodesDone)
+        self.scheduler.discover(NodeID(10))
+        self.reply(MTI.Protocol_Support_Reply, 10)
+        self.reply(MTI.Simple_Node_Ident_Info_Reply, 10)
+        self.assertEqual(self.sentSince(2),
+                         [(MTI.Identify_Events_Addressed, 10)])
+        self.now = 3.0
+        self.reply(MTI.Producer_Identified_Active, 10, bytearray(8))
+        self.now = 3.05
+        self.reply(MTI.Consumer_Identified_Active, 10, bytearray(8))
+        self.scheduler.checkTimeouts(3.1)
+        self.assertEqual(done, [])  # more events may still come
+        self.now = 3.2
+        self.scheduler.checkTimeouts()
+        self.assertEqual(done, [1])
+        self.assertEqual(self.scheduler.nodesSeen, 1)
+        self.assertEqual(self.scheduler.discoveryTime(), 3.2)
+        self.assertEqual(self.scheduler.failed, [])
+
+    def testEventsSkippedWithoutEventExchange(self):
+        self.scheduler.interval = 0
+        self.scheduler.discover(NodeID(10))
+        self.reply(MTI.Protocol_Support_Reply, 10,
+                   bytearray([0x10, 0x10, 0x00]))  # memory config, SNIP
+        self.reply(MTI.Simple_Node_Ident_Info_Reply, 10)
+        self.assertEqual(self.scheduler.nodesDone, 1)
+        self.assertNotIn((MTI.Identify_Events_Addressed, 10),
+                         self.sentSince(0))
+
+    def testNodeWithoutEventsTimesOutQuickly(self):
+        self.scheduler.interval = 0
+        self.scheduler.discover(NodeID(10))
+        self.reply(MTI.Protocol_Support_Reply, 10)
+        self.reply(MTI.Simple_Node_Ident_Info_Reply, 10)
+        self.scheduler.checkTimeouts(self.scheduler.eventsTimeout)
+        self.assertEqual(self.scheduler.nodesDone, 1)
+        self.assertEqual(self.scheduler.failed, [])
+
+    def testRetryThenGiveUp(self):
+        self.scheduler.interval = 0
+        self.scheduler.retries = 1
+        self.scheduler.discover(NodeID(10))
+        self.reply(MTI.Protocol_Support_Reply, 10)
+        sent = len(self.link.sent)
+        self.now = self.scheduler.replyTimeout
+        self.scheduler.checkTimeouts()
+        # the SNIP request is resent, and events wait for a free slot
+        self.assertIn((MTI.Simple_Node_Ident_Info_Request, 10),
+                      self.sentSince(sent))
+        self.now = 2 * self.scheduler.replyTimeout
+        self.scheduler.checkTimeouts()
+        self.now = 3 * self.scheduler.replyTimeout
+        self.scheduler.checkTimeouts()
+        self.assertEqual(self.scheduler.failed, [(NodeID(10), SNIP_REQUEST)])
+        self.assertEqual(self.scheduler.nodesDone, 1)
+        self.assertNotIn((NodeID(10), EVENTS_REQUEST),
+                         self.scheduler.failed)  # no events is fine
+
+    def testRejectedRequestFinishes(self):
+        self.scheduler.interval = 0
+        self.scheduler.discover(NodeID(10))
+        self.reply(MTI.Optional_Interaction_Rejected, 10,
+                   bytearray([0x10, 0x43, 0x08, 0x28]))  # PIP inquiry
+        self.reply(MTI.Simple_Node_Ident_Info_Reply, 10)
+        self.assertEqual(self.scheduler.remaining[NodeID(10)], 1)
+
+    def testUsedByRemoteNodeProcessor(self):
+        store = RemoteNodeStore(NodeID(1))
+        store.processors = [RemoteNodeProcessor(self.link, self.scheduler)]
+        for number in range(10, 20):
+            store.processMessageFromLinkLayer(Message(
+                MTI.Initialization_Complete, NodeID(number), None,
+                NodeID(number).toArray()))
+        self.assertEqual(len(store.asArray()), 10)
+        self.assertEqual(len(self.link.sent), 1)  # paced
+        self.assertEqual(self.scheduler.nodesSeen, 10)
+        self.assertIsInstance(store.lookup(NodeID(10)), Node)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+import os
+import tempfile
+import unittest
+
+from openlcb.datagramservice import DatagramService
+from openlcb.firmwareupgrade import (
+    FIRMWARE_SPACE,
+    FirmwareUpgrade,
+)
+from openlcb.memoryconfigserver import (
+    MemoryConfigServer,
+    MemorySpace,
+)
+from openlcb.memoryservice import MemoryService
+from openlcb.message import Message
+from openlcb.mti import MTI
+from openlcb.nodeid import NodeID
+from openlcb.streamservice import StreamService
+from tests.mocklinks import LoopbackLink
+
+FROZEN = (FIRMWARE_SPACE, True)  # freeze callback arguments
+UPGRADED = [FROZEN, (FIRMWARE_SPACE, False)]
+
+
+class Bootloader:
+    """A node whose firmware space can be frozen, written and unfrozen.
+    """
+    def __init__(self, nodeID, queue, size, restarts=True, streams=False):
+        self.nodeID = nodeID
+        self.queue = queue
+        self.restarts = restarts
+        self.link = LoopbackLink(nodeID, queue)
+        self.datagrams = DatagramService(self.link)
+        self.streams = StreamService(self.link) if streams else None
+        self.server = MemoryConfigServer(self.datagrams,
+                                         streamService=self.streams)
+        self.firmware = bytearray(size)
+        self.server.addSpace(FIRMWARE_SPACE, MemorySpace(self.firmware))
+        self.commands = []
+        self.server.freezeCallback = self.freeze
+
+    def freeze(self, space, frozen):
+        self.commands.append((space, frozen))
+        if self.restarts:  # into the bootloader, or the new firmware
+            self.queue.append(Message(MTI.Initialization_Complete,
+                                      self.nodeID, None,
+                                      self.nodeID.toArray()))
+
+    def process(self, message):
+        self.datagrams.process(message)
+        if self.streams is not None:
+            self.streams.process(message)
+
+
+class TestFirmwareUpgradeClass(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = []
+        self.clientID = NodeID(1)
+        self.clientLink = LoopbackLink(self.clientID, self.queue)
+        self.client = DatagramService(self.clientLink)
+        self.client.clock = lambda: 0.0
+        self.clientStreams = StreamService(self.clientLink)
+        self.memoryService = MemoryService(self.client, self.clientStreams)
+        self.upgrader = FirmwareUpgrade(self.memoryService, maxInFlight=2)
+        self.upgrader.clock = lambda: 0.0
+        self.nodes = {}
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "image.bin")
+        self.image = bytes(range(256)) * 3 + b"tail"
+        with open(self.path, "wb") as stream:
+            stream.write(self.image)
+        self.results = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def addNode(self, number, **kwargs):
+        node = Bootloader(NodeID(number), self.queue, 1024, **kwargs)
+        self.nodes[node.nodeID] = node
+        return node
+
+    def pump(self, lose=None):
+        while self.queue:
+            message = self.queue.pop(0)
+            if lose is not None and lose(message):
+                continue
+            node = self.nodes.get(message.destination)
+            if node is not None:
+                node.process(message)
+            elif message.destination in (self.clientID, None):
+                self.client.process(message)
+                self.memoryService.process(message)
+                self.clientStreams.process(message)
+                self.upgrader.process(message)
+
+    def testUpgradeSeveralNodes(self):
+        nodes = [self.addNode(number) for number in range(10, 15)]
+        progress = []
+        self.upgrader.upgrade([node.nodeID for node in nodes], self.path,
+                              self.results.append,
+                              lambda job: progress.append(job.nodeID))
+        self.assertEqual(self.upgrader.jobs.activeJobs, 2)
+        self.pump()
+
+        jobs = self.results[0]
+        self.assertEqual([job.error for job in jobs], [None] * 5)
+        for node in nodes:
+            self.assertEqual(node.commands, UPGRADED)
+            self.assertEqual(bytes(node.firmware[:len(self.image)]),
+                             self.image)
+        self.assertEqual(jobs[0].bytesWritten, len(self.image))
+        self.assertEqual(jobs[0].progress(), 1.0)
+        self.assertEqual(len(progress), 5 * 13)  # 13 datagrams each
+        self.assertEqual(self.upgrader.jobs.activeJobs, 0)
+
+    def testUpgradeByStream(self):
+        node = self.addNode(10, streams=True)
+        self.memoryService.streamSupport[node.nodeID] = True
+        sent = []
+        self.clientLink.sendMessage = \
+            lambda m: sent.append(m.mti) or self.queue.append(m)
+        self.upgrader.upgrade([node.nodeID], self.path, self.results.append)
+        self.pump()
+        self.assertIsNone(self.results[0][0].error)
+        self.assertEqual(bytes(node.firmware[:len(self.image)]), self.image)
+        self.assertIn(MTI.Stream_Data_Send, sent)
+        # freeze, Write Stream and unfreeze
+        self.assertEqual(sent.count(MTI.Datagram), 3)
+
+    def testNodeThatDoesNotRestart(self):
+        node = self.addNode(10, restarts=False)
+        self.upgrader.upgrade([node.nodeID], self.path, self.results.append)
+        self.pump()
+        self.assertEqual(node.commands, [FROZEN])
+        self.assertIn(node.nodeID, self.upgrader.frozen)
+        self.upgrader.checkTimeouts(self.upgrader.freezeWait)
+        self.pump()
+        self.assertIsNone(self.results[0][0].error)
+        self.assertEqual(node.commands, UPGRADED)
+
+    def loseAck(self, node, commands):
+        '''Return a pump filter losing the node's acknowledgement of its
+        Freeze (commands 1) or Unfreeze (commands 2), as a node that
+        restarts before sending it.'''
+        def lose(message):
+            return (message.mti == MTI.Datagram_Received_OK
+                    and message.source == node.nodeID
+                    and len(node.commands) == commands)
+        return lose
+
+    def testRestartBeforeFreezeAcknowledged(self):
+        node = self.addNode(10)
+        self.upgrader.upgrade([node.nodeID], self.path, self.results.append)
+        self.pump(self.loseAck(node, 1))
+        # restarted, so writes wait only for the Freeze datagram to time out
+        self.assertEqual(self.results, [])
+        self.assertEqual(self.upgrader.frozen, {})
+        self.client.checkTimeouts(self.client.replyTimeout)
+        self.pump()
+        self.assertIsNone(self.results[0][0].error)
+        self.assertEqual(node.commands, UPGRADED)
+        self.assertEqual(bytes(node.firmware[:len(self.image)]), self.image)
+
+    def testFreezeTimeoutCountsAsFrozen(self):
+        node = self.addNode(10, restarts=False)
+        self.upgrader.upgrade([node.nodeID], self.path, self.results.append)
+        self.pump(self.loseAck(node, 1))
+        self.assertIn(node.nodeID, self.upgrader.frozen)
+        self.client.checkTimeouts(self.client.replyTimeout)
+        self.pump()
+        self.assertIsNone(self.results[0][0].error)
+        self.assertEqual(node.commands, UPGRADED)
+
+    def testRestartBeforeUnfreezeAcknowledged(self):
+        node = self.addNode(10)
+        self.upgrader.upgrade([node.nodeID], self.path, self.results.append)
+        self.pump(self.loseAck(node, 2))
+        self.assertIsNone(self.results[0][0].error)
+        self.assertEqual(self.upgrader.unfreezing, {})
+        self.client.checkTimeouts(self.client.replyTimeout)
+        self.assertEqual(len(self.results), 1)  # not finished again
+
+    def testUnfreezeTimeoutCountsAsDone(self):
+        node = self.addNode(10, restarts=False)
+        self.upgrader.upgrade([node.nodeID], self.path, self.results.append)
+        self.pump()
+        self.upgrader.checkTimeouts(self.upgrader.freezeWait)
+        self.pump(self.loseAck(node, 2))
+        self.assertEqual(self.results, [])
+        self.client.checkTimeouts(self.client.replyTimeout)
+        self.assertIsNone(self.results[0][0].error)
+        self.assertEqual(node.commands, UPGRADED)
+
+    def testRejectedFreezeFails(self):
+        node = self.addNode(10)
+        node.server.freezeCallback = None  # Freeze not implemented
+        self.upgrader.upgrade([node.nodeID], self.path, self.results.append)
+        self.pump()
+        self.assertIn("freeze failed", self.results[0][0].error)
+        self.assertEqual(self.upgrader.frozen, {})
+
+    def testImageTooLargeLeavesNodeFrozen(self):
+        node = self.addNode(10)
+        node.server.spaces[FIRMWARE_SPACE] = MemorySpace(bytearray(100))
+        self.upgrader.upgrade([node.nodeID], self.path, self.results.append)
+        self.pump()
+        job = self.results[0][0]
+        self.assertIsNotNone(job.error)
+        self.assertEqual(job.bytesWritten, 64)
+        self.assertEqual(node.commands, [FROZEN])
+
+    def testMissingImage(self):
+        self.upgrader.upgrade([NodeID(10)], self.path + ".missing",
+                              self.results.append)
+        self.assertEqual(len(self.results[0]), 1)
+        self.assertIsNotNone(self.results[0][0].error)
+        self.assertEqual(self.queue, [])
+
+    def testThroughput(self):
+        node = self.addNode(10)
+        times = iter([0.0, 0.0] + [2.0] * 100)  # freeze, write, ...
+        self.upgrader.clock = lambda: next(times)
+        self.upgrader.upgrade([node.nodeID], self.path, self.results.append)
+        self.pump()
+        job = self.results[0][0]
+        self.assertEqual(job.bytesPerSecond(), len(self.image) / 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from openlcb.jobrunner import JobRunner
+
+
+class Job:
+    def __init__(self, error=None):
+        self.error = error
+
+
+class TestJobRunnerClass(unittest.TestCase):
+
+    def testLimitsJobsInFlight(self):
+        runner = JobRunner(2)
+        started = []
+        finishedJobs = []
+        done = []
+        jobs = [Job() for _ in range(3)]
+        runner.run(jobs, lambda job, finished: started.append(finished),
+                   done.append, finishedJobs.append)
+        self.assertEqual(len(started), 2)
+        started[0](jobs[0])
+        self.assertEqual(len(started), 3)  # the third starts in its place
+        started[1](jobs[1])
+        started[2](jobs[2])
+        self.assertEqual(finishedJobs, jobs)
+        self.assertEqual(done, [jobs])
+        self.assertEqual(runner.activeJobs, 0)
+
+    def testFailedJobsNotStarted(self):
+        runner = JobRunner(1)
+        done = []
+        jobs = [Job("no image"), Job("no image")]
+        runner.run(jobs, lambda job, finished: self.fail("started"),
+                   done.append)
+        self.assertEqual(done, [jobs])
+        runner.run([], None, done.append)
+        self.assertEqual(done, [jobs, []])
+
+    def testManyJobsFinishingAtOnce(self):
+        runner = JobRunner(4)
+        done = []
+        failed = [Job("no image") for _ in range(5000)]
+        runner.run(failed, None, done.append)
+        self.assertEqual(done, [failed])
+        # and jobs that finish as they start, such as from a cache
+        jobs = [Job() for _ in range(5000)]
+        runner.run(jobs, lambda job, finished: finished(job), done.append)
+        self.assertEqual(done, [failed, jobs])
+        self.assertEqual(runner.activeJobs, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
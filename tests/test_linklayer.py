@@ -26,6 +26,16 @@ class TestLinkLayerClass(unittest.TestCase):
 
         self.assertTrue(self.received)
 
+    def testListenersPerInstance(self):
+        self.received = False
+        msg = Message(MTI.Initialization_Complete, NodeID(12), NodeID(21))
+        layer = LinkLayer(NodeID(100))
+        layer.registerMessageReceivedListener(self.receiveListener)
+
+        LinkLayer(NodeID(101)).fireListeners(msg)
+
+        self.assertFalse(self.received)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,275 @@
+import os
+import tempfile
+import unittest
+
+from openlcb.nodeid import NodeID
+from openlcb.mti import MTI
+from openlcb.datagramservice import (
+    DatagramService,
+    DatagramWriteMemo,
+)
+from openlcb.memoryconfigserver import (
+    MemoryConfigServer,
+    MemorySpace,
+)
+from openlcb.memoryservice import (
+    MemoryBulkReadMemo,
+    MemoryBulkWriteMemo,
+    MemoryReadMemo,
+    MemoryWriteMemo,
+    MemoryService,
+)
+from openlcb.streamservice import StreamService
+from tests.mocklinks import LoopbackLink
+
+
+class TestMemoryConfigServerClass(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = []
+        self.clientID = NodeID(12)
+        self.serverID = NodeID(34)
+        self.clientLink = LoopbackLink(self.clientID, self.queue)
+        self.serverLink = LoopbackLink(self.serverID, self.queue)
+        self.client = DatagramService(self.clientLink)
+        self.memoryService = MemoryService(self.client)
+        self.serverDatagrams = DatagramService(self.serverLink)
+        self.server = MemoryConfigServer(self.serverDatagrams)
+        self.cdi = b"<cdi></cdi>\0"
+        self.server.addSpace(0xFF, MemorySpace(self.cdi))
+        self.config = bytearray(range(100))
+        self.server.addSpace(0xFD, MemorySpace(self.config))
+        self.server.addSpace(0x10, MemorySpace(bytearray(8),
+                                               lowAddress=0x1000))
+        self.replies = []
+        self.serverStreams = None
+        self.clientStreams = None
+
+    def useStreams(self, server=True):
+        """Give the client, and optionally the server, a StreamService,
+        with the server known to support streams."""
+        self.clientStreams = StreamService(self.clientLink, bufferSize=32)
+        self.memoryService.streamService = self.clientStreams
+        self.memoryService.streamSupport[self.serverID] = True
+        if server:
+            self.serverStreams = StreamService(self.serverLink)
+            self.server.streamService = self.serverStreams
+
+    def pump(self, lost=None):
+        while self.queue:
+            message = self.queue.pop(0)
+            if message.mti == lost:
+                continue
+            if message.destination == self.serverID:
+                self.serverDatagrams.process(message)
+                if self.serverStreams is not None:
+                    self.serverStreams.process(message)
+            else:
+                self.client.process(message)
+                self.memoryService.process(message)
+                if self.clientStreams is not None:
+                    self.clientStreams.process(message)
+
+    def read(self, space, address, size):
+        self.memoryService.requestMemoryRead(MemoryReadMemo(
+            self.serverID, size, space, address,
+            lambda memo: self.replies.append(("rejected", memo.data)),
+            lambda memo: self.replies.append(("data", memo.data))))
+        self.pump()
+        return self.replies.pop()
+
+    def write(self, space, address, data):
+        self.memoryService.requestMemoryWrite(MemoryWriteMemo(
+            self.serverID, lambda memo: self.replies.append("ok"),
+            lambda memo: self.replies.append("rejected"), len(data), space,
+            address, bytearray(data)))
+        self.pump()
+        return self.replies.pop()
+
+    def testRead(self):
+        self.assertEqual(self.read(0xFF, 0, 64), ("data", self.cdi))
+        self.assertEqual(self.read(0xFD, 10, 4),
+                         ("data", bytearray([10, 11, 12, 13])))
+        self.assertEqual(self.read(0x10, 0x1006, 4),
+                         ("data", bytearray(2)))
+
+    def testReadErrors(self):
+        self.assertEqual(self.read(0xFD, 100, 4),
+                         ("rejected", bytearray([0x10, 0x82])))
+        self.assertEqual(self.read(0xFE, 0, 4),
+                         ("rejected", bytearray([0x10, 0x81])))
+        self.assertEqual(self.read(0x10, 0, 4),
+                         ("rejected", bytearray([0x10, 0x82])))
+
+    def testWrite(self):
+        self.assertEqual(self.write(0xFD, 2, b"ab"), "ok")
+        self.assertEqual(self.config[0:5], bytearray([0, 1]) + b"ab"
+                         + bytearray([4]))
+        self.assertEqual(self.write(0xFF, 0, b"x"), "rejected")
+        self.assertEqual(self.write(0xFD, 99, b"ab"), "rejected")
+
+    def testSpaceInformation(self):
+        infos = []
+        self.memoryService.requestSpaceInfo(0xFF, self.serverID,
+                                            infos.append)
+        self.memoryService.requestSpaceInfo(0x10, self.serverID,
+                                            infos.append)
+        self.memoryService.requestSpaceInfo(0x20, self.serverID,
+                                            infos.append)
+        self.pump()
+        self.assertEqual([(i.space, i.present, i.highestAddress, i.readOnly,
+                           i.lowAddress) for i in infos],
+                         [(0xFF, True, len(self.cdi) - 1, True, 0),
+                          (0x10, True, 0x1007, False, 0x1000),
+                          (0x20, False, 0, False, 0)])
+
+    def testConfigurationOptions(self):
+        self.client.sendDatagram(self.memoryDatagram([0x20, 0x80]))
+        replies = []
+        self.client.registerDatagramReceivedListener(
+            lambda dg: replies.append(dg.data) or False)
+        self.pump()
+        self.assertEqual(replies[0], bytearray([0x20, 0x82, 0x60, 0x00,
+                                                0xF2, 0xFF, 0x10]))
+
+    def testConfigurationOptionsWithStreams(self):
+        self.useStreams()
+        self.client.sendDatagram(self.memoryDatagram([0x20, 0x80]))
+        replies = []
+        self.client.registerDatagramReceivedListener(
+            lambda dg: replies.append(dg.data) or False)
+        self.pump()
+        self.assertEqual(replies[0][4], 0xF3)  # stream bit set
+
+    def testUnknownCommandRejected(self):
+        rejected = []
+        memo = self.memoryDatagram([0x20, 0xA9])  # reset
+        memo.rejectedReply = rejected.append
+        self.client.sendDatagram(memo)
+        self.pump()
+        self.assertEqual(rejected[0].errorCode, 0x1042)
+
+    def memoryDatagram(self, data):
+        return DatagramWriteMemo(self.serverID, bytearray(data))
+
+    def testRequestNotClaimedByMemoryService(self):
+        # a node with both a client and a server answers requests once
+        MemoryService(self.serverDatagrams)
+        self.assertEqual(self.read(0xFD, 0, 2), ("data", bytearray([0, 1])))
+        acks = [m for m in self.queue if m.mti == MTI.Datagram_Received_OK]
+        self.assertEqual(acks, [])
+
+    def bulkRead(self, space, address, length):
+        self.memoryService.requestMemoryBulkRead(MemoryBulkReadMemo(
+            self.serverID, space, address, length,
+            lambda memo: self.replies.append(("rejected", memo.data)),
+            lambda memo: self.replies.append(("data", memo.data))))
+        self.pump()
+        return self.replies.pop()
+
+    def bulkWrite(self, space, address, data):
+        self.memoryService.requestMemoryBulkWrite(MemoryBulkWriteMemo(
+            self.serverID, space, address, bytearray(data),
+            lambda memo: self.replies.append("ok"),
+            lambda memo: self.replies.append("rejected")))
+        self.pump()
+        return self.replies.pop()
+
+    def testReadStream(self):
+        self.useStreams()
+        self.assertEqual(self.bulkRead(0xFD, 10, 70),
+                         ("data", self.config[10:80]))
+        self.assertEqual(self.bulkRead(0xFF, 0, None),
+                         ("data", bytearray(b"<cdi></cdi>")))
+        self.assertEqual(self.bulkRead(0xFD, 90, 50),
+                         ("data", self.config[90:]))  # end of space
+        self.assertEqual(self.memoryService.streamSupport[self.serverID],
+                         True)
+
+    def testReadStreamSendsNoReadDatagrams(self):
+        self.useStreams()
+        sent = []
+        original = self.clientLink.sendMessage
+        self.clientLink.sendMessage = lambda m: sent.append(m) or original(m)
+        self.bulkRead(0xFD, 0, 100)
+        datagrams = [m for m in sent if m.mti == MTI.Datagram]
+        self.assertEqual(len(datagrams), 1)  # the Read Stream command
+        self.assertEqual(datagrams[0].data[1], 0x61)
+
+    def testReadStreamInitiatedAfterReplyAcknowledged(self):
+        self.useStreams()
+        mtis = []
+        for link in (self.clientLink, self.serverLink):
+            link.sendMessage = (lambda m, original=link.sendMessage:
+                                mtis.append(m.mti) or original(m))
+        self.bulkRead(0xFD, 0, 10)
+        self.assertEqual(mtis[:5], [
+            MTI.Datagram, MTI.Datagram_Received_OK,  # Read Stream
+            MTI.Datagram, MTI.Datagram_Received_OK,  # its reply
+            MTI.Stream_Initiate_Request])
+
+    def testStalledReadStreamTimesOut(self):
+        self.useStreams()
+        self.clientStreams.clock = lambda: 0.0
+        self.serverStreams.clock = lambda: 0.0
+        self.memoryService.requestMemoryBulkRead(MemoryBulkReadMemo(
+            self.serverID, 0xFD, 0, 10,
+            lambda memo: self.replies.append(("rejected", memo.data)),
+            lambda memo: self.replies.append(("data", memo.data))))
+        self.pump(lost=MTI.Stream_Initiate_Request)
+        self.assertEqual(self.replies, [])
+        self.clientStreams.checkTimeouts(self.clientStreams.timeout)
+        self.serverStreams.checkTimeouts(self.serverStreams.timeout)
+        self.assertEqual(self.replies, [("rejected", bytearray())])
+        self.assertEqual(self.clientStreams.expected, {})
+        self.assertEqual(self.serverStreams.outgoing, {})
+
+    def testWriteStream(self):
+        self.useStreams()
+        self.assertEqual(self.bulkWrite(0xFD, 5, range(200, 250)), "ok")
+        self.assertEqual(self.config[5:55], bytearray(range(200, 250)))
+        self.assertEqual(self.config[4], 4)
+        self.assertEqual(self.config[55], 55)
+        self.assertEqual(self.bulkWrite(0xFF, 0, b"x"), "rejected")
+        self.assertEqual(self.bulkRead(0xFD, 200, 4),
+                         ("rejected", bytearray()))
+        # errors in range don't mean the node lacks streams
+        self.assertTrue(self.memoryService.streamSupport[self.serverID])
+
+    def testStreamFallbackToDatagrams(self):
+        self.useStreams(server=False)
+        self.assertEqual(self.bulkRead(0xFD, 10, 70),
+                         ("data", self.config[10:80]))
+        self.assertFalse(self.memoryService.streamSupport[self.serverID])
+        self.assertEqual(self.bulkWrite(0xFD, 0, range(100, 180)), "ok")
+        self.assertEqual(self.config[0:80], bytearray(range(100, 180)))
+
+    def testWriteStreamFallbackToDatagrams(self):
+        self.useStreams(server=False)
+        self.assertEqual(self.bulkWrite(0xFD, 0, range(100, 180)), "ok")
+        self.assertEqual(self.config[0:80], bytearray(range(100, 180)))
+
+    def testFileBackedSpace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "config.bin")
+            space = MemorySpace.fromFile(path, 256)
+            self.server.addSpace(0xFD, space)
+            self.server.clock = lambda: 0.0
+            self.assertEqual(self.write(0xFD, 200, b"saved"), "ok")
+            self.assertTrue(space.dirty)
+            self.server.checkTimeouts(self.server.flushDelay / 2)
+            self.assertTrue(space.dirty)
+            self.server.checkTimeouts(self.server.flushDelay)
+            self.assertFalse(space.dirty)
+            self.server.close()
+            with open(path, "rb") as stream:
+                content = stream.read()
+            self.assertEqual(len(content), 256)
+            self.assertEqual(content[200:205], b"saved")
+            reopened = MemorySpace.fromFile(path, 256, readOnly=True)
+            self.assertEqual(bytes(reopened.view[200:205]), b"saved")
+            reopened.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
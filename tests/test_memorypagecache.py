@@ -0,0 +1,182 @@
+import unittest
+
+from openlcb.nodeid import NodeID
+from openlcb.linklayer import LinkLayer
+from openlcb.mti import MTI
+from openlcb.message import Message
+from openlcb.memoryservice import (
+    MemoryReadMemo,
+    MemoryWriteMemo,
+    MemoryService,
+)
+from openlcb.memorypagecache import MemoryPageCache
+from openlcb.datagramservice import (
+    DatagramService,
+)
+
+
+class LinkMockLayer(LinkLayer):
+    sentMessages = []
+
+    def sendMessage(self, message):
+        LinkMockLayer.sentMessages.append(message)
+
+
+class TestMemoryPageCacheClass(unittest.TestCase):
+
+    def setUp(self):
+        LinkMockLayer.sentMessages = []
+        self.dataMemos = []
+        self.rejectedMemos = []
+        self.dService = DatagramService(LinkMockLayer(NodeID(12)))
+        self.mService = MemoryService(self.dService)
+        self.cache = MemoryPageCache(self.mService)
+        self.node = NodeID(123)
+        self.memory = bytearray(range(200))  # the remote node's space
+        self.answered = 0
+
+    def read(self, address, size, space=0xFD):
+        memo = MemoryReadMemo(self.node, size, space, address,
+                              self.rejectedMemos.append,
+                              self.dataMemos.append)
+        self.cache.requestMemoryRead(memo)
+        return memo
+
+    def answerRequests(self):
+        """Act as the remote node, answering each datagram sent.
+
+        Returns:
+            int: How many datagrams were answered.
+        """
+        count = 0
+        while self.answered < len(LinkMockLayer.sentMessages):
+            request = LinkMockLayer.sentMessages[self.answered]
+            self.answered += 1
+            if request.mti != MTI.Datagram:
+                continue
+            count += 1
+            self.dService.process(Message(MTI.Datagram_Received_OK,
+                                          self.node, NodeID(12)))
+            address = int.from_bytes(request.data[2:6], "big")
+            if request.data[1] & 0xFC == 0x40:  # read
+                size = request.data[-1]
+                if address >= len(self.memory):
+                    reply = (bytearray([0x20, request.data[1] | 0x18])
+                             + request.data[2:6] + bytearray([0x10, 0x81]))
+                else:
+                    reply = (bytearray([0x20, request.data[1] | 0x10])
+                             + request.data[2:6]
+                             + self.memory[address:address + size])
+            else:  # write
+                data = request.data[6:]
+                self.memory[address:address + len(data)] = data
+                reply = (bytearray([0x20, request.data[1] | 0x10])
+                         + request.data[2:6])
+            self.dService.process(Message(MTI.Datagram, self.node,
+                                          NodeID(12), reply))
+        return count
+
+    def testRepeatReadAnsweredFromCache(self):
+        self.read(10, 20)
+        self.assertEqual(self.answerRequests(), 1)
+        self.read(12, 8)
+        self.assertEqual(self.answerRequests(), 0)
+        self.assertEqual(len(self.dataMemos), 2)
+        self.assertEqual(self.dataMemos[1].data, self.memory[12:20])
+        self.assertEqual(self.cache.hits, 1)
+
+    def testReadAcrossPagesAndEndOfSpace(self):
+        self.read(120, 100)  # pages 1 to 3; page 3 is past the end
+        self.assertEqual(self.answerRequests(), 3)
+        self.assertEqual(self.rejectedMemos, [])
+        self.assertEqual(self.dataMemos[0].data, self.memory[120:200])
+
+    def testSamePageRequestedOnce(self):
+        self.read(0, 4)
+        self.read(8, 4)
+        self.assertEqual(self.answerRequests(), 1)
+        self.assertEqual(len(self.dataMemos), 2)
+
+    def testFailedPageRejectsRead(self):
+        self.read(300, 4)
+        self.answerRequests()
+        self.assertEqual(len(self.rejectedMemos), 1)
+        self.assertEqual(self.cache.pages, {})
+
+    def testLeastRecentlyUsedEvicted(self):
+        self.cache.budget = 128
+        self.read(0, 1)
+        self.read(64, 1)
+        self.answerRequests()
+        self.read(0, 1)  # page 0 now more recently used than page 1
+        self.read(128, 1)
+        self.answerRequests()
+        self.assertEqual(self.cache.size, 128)
+        self.assertEqual([key[2] for key in self.cache.pages], [0, 2])
+
+    def testWriteUpdatesCachedPage(self):
+        self.read(0, 8)
+        self.answerRequests()
+        memo = MemoryWriteMemo(self.node, lambda m: None,
+                               self.rejectedMemos.append, 2, 0xFD, 4,
+                               bytearray([0xAA, 0xBB]))
+        self.cache.requestMemoryWrite(memo)
+        page = self.cache.pages[(self.node, 0xFD, 0)]
+        self.assertEqual(page.dirty, 1)
+        self.answerRequests()
+        self.assertEqual(page.dirty, 0)
+        self.read(0, 8)
+        self.assertEqual(self.answerRequests(), 0)
+        self.assertEqual(self.dataMemos[-1].data,
+                         bytearray([0, 1, 2, 3, 0xAA, 0xBB, 6, 7]))
+
+    def testWriteWhilePageLoads(self):
+        self.read(0, 10)  # page 0 requested, not yet answered
+        self.cache.requestMemoryWrite(MemoryWriteMemo(
+            self.node, lambda m: None, self.rejectedMemos.append, 2, 0xFD,
+            5, bytearray(b"XY")))
+        self.answerRequests()  # the read is answered before the write
+        self.assertEqual(self.dataMemos[0].data[4:8],
+                         bytearray([4, ord("X"), ord("Y"), 7]))
+        self.read(0, 10)
+        self.assertEqual(self.answerRequests(), 0)
+        self.assertEqual(self.dataMemos[1].data, self.memory[0:10])
+        self.assertEqual(self.cache.pages[(self.node, 0xFD, 0)].dirty, 0)
+
+    def testInvalidateWithWriteInFlight(self):
+        self.read(0, 8)
+        self.answerRequests()
+        self.cache.requestMemoryWrite(MemoryWriteMemo(
+            self.node, lambda m: None, self.rejectedMemos.append, 2, 0xFD,
+            4, bytearray([0xAA, 0xBB])))
+        self.cache.invalidate(self.node)
+        key = (self.node, 0xFD, 0)
+        self.cache.storePage(key, self.memory[0:64])  # read again first
+        self.answerRequests()
+        # the write's acknowledgement leaves the new page alone
+        self.assertEqual(self.cache.pages[key].dirty, 0)
+
+    def testWritableSpaceExpires(self):
+        now = [0.0]
+        self.cache.clock = lambda: now[0]
+        self.read(0, 4)
+        self.read(0, 4, space=0xFF)
+        self.answerRequests()
+        now[0] = self.cache.maxAge + 1
+        self.read(0, 4)
+        self.read(0, 4, space=0xFF)
+        self.assertEqual(self.answerRequests(), 1)  # only 0xFD read again
+
+    def testInitializationCompleteInvalidates(self):
+        self.read(0, 4, space=0xFF)
+        self.answerRequests()
+        self.cache.process(Message(MTI.Initialization_Complete, NodeID(99),
+                                   None, bytearray(6)))
+        self.assertEqual(len(self.cache.pages), 1)
+        self.cache.process(Message(MTI.Initialization_Complete, self.node,
+                                   None, bytearray(6)))
+        self.assertEqual(len(self.cache.pages), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,7 @@ from openlcb.linklayer import LinkLayer
 from openlcb.mti import MTI
 from openlcb.message import Message
 from openlcb.memoryservice import (
+    MemoryBulkReadMemo,
     MemoryReadMemo,
     MemoryWriteMemo,
     MemoryService,
@@ -159,6 +160,296 @@ class TestMemoryServiceClass(unittest.TestCase):
         self.assertEqual(len(LinkMockLayer.sentMessages), 5)  # read reply datagram reply sent and next datagram sent  # noqa: E501
         self.assertEqual(len(self.returnedMemoryReadMemo), 2)  # memory read returned  # noqa: E501
 
+    def testReadsToTwoNodesInParallel(self):
+        for node in (123, 456):
+            self.mService.requestMemoryRead(MemoryReadMemo(
+                NodeID(node), 64, 0xFD, 0, self.callbackR, self.callbackR))
+        # a second read of node 123 waits for the first
+        self.mService.requestMemoryRead(MemoryReadMemo(
+            NodeID(123), 64, 0xFD, 64, self.callbackR, self.callbackR))
+        self.assertEqual(len(LinkMockLayer.sentMessages), 2)
+        self.assertEqual(LinkMockLayer.sentMessages[1].destination,
+                         NodeID(456))
+
+        # node 456 answers first
+        self.dService.process(Message(MTI.Datagram_Received_OK, NodeID(456),
+                                      NodeID(12)))
+        self.dService.process(
+            Message(MTI.Datagram, NodeID(456), NodeID(12),
+                    bytearray([0x20, 0x51, 0, 0, 0, 0, 9])))
+        self.assertEqual(len(self.returnedMemoryReadMemo), 1)
+        self.assertEqual(self.returnedMemoryReadMemo[0].nodeID, NodeID(456))
+
+        self.dService.process(Message(MTI.Datagram_Received_OK, NodeID(123),
+                                      NodeID(12)))
+        self.dService.process(
+            Message(MTI.Datagram, NodeID(123), NodeID(12),
+                    bytearray([0x20, 0x51, 0, 0, 0, 0, 1])))
+        self.assertEqual(len(self.returnedMemoryReadMemo), 2)
+        # and then the second read of 123 goes out
+        self.assertEqual(LinkMockLayer.sentMessages[-1].data,
+                         bytearray([0x20, 0x41, 0, 0, 0, 64, 64]))
+
+    def testWriteThenReadSameNodeInOrder(self):
+        self.mService.requestMemoryWrite(MemoryWriteMemo(
+            NodeID(123), self.callbackW, self.callbackW, 3, 0xFD, 0,
+            bytearray([1, 2, 3])))
+        self.mService.requestMemoryRead(MemoryReadMemo(
+            NodeID(123), 3, 0xFD, 0, self.callbackR, self.callbackR))
+        self.assertEqual(len(LinkMockLayer.sentMessages), 1)
+
+        self.dService.process(Message(MTI.Datagram_Received_OK, NodeID(123),
+                                      NodeID(12)))
+        # the read waits for the write's reply
+        self.assertEqual(len(LinkMockLayer.sentMessages), 1)
+        self.dService.process(
+            Message(MTI.Datagram, NodeID(123), NodeID(12),
+                    bytearray([0x20, 0x11, 0, 0, 0, 0])))
+        self.assertEqual(len(self.returnedMemoryWriteMemo), 1)
+        self.assertEqual(LinkMockLayer.sentMessages[-1].data,
+                         bytearray([0x20, 0x41, 0, 0, 0, 0, 3]))
+
+    def testReplyMatchedByAddress(self):
+        self.mService.requestWindow = 2
+        for address in (0, 64):
+            self.mService.requestMemoryRead(MemoryReadMemo(
+                NodeID(123), 64, 0xFD, address,
+                self.callbackR, self.callbackR))
+        self.dService.process(Message(MTI.Datagram_Received_OK, NodeID(123),
+                                      NodeID(12)))
+        self.dService.process(Message(MTI.Datagram_Received_OK, NodeID(123),
+                                      NodeID(12)))
+
+        # replies arrive out of order
+        self.dService.process(
+            Message(MTI.Datagram, NodeID(123), NodeID(12),
+                    bytearray([0x20, 0x51, 0, 0, 0, 64, 2])))
+        self.dService.process(
+            Message(MTI.Datagram, NodeID(123), NodeID(12),
+                    bytearray([0x20, 0x51, 0, 0, 0, 0, 1])))
+        self.assertEqual([(m.address, m.data)
+                          for m in self.returnedMemoryReadMemo],
+                         [(64, bytearray([2])), (0, bytearray([1]))])
+
+        # a reply for something not requested is dropped
+        self.dService.process(
+            Message(MTI.Datagram, NodeID(123), NodeID(12),
+                    bytearray([0x20, 0x51, 0, 0, 0, 128, 3])))
+        self.assertEqual(len(self.returnedMemoryReadMemo), 2)
+
+    def testAckedRequestWithoutReplyTimesOut(self):
+        now = [0.0]
+        self.mService.clock = lambda: now[0]
+        self.mService.requestMemoryRead(MemoryReadMemo(
+            NodeID(123), 3, 0xFD, 0, self.callbackR, self.callbackR))
+        self.mService.requestMemoryWrite(MemoryWriteMemo(
+            NodeID(123), self.callbackW, self.callbackW, 1, 0xFD, 0,
+            bytearray([1])))
+        infos = []
+        self.mService.requestSpaceInfo(0xFD, NodeID(456), infos.append)
+        # both nodes acknowledge, then say nothing more
+        self.dService.process(Message(MTI.Datagram_Received_OK, NodeID(123),
+                                      NodeID(12)))
+        self.dService.process(Message(MTI.Datagram_Received_OK, NodeID(456),
+                                      NodeID(12)))
+        sent = len(LinkMockLayer.sentMessages)
+
+        self.mService.checkTimeouts(self.mService.replyTimeout - 0.1)
+        self.assertEqual(self.returnedMemoryReadMemo, [])
+        self.mService.checkTimeouts(self.mService.replyTimeout)
+        self.assertEqual(len(self.returnedMemoryReadMemo), 1)  # rejected
+        self.assertEqual(self.returnedMemoryReadMemo[0].data, bytearray())
+        self.assertEqual(infos, [None])
+        # the write queued behind the read goes out
+        self.assertEqual(LinkMockLayer.sentMessages[sent].data,
+                         bytearray([0x20, 0x01, 0, 0, 0, 0, 1]))
+        self.assertEqual(self.mService.sentMemos[NodeID(123)][0].address, 0)
+        self.assertEqual(self.mService.replyDeadlines, {})
+
+    def testWriteCompleteWithoutReplyPending(self):
+        self.mService.requestMemoryWrite(MemoryWriteMemo(
+            NodeID(123), self.callbackW, self.callbackW, 1, 0xFD, 0,
+            bytearray([1])))
+        self.mService.requestMemoryRead(MemoryReadMemo(
+            NodeID(123), 3, 0xFD, 0, self.callbackR, self.callbackR))
+        sent = len(LinkMockLayer.sentMessages)
+        # written already, so no Write Reply will come
+        self.dService.process(Message(MTI.Datagram_Received_OK, NodeID(123),
+                                      NodeID(12), bytearray([0x00])))
+        self.assertEqual(len(self.returnedMemoryWriteMemo), 1)
+        self.assertEqual(self.mService.replyDeadlines, {})
+        # the read queued behind it goes out at once
+        self.assertEqual(LinkMockLayer.sentMessages[sent].data[1], 0x41)
+
+    def testReplyPendingTimeoutExponent(self):
+        now = [0.0]
+        self.mService.clock = lambda: now[0]
+        self.mService.requestMemoryWrite(MemoryWriteMemo(
+            NodeID(123), self.callbackW, self.callbackW, 1, 0xFD, 0,
+            bytearray([1])))
+        # reply pending within 2^4 s, as for a slow flash write
+        self.dService.process(Message(MTI.Datagram_Received_OK, NodeID(123),
+                                      NodeID(12), bytearray([0x84])))
+        self.mService.checkTimeouts(15.0)
+        self.assertEqual(self.returnedMemoryWriteMemo, [])
+        self.mService.checkTimeouts(16.0)
+        self.assertEqual(len(self.returnedMemoryWriteMemo), 1)  # rejected
+
+    def replySpaceInfo(self, node, data):
+        self.dService.process(Message(MTI.Datagram_Received_OK, node,
+                                      NodeID(12)))
+        self.dService.process(Message(MTI.Datagram, node, NodeID(12),
+                                      bytearray(data)))
+
+    def testSpaceInfoQueriesAndCache(self):
+        infos = []
+        self.mService.requestSpaceInfo(0xFF, NodeID(123), infos.append)
+        self.mService.requestSpaceInfo(0xFD, NodeID(123), infos.append)
+        self.mService.requestSpaceInfo(0xFF, NodeID(456), infos.append)
+        self.mService.requestSpaceInfo(0xFF, NodeID(123), infos.append)
+        # one query per node and space; the second to 123 waits its turn
+        queries = [m for m in LinkMockLayer.sentMessages
+                   if m.data[:2] == bytearray([0x20, 0x84])]
+        self.assertEqual(len(queries), 2)
+
+        self.replySpaceInfo(NodeID(123), [0x20, 0x87, 0xFF, 0, 0, 0x9F, 0xFF,
+                                          0x01])
+        self.replySpaceInfo(NodeID(456), [0x20, 0x86, 0xFF])
+        self.replySpaceInfo(NodeID(123), [0x20, 0x87, 0xFD, 0, 0, 0x01, 0xFF,
+                                          0x02, 0, 0, 0, 0x10])
+        self.assertEqual(len(infos), 4)
+        self.assertEqual([(i.nodeID, i.space) for i in infos],
+                         [(NodeID(123), 0xFF), (NodeID(123), 0xFF),
+                          (NodeID(456), 0xFF), (NodeID(123), 0xFD)])
+        self.assertEqual(infos[0].highestAddress, 0x9FFF)
+        self.assertTrue(infos[0].readOnly)
+        self.assertFalse(infos[2].present)
+        self.assertFalse(infos[3].readOnly)
+        self.assertEqual(infos[3].lowAddress, 0x10)
+
+        # answered from the cache
+        sent = len(LinkMockLayer.sentMessages)
+        lengths = []
+        self.mService.requestSpaceLength(0xFF, NodeID(123), lengths.append)
+        self.mService.requestSpaceLength(0xFF, NodeID(456), lengths.append)
+        self.assertEqual(lengths, [0x9FFF, -1])
+        self.assertEqual(len(LinkMockLayer.sentMessages), sent)
+
+        # until the node reinitializes
+        self.mService.process(Message(MTI.Initialization_Complete,
+                                      NodeID(123), None,
+                                      NodeID(123).toArray()))
+        self.mService.requestSpaceLength(0xFF, NodeID(123), lengths.append)
+        self.assertEqual(len(LinkMockLayer.sentMessages), sent + 1)
+        self.mService.requestSpaceLength(0xFF, NodeID(456), lengths.append)
+        self.assertEqual(lengths, [0x9FFF, -1, -1])
+
+    def answerReads(self, memory, node=NodeID(123)):
+        """Act as the remote node: acknowledge each read request sent so
+        far and reply with data from memory (a bytearray for space 0xFF),
+        until no more requests appear.
+
+        Returns:
+            int: Most read requests sent but not yet answered with data.
+        """
+        answered = 0
+        mostWaiting = 0
+        while True:
+            requests = [m for m in LinkMockLayer.sentMessages
+                        if m.data[:2] == bytearray([0x20, 0x43])]
+            if answered == len(requests):
+                return mostWaiting
+            request = requests[answered]
+            self.dService.process(Message(MTI.Datagram_Received_OK, node,
+                                          NodeID(12)))
+            sent = sum(1 for m in LinkMockLayer.sentMessages
+                       if m.data[:2] == bytearray([0x20, 0x43]))
+            mostWaiting = max(mostWaiting, sent - answered)
+            answered += 1
+            address = int.from_bytes(request.data[2:6], "big")
+            data = memory[address:address+request.data[6]]
+            self.dService.process(
+                Message(MTI.Datagram, node, NodeID(12),
+                        bytearray([0x20, 0x53]) + request.data[2:6] + data))
+
+    def testBulkReadLength(self):
+        memory = bytearray(range(200))
+        chunks = []
+        memo = MemoryBulkReadMemo(NodeID(123), 0xFF, 10, 150,
+                                  self.callbackR, self.callbackR,
+                                  lambda memo: chunks.append(len(memo.data)))
+        self.mService.requestMemoryBulkRead(memo)
+
+        self.answerReads(memory)
+
+        self.assertEqual(len(self.returnedMemoryReadMemo), 1)
+        self.assertIs(self.returnedMemoryReadMemo[0], memo)
+        self.assertEqual(memo.data, memory[10:160])
+        self.assertEqual(chunks, [64, 128, 150])  # 64, 64 then 22 bytes
+
+    def testBulkReadUntilZero(self):
+        memory = bytearray(b"<cdi>" * 100) + bytearray(300)
+        self.mService.requestWindow = 2
+        memo = MemoryBulkReadMemo(NodeID(123), 0xFF, 0, None,
+                                  self.callbackR, self.callbackR)
+        self.mService.requestMemoryBulkRead(memo)
+
+        mostWaiting = self.answerReads(memory)
+
+        self.assertEqual(len(self.returnedMemoryReadMemo), 1)
+        self.assertEqual(memo.data, memory[:500])
+        # the next request was queued while each reply was pending
+        self.assertEqual(mostWaiting, 2)
+
+    def testFinishedBulkReadDropsQueuedChunks(self):
+        memory = bytearray(b"<cdi/>") + bytearray(300)
+        memo = MemoryBulkReadMemo(NodeID(123), 0xFF, 0, None,
+                                  self.callbackR, self.callbackR)
+        self.mService.requestMemoryBulkRead(memo)
+        self.assertEqual(len(self.mService.pendingMemos[NodeID(123)]), 3)
+
+        self.answerReads(memory)
+
+        self.assertEqual(memo.data, memory[:6])
+        reads = [m for m in LinkMockLayer.sentMessages
+                 if m.data[:2] == bytearray([0x20, 0x43])]
+        self.assertEqual(len(reads), 1)  # none past the 0 byte
+        self.assertNotIn(NodeID(123), self.mService.pendingMemos)
+        self.assertEqual(memo.readsQueued, 0)
+
+    def testBulkReadToEndOfSpace(self):
+        memory = bytearray(b"x" * 100)  # no 0 byte; replies get short
+        memo = MemoryBulkReadMemo(NodeID(123), 0xFF, 0, None,
+                                  self.callbackR, self.callbackR)
+        self.mService.requestMemoryBulkRead(memo)
+
+        self.answerReads(memory)
+
+        self.assertEqual(len(self.returnedMemoryReadMemo), 1)
+        self.assertEqual(memo.data, memory)
+
+    def testBulkReadRequestRejected(self):
+        rejected = []
+        memo = MemoryBulkReadMemo(NodeID(123), 0xFF, 0, 100,
+                                  rejected.append, self.callbackR)
+        self.mService.requestMemoryBulkRead(memo)
+        self.dService.process(Message(MTI.Datagram_Rejected, NodeID(123),
+                                      NodeID(12), bytearray([0x10, 0x00])))
+        self.assertEqual(rejected, [memo])
+        self.assertEqual(len(self.returnedMemoryReadMemo), 0)
+
+    def testStreamSupportFromProtocolSupportReply(self):
+        self.mService.process(Message(MTI.Protocol_Support_Reply,
+                                      NodeID(123), NodeID(12),
+                                      bytearray([0x74, 0, 0, 0, 0, 0])))
+        self.mService.process(Message(MTI.Protocol_Support_Reply,
+                                      NodeID(456), NodeID(12),
+                                      bytearray([0x54, 0, 0, 0, 0, 0])))
+        self.assertEqual(self.mService.streamSupport,
+                         {NodeID(123): True, NodeID(456): False})
+        # without a StreamService, bulk transfers use datagrams anyway
+        self.assertFalse(self.mService.usesStreams(NodeID(123)))
+
     def testArrayToString(self):
         sut = MemoryService.arrayToString(bytearray([0x41, 0x42, 0x43, 0x44]), 4)  # noqa:E501
         self.assertEqual(sut, "ABCD")
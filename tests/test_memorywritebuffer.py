@@ -0,0 +1,131 @@
+import unittest
+
+from openlcb.nodeid import NodeID
+from openlcb.linklayer import LinkLayer
+from openlcb.mti import MTI
+from openlcb.message import Message
+from openlcb.memoryservice import (
+    MemoryWriteMemo,
+    MemoryService,
+)
+from openlcb.memorywritebuffer import MemoryWriteBuffer
+from openlcb.datagramservice import (
+    DatagramService,
+)
+
+
+class LinkMockLayer(LinkLayer):
+    sentMessages = []
+
+    def sendMessage(self, message):
+        LinkMockLayer.sentMessages.append(message)
+
+
+class TestMemoryWriteBufferClass(unittest.TestCase):
+
+    def callbackOK(self, memo):
+        self.okMemos.append(memo)
+
+    def callbackRejected(self, memo):
+        self.rejectedMemos.append(memo)
+
+    def setUp(self):
+        LinkMockLayer.sentMessages = []
+        self.okMemos = []
+        self.rejectedMemos = []
+        self.dService = DatagramService(LinkMockLayer(NodeID(12)))
+        self.mService = MemoryService(self.dService)
+        self.buffer = MemoryWriteBuffer(self.mService)
+
+    def write(self, address, data, space=0xFD, node=NodeID(123)):
+        memo = MemoryWriteMemo(node, self.callbackOK, self.callbackRejected,
+                               len(data), space, address, bytearray(data))
+        self.buffer.requestMemoryWrite(memo)
+        return memo
+
+    def answerWrites(self, failAddress=None, node=NodeID(123)):
+        """Act as the remote node, answering each write datagram sent.
+
+        Returns:
+            list[Message]: The write datagrams.
+        """
+        answered = 0
+        while True:
+            writes = [m for m in LinkMockLayer.sentMessages
+                      if m.data[0] == 0x20 and m.data[1] & 0xFC == 0]
+            if answered == len(writes):
+                return writes
+            request = writes[answered]
+            answered += 1
+            self.dService.process(Message(MTI.Datagram_Received_OK, node,
+                                          NodeID(12)))
+            address = int.from_bytes(request.data[2:6], "big")
+            command = request.data[1] | 0x10
+            if address == failAddress:
+                command |= 0x08
+            self.dService.process(
+                Message(MTI.Datagram, node, NodeID(12),
+                        bytearray([0x20, command]) + request.data[2:6]))
+
+    def testAdjacentWritesMerged(self):
+        first = self.write(10, [1])
+        second = self.write(11, range(8))
+        third = self.write(19, b"name\0")
+        self.assertEqual(len(LinkMockLayer.sentMessages), 0)  # held
+
+        self.buffer.commit()
+        writes = self.answerWrites()
+
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(writes[0].data,
+                         bytearray([0x20, 0x01, 0, 0, 0, 10, 1])
+                         + bytearray(range(8)) + bytearray(b"name\0"))
+        self.assertEqual(self.okMemos, [first, second, third])
+
+    def testOverlappingWriteWins(self):
+        self.write(0, [1, 1, 1, 1])
+        self.write(2, [2, 2, 2, 2])
+        self.write(20, [3])  # not adjacent, so a separate datagram
+        self.buffer.commit()
+        writes = self.answerWrites()
+
+        self.assertEqual([w.data[6:] for w in writes],
+                         [bytearray([1, 1, 2, 2, 2, 2]), bytearray([3])])
+        self.assertEqual(len(self.okMemos), 3)
+
+    def testLongRunSplitAndFailureFannedOut(self):
+        memos = [self.write(address, range(10))
+                 for address in range(0, 100, 10)]
+        self.buffer.commit()
+        writes = self.answerWrites(failAddress=64)
+
+        self.assertEqual([len(w.data) - 6 for w in writes], [64, 36])
+        # the write spanning both datagrams fails with the second one
+        self.assertEqual(self.okMemos, memos[:6])
+        self.assertEqual(self.rejectedMemos, memos[6:])
+
+    def testSpacesAndNodesKeptApart(self):
+        self.write(0, [1], space=0xFD)
+        self.write(1, [2], space=0xFE)
+        self.write(1, [3], node=NodeID(456))
+        self.buffer.commit(nodeID=NodeID(123))
+        self.assertEqual(len(self.answerWrites()), 2)
+        self.assertEqual(len(self.buffer.segments), 1)
+
+    def testIdleFlush(self):
+        now = [100.0]
+        self.buffer.clock = lambda: now[0]
+        self.write(0, [1])
+        now[0] += self.buffer.flushDelay / 2
+        self.write(1, [2])
+        now[0] += self.buffer.flushDelay / 2
+        self.buffer.checkTimeouts()
+        self.assertEqual(len(LinkMockLayer.sentMessages), 0)  # still busy
+        now[0] += self.buffer.flushDelay / 2
+        self.buffer.checkTimeouts()
+        self.assertEqual(len(self.answerWrites()), 1)
+        self.assertEqual(len(self.okMemos), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
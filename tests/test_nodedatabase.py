@@ -0,0 +1,166 @@
+import os
+import tempfile
+import unittest
+
+from openlcb.eventid import EventID
+from openlcb.message import Message
+from openlcb.mti import MTI
+from openlcb.node import Node
+from openlcb.nodedatabase import NodeDatabase
+from openlcb.nodeid import NodeID
+from openlcb.nodestore import NodeStore
+from openlcb.pip import PIP
+from openlcb.remotenodeprocessor import RemoteNodeProcessor
+from openlcb.remotenodestore import RemoteNodeStore
+from tests.mocklinks import RecordingLink
+
+SNIP_REPLY = bytearray(b"\x04Acme\x00Widget\x001\x002\x00\x02Yard\x00\x00")
+
+
+class TestNodeDatabaseClass(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".sqlite")
+        os.close(handle)
+        self.now = 1000.0
+        self.database = self.open()
+
+    def tearDown(self):
+        self.database.close()
+        os.remove(self.path)
+
+    def open(self):
+        database = NodeDatabase(self.path, aliases={NodeID(10): 0x123})
+        database.clock = lambda: self.now
+        return database
+
+    def session(self, database):
+        '''A store fed from a recording link, as a program would make.'''
+        link = RecordingLink(NodeID(1))
+        store = RemoteNodeStore(NodeID(1), database)
+        store.processors = [RemoteNodeProcessor(link)]
+        return store, link
+
+    def receive(self, store, mti, data=bytearray(), number=10):
+        destination = None if mti.isGlobal() else NodeID(1)
+        store.processMessageFromLinkLayer(Message(
+            mti, NodeID(number), destination, data))
+
+    def learn(self, store):
+        self.receive(store, MTI.Verified_NodeID, NodeID(10).toArray())
+        self.receive(store, MTI.Protocol_Support_Reply,
+                     bytearray([0x10, 0x10, 0x00, 0x00]))
+        self.receive(store, MTI.Simple_Node_Ident_Info_Reply, SNIP_REPLY)
+        self.receive(store, MTI.Producer_Identified_Active,
+                     EventID(0x0102030405060708).toArray())
+
+    def testWarmStartSkipsQueries(self):
+        store, link = self.session(self.database)
+        self.learn(store)
+        self.assertEqual(len(link.sent), 3)  # PIP, SNIP and events asked
+        self.database.close()
+
+        self.database = self.open()
+        store, link = self.session(self.database)
+        self.receive(store, MTI.Verified_NodeID, NodeID(10).toArray())
+        self.assertEqual(link.sent, [])
+        node = store.lookup(NodeID(10))
+        self.assertEqual(node.snip.modelName, "Widget")
+        self.assertEqual(node.snip.userProvidedNodeName, "Yard")
+        self.assertIn(PIP.MEMORY_CONFIGURATION_PROTOCOL, node.pipSet)
+        self.assertEqual(node.events.eventsProduced,
+                         {EventID(0x0102030405060708)})
+        self.assertEqual([n.id for n in store.query(manufacturerName="Acme")],
+                         [NodeID(10)])
+        self.assertEqual(self.database.lastSeen(NodeID(10)), (1000.0, 0x123))
+
+    def testInitializationCompleteInvalidates(self):
+        store, link = self.session(self.database)
+        self.learn(store)
+        self.database.flush()
+        self.receive(store, MTI.Initialization_Complete,
+                     NodeID(10).toArray())
+        # asked again, and not restored from the dropped row meanwhile
+        self.assertEqual(len(link.sent), 6)
+        self.database.flush()
+
+        other = self.open()
+        self.assertIsNone(other.lastSeen(NodeID(10)))
+        store, link = self.session(other)
+        self.receive(store, MTI.Verified_NodeID, NodeID(10).toArray())
+        self.assertEqual(len(link.sent), 3)
+        other.close()
+
+    def testNewNodeInitializingIsQueried(self):
+        store, link = self.session(self.database)
+        self.learn(store)
+        self.database.close()
+
+        self.database = self.open()
+        store, link = self.session(self.database)
+        self.receive(store, MTI.Initialization_Complete,
+                     NodeID(10).toArray())
+        self.assertEqual(len(link.sent), 3)
+        # the outdated row goes even if no replies come this session
+        self.database.flush()
+        other = self.open()
+        self.assertEqual(other.loadAll(NodeStore()), 0)
+        other.close()
+
+    def testSeenAgainOnlyUpdatesLastSeen(self):
+        store, link = self.session(self.database)
+        self.learn(store)
+        self.database.flush()
+        self.now = 2000.0
+        self.receive(store, MTI.Verified_NodeID, NodeID(10).toArray())
+        self.receive(store, MTI.Producer_Identified_Active,
+                     EventID(0x0102030405060708).toArray())  # known
+        self.assertEqual(self.database.dirty, {})
+        self.database.flush()
+        self.assertEqual(self.database.lastSeen(NodeID(10)), (2000.0, 0x123))
+        # a new event is a change
+        self.receive(store, MTI.Producer_Identified_Active,
+                     EventID(0x0102030405060709).toArray())
+        self.assertIn(NodeID(10), self.database.dirty)
+
+    def testDeletesWaitForFlush(self):
+        store, link = self.session(self.database)
+        self.learn(store)
+        self.database.flush()
+        self.receive(store, MTI.Initialization_Complete,
+                     NodeID(10).toArray())
+        other = self.open()
+        self.assertIsNotNone(other.lastSeen(NodeID(10)))  # not yet deleted
+        self.database.flush()
+        self.assertIsNone(other.lastSeen(NodeID(10)))
+        other.close()
+
+    def testBatchedWrites(self):
+        self.database.flushDelay = 5.0
+        store, link = self.session(self.database)
+        self.learn(store)
+        self.assertEqual(self.database.flushTime, 1005.0)
+        self.database.checkTimeouts(1004.0)
+        other = self.open()
+        self.assertIsNone(other.lastSeen(NodeID(10)))  # not written yet
+        self.database.checkTimeouts(1005.0)
+        self.assertEqual(other.lastSeen(NodeID(10)), (1000.0, 0x123))
+        self.assertIsNone(self.database.flushTime)
+        self.assertEqual(self.database.dirty, {})
+        other.close()
+
+    def testLoadAll(self):
+        store, link = self.session(self.database)
+        self.learn(store)
+        self.database.flush()
+
+        store = NodeStore()
+        store.store(Node(NodeID(11)))
+        self.assertEqual(self.database.loadAll(store), 1)
+        self.assertEqual(store.lookup(NodeID(10)).snip.modelName, "Widget")
+        self.assertEqual(self.database.loadAll(store), 0)
+        self.assertEqual(len(store.nodes), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,26 @@ import unittest
 
 from openlcb.nodestore import NodeStore
 
+from openlcb.eventid import EventID
+from openlcb.message import Message
+from openlcb.mti import MTI
 from openlcb.node import Node
 from openlcb.nodeid import NodeID
+from openlcb.pip import PIP
+from openlcb.processor import Processor
+from openlcb.remotenodeprocessor import RemoteNodeProcessor
+from openlcb.remotenodestore import RemoteNodeStore
+from openlcb.snip import SNIP
+
+
+class RecordingProcessor(Processor) :
+    '''Records the node each message is processed on'''
+    def __init__(self) :
+        self.seen = []
+
+    def process(self, message, node=None) :
+        self.seen.append(node.id)
+        return False
 
 
 class TestNodeStoreClass(unittest.TestCase):
@@ -30,6 +48,173 @@ class TestNodeStoreClass(unittest.TestCase):
         self.assertEqual(dut.asArray(), [node1, node2],
                          "as array")
 
+    def testNodesSortedByName(self) :
+        dut = NodeStore()
+        for number, name in ((1, "b"), (2, ""), (3, "c"), (4, "a")) :
+            node = Node(NodeID(number))
+            node.snip.userProvidedNodeName = name
+            dut.store(node)
+        self.assertEqual([node.name() for node in dut.nodes],
+                         ["", "a", "b", "c"])
+
+        # replacing a node doesn't duplicate it
+        replacement = Node(NodeID(3))
+        replacement.snip.userProvidedNodeName = "0"
+        dut.store(replacement)
+        self.assertEqual([node.name() for node in dut.nodes],
+                         ["", "0", "a", "b"])
+
+        # renaming is picked up once the node has been processed
+        node = dut.lookup(NodeID(2))
+        node.snip.userProvidedNodeName = "z"
+        dut.invokeProcessorsOnNodes(Message(
+            MTI.Simple_Node_Ident_Info_Reply, NodeID(2), NodeID(99)))
+        self.assertEqual([node.name() for node in dut.nodes],
+                         ["0", "a", "b", "z"])
+
+    def testAddSortedView(self) :
+        dut = NodeStore()
+        for number in (5, 3, 9) :
+            dut.store(Node(NodeID(number)))
+        view = dut.addSortedView(lambda node: -node.id.nodeId)
+        dut.store(Node(NodeID(7)))
+        self.assertEqual([node.id.nodeId for node in view], [9, 7, 5, 3])
+        self.assertEqual(len(view), 4)
+        self.assertEqual(view[0].id, NodeID(9))
+
+    def testLookupMissingDoesNotStore(self) :
+        dut = NodeStore()
+        self.assertIsNone(dut.lookup(NodeID(12)))
+        self.assertEqual(dut.byIdMap, {})
+        self.assertEqual(dut.asArray(), [])
+
+    def testQuery(self) :
+        dut = NodeStore()
+        dut.store(Node(NodeID(1), SNIP("Acme", "Box"),
+                       {PIP.MEMORY_CONFIGURATION_PROTOCOL}))
+        dut.store(Node(NodeID(2), SNIP("Acme", "Crate"),
+                       {PIP.MEMORY_CONFIGURATION_PROTOCOL,
+                        PIP.CONFIGURATION_DESCRIPTION_INFORMATION}))
+        dut.store(Node(NodeID(3), SNIP("Other", "Box")))
+
+        def ids(nodes) :
+            return [node.id.nodeId for node in nodes]
+
+        self.assertEqual(ids(dut.query(manufacturerName="Acme")), [1, 2])
+        self.assertEqual(ids(dut.query(
+            pip=PIP.MEMORY_CONFIGURATION_PROTOCOL, modelName="Box")), [1])
+        self.assertEqual(ids(dut.query(
+            pip=[PIP.MEMORY_CONFIGURATION_PROTOCOL,
+                 PIP.CONFIGURATION_DESCRIPTION_INFORMATION])), [2])
+        self.assertEqual(dut.query(manufacturerName="Nobody"), [])
+        self.assertEqual(ids(dut.query()), [1, 2, 3])
+        with self.assertRaises(KeyError) :
+            dut.query(color="red")
+
+        dut.addIndex("hardware", lambda node: (node.snip.hardwareVersion,))
+        self.assertEqual(ids(dut.query(hardware="")), [1, 2, 3])
+
+    def testIndexesFollowProcessedMessages(self) :
+        dut = RemoteNodeStore(NodeID(1))
+        dut.processors = [RemoteNodeProcessor()]
+        dut.store(Node(NodeID(5)))
+        event = EventID(0x0102030405060708)
+        dut.processMessageFromLinkLayer(Message(
+            MTI.Protocol_Support_Reply, NodeID(5), NodeID(1),
+            bytearray([0x10, 0, 0, 0, 0, 0])))
+        dut.processMessageFromLinkLayer(Message(
+            MTI.Producer_Identified_Active, NodeID(5), None,
+            event.toArray()))
+        self.assertEqual(
+            dut.query(pip=PIP.MEMORY_CONFIGURATION_PROTOCOL,
+                      produces=event), [dut.lookup(NodeID(5))])
+        self.assertEqual(dut.query(consumes=event), [])
+
+        # reinitializing clears PIP, and so the index
+        dut.processMessageFromLinkLayer(Message(
+            MTI.Initialization_Complete, NodeID(5), None,
+            NodeID(5).toArray()))
+        self.assertEqual(
+            dut.query(pip=PIP.MEMORY_CONFIGURATION_PROTOCOL), [])
+
+    def testOnlyChangeableIndexesRefreshed(self) :
+        dut = RemoteNodeStore(NodeID(1))
+        dut.processors = [RemoteNodeProcessor()]
+        node = Node(NodeID(5))
+        dut.store(node)
+        dut.addIndex("eventCount",
+                     lambda node: (len(node.events.eventsProduced),))
+        rebuilt = []  # an update compares all of a node's values
+        for index in dut.indexes.values() :
+            index.update = lambda node, update=index.update: \
+                rebuilt.append(node) or update(node)
+        event = EventID(0x0102030405060708)
+        dut.processMessageFromLinkLayer(Message(
+            MTI.Producer_Consumer_Event_Report, NodeID(5), None,
+            event.toArray()))
+        dut.processMessageFromLinkLayer(Message(
+            MTI.Verify_NodeID_Number_Global, NodeID(5), None))
+        self.assertEqual(dut.query(produces=event, eventCount=1), [node])
+        self.assertEqual(dut.indexes["produces"].valuesOf[node.id], {event})
+        # only the added index was updated whole, and only for the event
+        self.assertEqual(len(rebuilt), 1)
+
+    def testLookupByDescription(self) :
+        dut = NodeStore()
+        dut.store(Node(NodeID(1), SNIP(uDesc="yard")))
+        dut.store(Node(NodeID(2), SNIP(uDesc="main")))
+        self.assertEqual(dut.lookup("main").id, NodeID(2))
+        self.assertIsNone(dut.lookup("branch"))
+
+    def storeWithNodes(self) :
+        dut = NodeStore()
+        for number in range(1, 6) :
+            dut.store(Node(NodeID(number)))
+        processor = RecordingProcessor()
+        dut.processors = [processor]
+        return dut, processor
+
+    def testAddressedMessageRouted(self) :
+        dut, processor = self.storeWithNodes()
+        dut.invokeProcessorsOnNodes(Message(
+            MTI.Simple_Node_Ident_Info_Request, NodeID(2), NodeID(4)))
+        self.assertEqual(processor.seen, [NodeID(2), NodeID(4)])
+
+        processor.seen = []
+        dut.invokeProcessorsOnNodes(Message(
+            MTI.Simple_Node_Ident_Info_Request, NodeID(99), NodeID(3)))
+        self.assertEqual(processor.seen, [NodeID(3)])
+
+    def testGlobalMessageToAll(self) :
+        dut, processor = self.storeWithNodes()
+        dut.invokeProcessorsOnNodes(Message(
+            MTI.Verify_NodeID_Number_Global, NodeID(99), None))
+        self.assertEqual(len(processor.seen), 5)
+
+    def testGlobalMessageToSource(self) :
+        dut, processor = self.storeWithNodes()
+        dut.routeGlobalToSource = True
+        dut.invokeProcessorsOnNodes(Message(
+            MTI.Producer_Identified_Active, NodeID(3), None))
+        self.assertEqual(processor.seen, [NodeID(3)])
+
+        # link layer messages still reach every node, through fanOut
+        processor.seen = []
+        fannedOut = []
+        fanOut = dut.fanOut
+        dut.fanOut = lambda message: fannedOut.append(message.mti) \
+            or fanOut(message)
+        dut.invokeProcessorsOnNodes(Message(MTI.Link_Layer_Down, NodeID(0),
+                                            None))
+        self.assertEqual(len(processor.seen), 5)
+        self.assertEqual(fannedOut, [MTI.Link_Layer_Down])
+
+    def testFanOut(self) :
+        dut, processor = self.storeWithNodes()
+        dut.fanOut(Message(MTI.Simple_Node_Ident_Info_Request, NodeID(2),
+                           NodeID(4)))
+        self.assertEqual(len(processor.seen), 5)
+
 
 if __name__ == '__main__':
     unittest.main()
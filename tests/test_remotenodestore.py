@@ -1,7 +1,10 @@
 import unittest
 
+from openlcb.message import Message
+from openlcb.mti import MTI
 from openlcb.node import Node
 from openlcb.nodeid import NodeID
+from openlcb.processor import Processor
 from openlcb.remotenodestore import RemoteNodeStore
 
 
@@ -69,6 +72,32 @@ class TestRemoteNodeStoreClass(unittest.TestCase) :
         self.assertEqual(store.lookup(nid13), None,
                          "don't create if in local store")
 
+    def testMessagesOnlyProcessedOnTheirNodes(self) :
+        store = RemoteNodeStore(NodeID(1))
+        for number in range(100, 200) :
+            store.store(Node(NodeID(number)))
+        calls = []
+
+        class CountingProcessor(Processor) :
+            def process(self, message, node=None) :
+                calls.append((message.mti, node.id))
+                return False
+
+        store.processors = [CountingProcessor()]
+        store.processMessageFromLinkLayer(Message(
+            MTI.Producer_Consumer_Event_Report, NodeID(150), None,
+            bytearray(8)))
+        self.assertEqual(calls, [(MTI.Producer_Consumer_Event_Report,
+                                  NodeID(150))])
+
+        # a new node gets New_Node_Seen, then the message itself
+        calls.clear()
+        store.processMessageFromLinkLayer(Message(
+            MTI.Initialization_Complete, NodeID(300), None,
+            NodeID(300).toArray()))
+        self.assertEqual(calls, [(MTI.New_Node_Seen, NodeID(300)),
+                                 (MTI.Initialization_Complete, NodeID(300))])
+
     def testCustomStringConvertible(self) :
         # existence test, don't check content which can change
         store = RemoteNodeStore(NodeID(13))
@@ -0,0 +1,141 @@
+import os
+import select
+import time
+import unittest
+
+from openlcb.canbus.seriallink import SerialLink, serial
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = None  # not available on Windows
+
+
+class PtyPort:
+    '''Minimal stand-in for serial.Serial on one end of a pty pair'''
+    def __init__(self, fd):
+        self.fd = fd
+        self.writes = []
+        self.failure = None  # raised by read and write once set
+
+    @property
+    def in_waiting(self):
+        count = bytearray(4)
+        fcntl.ioctl(self.fd, termios.FIONREAD, count)
+        return int.from_bytes(count, "little")
+
+    def read(self, size=1):
+        if self.failure is not None:
+            raise self.failure
+        ready, _, _ = select.select([self.fd], [], [], 0.05)
+        if not ready:
+            return b''  # timed out like serial.Serial with a timeout
+        return os.read(self.fd, size)
+
+    def write(self, data):
+        if self.failure is not None:
+            raise self.failure
+        self.writes.append(bytes(data))
+        return os.write(self.fd, data)
+
+    def close(self):
+        os.close(self.fd)
+
+
+@unittest.skipIf(fcntl is None or not hasattr(os, "openpty"),
+                 "needs a pty pair")
+class TestSerialLinkClass(unittest.TestCase):
+
+    def setUp(self):
+        self.far, near = os.openpty()
+        # raw mode, so bytes pass through the pty unchanged
+        attrs = termios.tcgetattr(near)
+        attrs[3] &= ~(termios.ICANON | termios.ECHO)
+        attrs[1] &= ~termios.OPOST
+        termios.tcsetattr(near, termios.TCSANOW, attrs)
+        self.port = PtyPort(near)
+        self.link = SerialLink(self.port)
+
+    def tearDown(self):
+        self.link.close()
+        os.close(self.far)
+
+    def readFar(self, count):
+        data = b''
+        deadline = time.monotonic() + 2
+        while len(data) < count and time.monotonic() < deadline:
+            ready, _, _ = select.select([self.far], [], [], 0.1)
+            if ready:
+                data += os.read(self.far, count - len(data))
+        return data
+
+    def testReceiveDrainsInBulk(self):
+        os.write(self.far, b":X19490365N;\n:X19170365N0201;\n")
+        time.sleep(0.05)
+
+        self.assertEqual(self.link.receive(),
+                         ":X19490365N;\n:X19170365N0201;\n")
+
+    def testReaderQueuesCompleteFrames(self):
+        self.link.startReader(queueSize=8)
+
+        os.write(self.far, b":X19490365N;\n:X1917")
+        os.write(self.far, b"0365N0201;\n")
+
+        frames = b''
+        while frames.count(b";") < 2:
+            frames += self.link.receiveFrames(timeout=2)
+        self.assertEqual(frames, b":X19490365N;:X19170365N0201;")
+
+    def testWriterCoalesces(self):
+        self.link.startWriter(flushInterval=0.05)
+
+        self.link.send(":X19490365N;\n")
+        self.link.send(b":X19490366N;\n")
+
+        self.assertEqual(self.readFar(26),
+                         b":X19490365N;\n:X19490366N;\n")
+        self.assertEqual(len(self.port.writes), 1)
+
+    def waitForFailure(self):
+        deadline = time.monotonic() + 2
+        while self.link.failure is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def testSendRaisesAfterReaderFails(self):
+        self.link.startReader()
+        self.link.startWriter(flushInterval=0)
+        self.port.failure = OSError("device unplugged")
+        self.waitForFailure()
+        with self.assertRaises(RuntimeError):
+            self.link.send(":X19490365N;\n")
+        self.port.failure = None  # so close() can finish
+
+    def testSendRaisesAfterWriterFails(self):
+        self.link.startWriter(flushInterval=0)
+        self.port.failure = OSError("device unplugged")
+        self.link.send(":X19490365N;\n")
+        self.waitForFailure()
+        self.assertIsNone(self.link.writerThread)
+        with self.assertRaises(RuntimeError):
+            self.link.send(":X19490365N;\n")
+        self.port.failure = None
+
+    def testReceiveFramesBeforeStartReader(self):
+        self.assertEqual(self.link.receiveFrames(timeout=0.01), b'')
+
+    @unittest.skipIf(serial is None, "needs pyserial")
+    def testPySerialOnPty(self):
+        port = serial.Serial(os.ttyname(self.port.fd), timeout=0.05)
+        link = SerialLink(port)
+        link.startReader()
+        os.write(self.far, b":X19490365N;\n")
+
+        self.assertEqual(link.receiveFrames(timeout=2), b":X19490365N;")
+        link.stop()
+        port.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
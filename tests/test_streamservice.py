@@ -0,0 +1,149 @@
+import unittest
+
+from openlcb.mti import MTI
+from openlcb.nodeid import NodeID
+from openlcb.streamservice import (
+    ERROR_NOT_EXPECTED,
+    StreamReadMemo,
+    StreamService,
+    StreamWriteMemo,
+)
+from tests.mocklinks import LoopbackLink
+
+
+class TestStreamServiceClass(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = []
+        self.senderID = NodeID(12)
+        self.receiverID = NodeID(34)
+        self.sender = StreamService(LoopbackLink(self.senderID, self.queue),
+                                    bufferSize=16)
+        self.receiver = StreamService(
+            LoopbackLink(self.receiverID, self.queue), bufferSize=64)
+        self.sent = []  # MTIs of every message, in order
+        self.replies = []
+
+    def pump(self, lost=None):
+        while self.queue:
+            message = self.queue.pop(0)
+            if message.mti == lost:
+                continue
+            self.sent.append(message.mti)
+            self.sender.process(message)
+            self.receiver.process(message)
+
+    def testSendInWindows(self):
+        chunks = []
+        readMemo = StreamReadMemo(
+            self.senderID, lambda memo: self.replies.append("done"),
+            lambda memo: chunks.append(len(memo.data)))
+        self.receiver.expectStream(readMemo)
+        data = bytearray(range(40))
+        writeMemo = StreamWriteMemo(
+            self.receiverID, data, lambda memo: self.replies.append("ok"),
+            lambda memo: self.replies.append("rejected"),
+            readMemo.destStreamID)
+        self.sender.sendStream(writeMemo)
+        self.pump()
+
+        self.assertEqual(self.replies, ["ok", "done"])
+        self.assertEqual(readMemo.data, data)
+        self.assertEqual(writeMemo.bufferSize, 16)  # smaller offer wins
+        self.assertEqual(chunks, [16, 32, 40])
+        self.assertEqual(self.sent, [
+            MTI.Stream_Initiate_Request, MTI.Stream_Initiate_Reply,
+            MTI.Stream_Data_Send, MTI.Stream_Data_Proceed,
+            MTI.Stream_Data_Send, MTI.Stream_Data_Proceed,
+            MTI.Stream_Data_Send, MTI.Stream_Data_Complete])
+        self.assertEqual(self.sender.outgoing, {})
+        self.assertEqual(self.receiver.incoming, {})
+
+    def testEmptyStream(self):
+        readMemo = StreamReadMemo(self.senderID,
+                                  lambda memo: self.replies.append("done"))
+        self.receiver.expectStream(readMemo)
+        self.sender.sendStream(StreamWriteMemo(
+            self.receiverID, b"", lambda memo: self.replies.append("ok"),
+            lambda memo: self.replies.append("rejected"),
+            readMemo.destStreamID))
+        self.pump()
+        self.assertEqual(self.replies, ["ok", "done"])
+        self.assertEqual(readMemo.data, bytearray())
+
+    def testUnexpectedStreamRefused(self):
+        writeMemo = StreamWriteMemo(
+            self.receiverID, b"abc", lambda memo: self.replies.append("ok"),
+            lambda memo: self.replies.append("rejected"))
+        self.sender.sendStream(writeMemo)
+        self.pump()
+        self.assertEqual(self.replies, ["rejected"])
+        self.assertEqual(writeMemo.errorCode, ERROR_NOT_EXPECTED)
+        self.assertNotIn(MTI.Stream_Data_Send, self.sent)
+        self.assertEqual(self.sender.outgoing, {})
+
+    def testCancelledStreamRefused(self):
+        readMemo = StreamReadMemo(self.senderID,
+                                  lambda memo: self.replies.append("done"))
+        self.receiver.expectStream(readMemo)
+        self.receiver.cancelExpectedStream(readMemo)
+        self.sender.sendStream(StreamWriteMemo(
+            self.receiverID, b"abc", lambda memo: self.replies.append("ok"),
+            lambda memo: self.replies.append("rejected"),
+            readMemo.destStreamID))
+        self.pump()
+        self.assertEqual(self.replies, ["rejected"])
+
+    def testStalledStreamsTimeOut(self):
+        self.sender.clock = lambda: 0.0
+        self.receiver.clock = lambda: 0.0
+        readMemo = StreamReadMemo(
+            self.senderID, lambda memo: self.replies.append("done"),
+            failedReply=lambda memo: self.replies.append("failed"))
+        self.receiver.expectStream(readMemo)
+        writeMemo = StreamWriteMemo(
+            self.receiverID, bytearray(40),
+            lambda memo: self.replies.append("ok"),
+            lambda memo: self.replies.append("rejected"),
+            readMemo.destStreamID)
+        self.sender.sendStream(writeMemo)
+        self.pump(lost=MTI.Stream_Data_Proceed)
+        self.assertEqual(writeMemo.sent, 16)  # waiting for Proceed
+        self.sender.checkTimeouts(self.sender.timeout - 0.1)
+        self.assertEqual(self.replies, [])
+        self.sender.checkTimeouts(self.sender.timeout)
+        self.receiver.checkTimeouts(self.receiver.timeout)
+        self.assertEqual(self.replies, ["rejected", "failed"])
+        self.assertIsNone(writeMemo.errorCode)
+        self.assertEqual(self.sender.outgoing, {})
+        self.assertEqual(self.receiver.incoming, {})
+
+    def testExpectedStreamTimesOut(self):
+        self.receiver.clock = lambda: 0.0
+        readMemo = StreamReadMemo(
+            self.senderID, None,
+            failedReply=lambda memo: self.replies.append("failed"))
+        self.receiver.expectStream(readMemo)
+        self.receiver.checkTimeouts(self.receiver.timeout)
+        self.assertEqual(self.replies, ["failed"])
+        self.assertEqual(self.receiver.expected, {})
+
+    def testHeldStreamReleased(self):
+        writeMemo = StreamWriteMemo(self.receiverID, b"abc", None, None)
+        self.sender.holdStream(writeMemo)
+        self.assertIn((self.receiverID, writeMemo.sourceStreamID),
+                      self.sender.outgoing)
+        self.sender.checkTimeouts(1e9)  # not initiated, so not timed out
+        self.sender.releaseStream(writeMemo)
+        self.assertEqual(self.sender.outgoing, {})
+
+    def testStreamIDsDistinct(self):
+        first = StreamReadMemo(self.senderID, None)
+        second = StreamReadMemo(self.senderID, None)
+        self.receiver.expectStream(first)
+        self.receiver.expectStream(second)
+        self.assertNotEqual(first.destStreamID, second.destStreamID)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -245,6 +245,62 @@ class TestTcpLinkClass(unittest.TestCase):
         self.assertEqual(messageLayer.receivedMessages[0].source,
                          NodeID(0x321))
 
+    def testManyMessagesArbitraryClumps(self) :
+        messageLayer = MessageMockLayer()
+        linkLayer = TcpLink(NodeID(100))
+        linkLayer.registerMessageReceivedListener(messageLayer.receiveMessage)
+
+        capture = bytearray()
+        for n in range(500):
+            capture.extend([
+                0x80, 0x00,                      # full message
+                0x00, 0x00, 20,
+                0x00, 0x00, 0x00, 0x00, 0x01, 0x23,  # source node ID
+                0x00, 0x00, 0x11, 0x00, 0x00, 0x00,  # time
+                0x04, 0x90,                      # MTI: VerifyNode
+                0x00, 0x00, 0x00, 0x00, n >> 8, n & 0xFF  # source NodeID
+            ])
+        # clumps that don't line up with message boundaries
+        view = memoryview(capture)
+        for start in range(0, len(capture), 97):
+            linkLayer.receiveListener(view[start:start+97])
+
+        self.assertEqual(len(messageLayer.receivedMessages), 500)
+        self.assertEqual(messageLayer.receivedMessages[499].source,
+                         NodeID(499))
+        self.assertEqual(messageLayer.receivedMessages[499].data,
+                         bytearray())
+        # everything was consumed, so nothing is kept
+        self.assertEqual(len(linkLayer.accumulatedData), 0)
+        self.assertEqual(linkLayer.readOffset, 0)
+
+    def testReceiveAddressedMessage(self) :
+        messageLayer = MessageMockLayer()
+        linkLayer = TcpLink(NodeID(100))
+        linkLayer.registerMessageReceivedListener(messageLayer.receiveMessage)
+
+        messageText = bytearray([
+            0x80, 0x00,                      # full message
+            0x00, 0x00, 28,
+            0x00, 0x00, 0x00, 0x00, 0x01, 0x23,  # source node ID
+            0x00, 0x00, 0x11, 0x00, 0x00, 0x00,  # time
+            0x04, 0x88,                      # MTI: VerifyNode addressed
+            0x00, 0x00, 0x00, 0x00, 0x03, 0x21,  # source NodeID
+            0x00, 0x00, 0x00, 0x00, 0x04, 0x56,  # dest NodeID
+            0x01, 0x02,                      # data
+            0x80, 0x00,                      # start of the next message
+        ])
+        linkLayer.receiveListener(messageText)
+
+        self.assertEqual(len(messageLayer.receivedMessages), 1)
+        message = messageLayer.receivedMessages[0]
+        self.assertEqual(message.source, NodeID(0x321))
+        self.assertEqual(message.destination, NodeID(0x456))
+        self.assertEqual(message.data, bytearray([0x01, 0x02]))
+        # the partial message is kept for the next call
+        self.assertEqual(
+            len(linkLayer.accumulatedData) - linkLayer.readOffset, 2)
+
     def testSendGlobalMessage(self) :
         messageLayer = MessageMockLayer()
         tcpLayer = TcpMockLayer()